@@ -10,14 +10,12 @@ standard ComfyUI custom node pattern (same approach as comfyui-deploy).
 """
 
 import asyncio
-import hashlib
-import re
+import os
 import sys
-import time
 import uuid
-from dataclasses import dataclass, field
+from dataclasses import asdict, dataclass, field
 from pathlib import Path
-from typing import Dict, Optional
+from typing import Callable, Dict, Optional
 
 # Add extension root to sys.path so submodules (pipeline/, civitai_utils/)
 # can be imported. The old `utils/` was renamed to `civitai_utils/` to avoid
@@ -30,7 +28,6 @@ if _EXT_ROOT not in sys.path:
 import threading
 
 from aiohttp import web
-import requests
 import server
 
 import folder_paths
@@ -38,8 +35,26 @@ import folder_paths
 from pipeline.fetch_metadata import parse_image_id, extract_metadata, enrich_metadata
 from pipeline.resolve_models import resolve_resource
 from pipeline.generate_workflow import build_workflow
+from civitai_utils.bandwidth import shaper_from_env
+from civitai_utils.catalog import ModelCatalog
 from civitai_utils.civitai_api import CivitaiAPI
-from civitai_utils.model_manager import ModelManager
+from civitai_utils.content_store import ContentStore
+from civitai_utils.disk_space import InsufficientSpaceError, Reservation, space_ledger
+from civitai_utils.download_manager import (
+    MAX_ACTIVE, MAX_PER_HOST, PRIORITIES, PRIORITY_BATCH, PRIORITY_INTERACTIVE,
+    DownloadManager,
+)
+from civitai_utils.download_engine import download, part_path, unallocated_bytes
+from civitai_utils.hash_index import HashIndex
+from civitai_utils.library_index import ModelLibraryIndex
+from civitai_utils.library_watcher import LibraryWatcher
+from civitai_utils.model_manager import (
+    ModelManager, content_store_enabled, prune_content_store,
+)
+from civitai_utils.model_quota import ModelQuota, quota_bytes_from_env
+from civitai_utils.prewarm import Prewarmer, paths_for_resources, prewarm_rate_from_env
+from civitai_utils.resolution_cache import ResolutionCache
+from civitai_utils.storage_tiers import move_model, tiers_from_env
 
 
 # Civitai type -> folder_paths folder name
@@ -62,23 +77,39 @@ class FolderPathsModelAdapter:
     # Reuse TYPE_MAPPING from ModelManager for compatibility with resolve_resource
     TYPE_MAPPING = ModelManager.TYPE_MAPPING
 
-    def get_model_dir(self, model_type: str):
+    def get_model_dir(self, model_type: str, size_bytes: int = 0,
+                      filename: Optional[str] = None):
         """
-        Get the primary directory for a model type.
+        Get the directory new files of a model type are downloaded to.
 
         Returns a Path object. Uses the first path from folder_paths
-        for the mapped folder name.
+        for the mapped folder name, or, with storage tiering enabled
+        (CIVITAI_FAST_STORAGE), the root the tier policy picks for the
+        type and size (a root with a resumable .part of filename first).
         """
         folder_name = FOLDER_PATHS_TYPE_MAPPING.get(model_type)
         if folder_name:
             try:
                 paths = folder_paths.get_folder_paths(folder_name)
+                if paths and _storage_tiers is not None and len(paths) > 1:
+                    return _storage_tiers.choose_root(model_type, paths, size_bytes,
+                                                      filename)
                 if paths:
                     return Path(paths[0])
             except Exception:
                 pass
         return Path(f"models/{ModelManager.TYPE_MAPPING.get(model_type, model_type)}")
 
+    def library_generation(self, model_type: str) -> int:
+        """Get the change counter of a model type's folders."""
+        return _library_index.generation(_folder_roots(model_type))
+
+    def notify_library_changed(self, model_type: str):
+        """Record that files of a model type were added or removed."""
+        for root in _folder_roots(model_type):
+            _library_index.invalidate(root)
+            _get_hash_index().invalidate(root)
+
     def find_model(self, filename: str, model_type: str):
         """
         Check if a model file exists using folder_paths.
@@ -97,9 +128,206 @@ class FolderPathsModelAdapter:
         full_path = folder_paths.get_full_path(folder_name, filename)
         if full_path:
             return Path(full_path)
+        # Not at the top level of any root: check subfolders via the index
+        return _library_index.find(filename, _folder_roots(model_type))
+
+    def find_model_by_hash(self, hashes: dict, model_type: str,
+                           size_kb: Optional[float] = None):
+        """
+        Find a model file by content hash across all folder_paths roots.
+
+        Args:
+            hashes: Civitai "hashes" dict of the model file (SHA256, AutoV2, ...)
+            model_type: Model type (checkpoint, lora, vae, etc.)
+            size_kb: Expected file size in KB (limits which files get hashed)
+
+        Returns:
+            Path if found, None otherwise
+        """
+        return _get_hash_index().find(hashes, _folder_roots(model_type),
+                                      size_kb=size_kb)
+
+    def record_usage(self, resources: list):
+        """Mark the local files of resolved resources as used now."""
+        _get_quota().record_use(
+            r["target_path"] for r in resources
+            if r.get("already_downloaded") and r.get("target_path")
+        )
+
+    def make_room(self, needed_bytes: int, protect=(), reserve_for=None) -> list:
+        """
+        Evict least recently used models until needed_bytes fit in the
+        CIVITAI_MODELS_QUOTA_GB quota (no-op without a quota).
+
+        Downloads in flight and leftover .part files count against the
+        quota; the targets of every running download task are protected.
+        With reserve_for (a download's target path), the bytes stay held
+        for it until _get_quota().release(reserve_for).
+
+        Raises:
+            ValueError: If the file does not fit even after evicting every
+                        unpinned LoRA and checkpoint
+        """
+        quota = _get_quota()
+        if quota.quota_bytes is None:
+            return []
+        protect = [*protect, *(r.get("target_path") for task in list(_active_downloads.values())
+                               for r in task.resources)]
+        roots = {root for t in FOLDER_PATHS_TYPE_MAPPING for root in _folder_roots(t)}
+        parts = _library_index.scan([r for r in roots if _in_models_dir(r)], (".part",))
+        evict, fits = quota.plan_eviction(_quota_inventory(), needed_bytes, protect,
+                                          parts, reserve_for)
+        if not fits:
+            raise ValueError(
+                f"Model quota exceeded: {needed_bytes / (1024 ** 3):.2f} GB does not fit "
+                f"in {quota.quota_bytes / (1024 ** 3):.2f} GB"
+            )
+        if evict:
+            quota.evict(evict)
+            for root in {r.root for r in evict}:
+                _library_index.invalidate(root)
+                _get_hash_index().invalidate(root)
+            store = _get_content_store()
+            if store is not None:
+                roots = {root for t in FOLDER_PATHS_TYPE_MAPPING for root in _folder_roots(t)}
+                prune_content_store(store, _get_hash_index(),
+                                    [Path(r) for r in roots if os.path.isdir(r)])
+        return evict
+
+
+def _folder_roots(model_type: str) -> list:
+    """All folder_paths roots of a model type (incl. extra_model_paths.yaml)."""
+    folder_name = FOLDER_PATHS_TYPE_MAPPING.get(model_type)
+    if not folder_name:
+        return []
+    try:
+        return list(folder_paths.get_folder_paths(folder_name))
+    except Exception:
+        return []
+
+
+# Filename index over all model folders, kept current by _library_watcher
+_library_index = ModelLibraryIndex()
+
+_hash_index: Optional[HashIndex] = None
+
+
+def _get_hash_index() -> HashIndex:
+    """Shared content-hash index over the ComfyUI model folders."""
+    global _hash_index
+    if _hash_index is None:
+        _hash_index = HashIndex(
+            Path(folder_paths.models_dir) / ModelManager.STATE_DIR_NAME / "hash_index.db"
+        )
+    return _hash_index
+
+
+_quota: Optional[ModelQuota] = None
+
+
+def _get_quota() -> ModelQuota:
+    """Shared usage tracking and quota state of the ComfyUI model folders."""
+    global _quota
+    if _quota is None:
+        _quota = ModelQuota(
+            Path(folder_paths.models_dir) / ModelManager.STATE_DIR_NAME / "usage.db",
+            quota_bytes=quota_bytes_from_env(),
+        )
+    return _quota
+
+
+def _inventory() -> list:
+    """(model type, ModelRecord) for every model file in all folder_paths roots."""
+    return [
+        (model_type, record)
+        for model_type in FOLDER_PATHS_TYPE_MAPPING
+        for record in _library_index.scan(_folder_roots(model_type),
+                                          ModelManager.MODEL_EXTENSIONS)
+    ]
+
+
+def _quota_inventory() -> list:
+    """
+    _inventory() limited to ComfyUI's models directory.
+
+    Folders added via extra_model_paths.yaml are often shared or network
+    libraries: they count for nothing in the quota and are never evicted.
+    """
+    managed: Dict[str, bool] = {}
+    inventory = []
+    for model_type, record in _inventory():
+        if record.root not in managed:
+            managed[record.root] = _in_models_dir(record.root)
+        if managed[record.root]:
+            inventory.append((model_type, record))
+    return inventory
+
+
+def _in_models_dir(path) -> bool:
+    """True if path lies in ComfyUI's models directory (the quota's scope)."""
+    return Path(path).resolve().is_relative_to(Path(folder_paths.models_dir).resolve())
+
+
+def _get_content_store() -> Optional[ContentStore]:
+    """Content-addressed model store, if enabled via CIVITAI_CONTENT_STORE."""
+    if not content_store_enabled():
+        return None
+    return ContentStore(
+        Path(folder_paths.models_dir) / ModelManager.STATE_DIR_NAME / "store"
+    )
+
+
+def _open_catalog() -> Optional[ModelCatalog]:
+    """Open the offline model catalog named by CIVITAI_CATALOG, if any."""
+    catalog_path = os.environ.get("CIVITAI_CATALOG")
+    if not catalog_path:
+        return None
+    try:
+        return ModelCatalog(catalog_path)
+    except Exception as e:
+        print(f"[Civitai Alchemist] Warning: Failed to open catalog {catalog_path}: {e}")
+        return None
+
+
+def _start_library_watcher() -> Optional[LibraryWatcher]:
+    """
+    Watch all model folders so library lookups are instant and fresh.
+
+    CIVITAI_LIBRARY_WATCH selects the mode: auto (default), inotify, poll
+    or off.
+    """
+    mode = os.environ.get("CIVITAI_LIBRARY_WATCH", "auto").lower()
+    if mode == "off":
+        return None
+    roots = {root for model_type in FOLDER_PATHS_TYPE_MAPPING
+             for root in _folder_roots(model_type)}
+    try:
+        watcher = LibraryWatcher(
+            _library_index, sorted(roots), mode=mode,
+            on_change=lambda root: _get_hash_index().invalidate(root),
+        )
+        watcher.start()
+        return watcher
+    except Exception as e:
+        print(f"[Civitai Alchemist] Warning: Failed to watch model folders: {e}")
         return None
 
 
+_library_watcher = _start_library_watcher()
+
+# Fast/bulk placement policy for multi-root model folders (None = first root)
+_storage_tiers = tiers_from_env()
+
+# Page-cache prefetch of generated workflows' models (None = disabled)
+_prewarm_rate = prewarm_rate_from_env()
+_prewarmer = Prewarmer(_prewarm_rate) if _prewarm_rate else None
+
+# Offline catalog shared by all resolve requests (None when not configured)
+_catalog = _open_catalog()
+
+# Resolved resources shared by all resolve requests
+_resolution_cache = ResolutionCache()
+
 routes = server.PromptServer.instance.routes
 
 
@@ -215,6 +443,21 @@ async def handle_resolve_models(request):
             "unresolved_count": 0,
         })
 
+    # API calls and hashing same-size local files can take minutes: keep
+    # them off the event loop
+    resolved, unresolved = await asyncio.to_thread(
+        _resolve_resources_sync, resources, api_key)
+
+    all_resources = resolved + unresolved
+    return web.json_response({
+        "resources": all_resources,
+        "resolved_count": len(resolved),
+        "unresolved_count": len(unresolved),
+    })
+
+
+def _resolve_resources_sync(resources: list, api_key: str) -> tuple:
+    """Resolve metadata resources; returns (resolved, unresolved) lists."""
     api = CivitaiAPI(api_key=api_key)
     adapter = FolderPathsModelAdapter()
 
@@ -223,7 +466,8 @@ async def handle_resolve_models(request):
 
     for r in resources:
         try:
-            result = resolve_resource(r, api, adapter)
+            result = resolve_resource(r, api, adapter, catalog=_catalog,
+                                      cache=_resolution_cache)
             if result.get("resolved"):
                 resolved.append(result)
             else:
@@ -231,20 +475,219 @@ async def handle_resolve_models(request):
         except Exception as e:
             r_copy = {**r, "resolved": False, "error": str(e)}
             unresolved.append(r_copy)
+    return resolved, unresolved
 
-    all_resources = resolved + unresolved
-    return web.json_response({
-        "resources": all_resources,
-        "resolved_count": len(resolved),
-        "unresolved_count": len(unresolved),
-    })
+
+@routes.get("/civitai/models")
+async def handle_list_models(request):
+    """
+    GET /civitai/models?type=lora
+
+    Lists local model files across all folder_paths roots (all types if
+    no type is given), served from the cached library index.
+    Returns: { "models": [{ type, name, relative_path, size, mtime, root, pinned }], "count": N }
+    """
+    model_type = request.query.get("type")
+    if model_type and model_type not in FOLDER_PATHS_TYPE_MAPPING:
+        return web.json_response(
+            {"error": f"Unknown model type: {model_type}"},
+            status=400,
+        )
+
+    types = [model_type] if model_type else list(FOLDER_PATHS_TYPE_MAPPING)
+    pinned = await asyncio.to_thread(_get_quota().pinned)
+    models = []
+    for t in types:
+        records = await asyncio.to_thread(
+            _library_index.scan, _folder_roots(t), ModelManager.MODEL_EXTENSIONS
+        )
+        models.extend({"type": t, **asdict(r), "pinned": str(r.path) in pinned}
+                      for r in records)
+
+    return web.json_response({"models": models, "count": len(models)})
+
+
+@routes.post("/civitai/pin")
+async def handle_pin_model(request):
+    """
+    POST /civitai/pin
+
+    Pins a local model file so quota eviction never removes it, or unpins it.
+    Accepts: { "type": "checkpoint", "filename": "...", "pinned": true }
+    Returns: { "path": "...", "pinned": true }
+    """
+    try:
+        data = await request.json()
+    except Exception:
+        return web.json_response(
+            {"error": "Invalid JSON in request body"},
+            status=400,
+        )
+
+    model_type = data.get("type", "")
+    filename = data.get("filename", "")
+    if not filename or model_type not in FOLDER_PATHS_TYPE_MAPPING:
+        return web.json_response(
+            {"error": "type and filename are required"},
+            status=400,
+        )
+
+    path = await asyncio.to_thread(FolderPathsModelAdapter().find_model, filename, model_type)
+    if path is None:
+        return web.json_response(
+            {"error": f"Model not found: {filename}"},
+            status=404,
+        )
+
+    pinned = bool(data.get("pinned", True))
+    await asyncio.to_thread(_get_quota().set_pinned, path, pinned)
+    return web.json_response({"path": str(path), "pinned": pinned})
+
+
+def _rebalance_tiers_sync(dry_run: bool) -> list:
+    """Promote hot and demote cold model files between storage tiers."""
+    quota = _get_quota()
+    roots_by_type = {t: _folder_roots(t) for t in FOLDER_PATHS_TYPE_MAPPING}
+    moves = _storage_tiers.plan_moves(_inventory(), roots_by_type,
+                                      quota.usage(), quota.pinned())
+    results = []
+    changed_roots = set()
+    for move in moves:
+        entry = {
+            "type": move.model_type,
+            "from": str(move.record.path),
+            "to": str(move.dest_path),
+            "reason": move.reason,
+            "moved": False,
+        }
+        if not dry_run:
+            reservation = None
+            try:
+                reservation = space_ledger.reserve(move.dest_path.parent, move.record.size)
+                move_model(move.record.path, move.dest_path)
+                quota.rename(move.record.path, move.dest_path)
+                entry["moved"] = True
+                changed_roots.update((move.record.root, move.dest_root))
+            except (OSError, InsufficientSpaceError) as e:
+                entry["error"] = str(e)
+            finally:
+                space_ledger.release(reservation)
+        results.append(entry)
+
+    for root in changed_roots:
+        _library_index.invalidate(root)
+        _get_hash_index().invalidate(root)
+    return results
+
+
+@routes.post("/civitai/tiers/rebalance")
+async def handle_rebalance_tiers(request):
+    """
+    POST /civitai/tiers/rebalance
+
+    Moves frequently used models to the fast storage tier and long-unused
+    ones to bulk storage (requires CIVITAI_FAST_STORAGE).
+    Accepts: { "dry_run": true }
+    Returns: { "moves": [{ type, from, to, reason, moved, error? }] }
+    """
+    try:
+        data = await request.json()
+    except Exception:
+        data = {}
+
+    if _storage_tiers is None:
+        return web.json_response(
+            {"error": "Storage tiering is not enabled (set CIVITAI_FAST_STORAGE)"},
+            status=400,
+        )
+
+    moves = await asyncio.to_thread(_rebalance_tiers_sync, bool(data.get("dry_run", False)))
+    return web.json_response({"moves": moves})
+
+
+def _folder_type(model_type: str) -> Optional[str]:
+    """Map a Civitai or internal model type to a FOLDER_PATHS_TYPE_MAPPING key."""
+    if model_type in FOLDER_PATHS_TYPE_MAPPING:
+        return model_type
+    dir_name = ModelManager.TYPE_MAPPING.get(model_type)
+    for key, folder_name in FOLDER_PATHS_TYPE_MAPPING.items():
+        if folder_name == dir_name:
+            return key
+    return None
+
+
+def _local_status_sync(items: list) -> list:
+    """
+    Answer local-status queries from the library and hash indexes.
+
+    Only already-indexed hashes are consulted; no file is hashed here, so
+    the answer comes from memory and one indexed query per hash.
+    """
+    results = []
+    for item in items:
+        filename = item.get("filename") or ""
+        sha256 = item.get("sha256") or ""
+        folder_type = _folder_type(item.get("type", ""))
+        roots = _folder_roots(folder_type) if folder_type else []
+
+        path, match = None, None
+        if filename and roots:
+            path = _library_index.find(filename, roots)
+            match = "filename" if path else None
+        if path is None and sha256 and roots:
+            matches = _get_hash_index().lookup(sha256, roots)
+            if matches:
+                path, match = matches[0], "hash"
+
+        results.append({
+            "type": item.get("type"),
+            "filename": filename,
+            "sha256": sha256,
+            "exists": path is not None,
+            "path": str(path) if path else None,
+            "match": match,
+        })
+    return results
+
+
+@routes.post("/civitai/local-status")
+async def handle_local_status(request):
+    """
+    POST /civitai/local-status
+
+    Checks in bulk which model files are already present in any
+    folder_paths root (including extra_model_paths.yaml), by filename
+    first and by SHA256 second.
+    Accepts: { "items": [{ "type": "lora", "filename": "...", "sha256": "..." }] }
+    Returns: { "items": [{ type, filename, sha256, exists, path, match }] }
+    """
+    try:
+        data = await request.json()
+    except Exception:
+        return web.json_response(
+            {"error": "Invalid JSON in request body"},
+            status=400,
+        )
+
+    items = data.get("items")
+    if not isinstance(items, list) or not all(isinstance(i, dict) for i in items):
+        return web.json_response(
+            {"error": "items must be a list of objects"},
+            status=400,
+        )
+
+    results = await asyncio.to_thread(_local_status_sync, items)
+    return web.json_response({"items": results})
 
 
 # ── Download infrastructure ──────────────────────────────────────────
 
 
-DOWNLOAD_CHUNK_SIZE = 64 * 1024  # 64 KB
 PROGRESS_INTERVAL = 0.5  # seconds between WebSocket progress updates
+BATCH_CONCURRENCY = 3  # default files downloaded at once by /civitai/download-all
+# More would only wait in the download manager: every file of a batch comes
+# from Civitai, so its per-host limit applies on top of the overall one
+MAX_BATCH_CONCURRENCY = min(MAX_ACTIVE, MAX_PER_HOST)
 
 
 @dataclass
@@ -275,15 +718,87 @@ def _send_progress(task_id: str, filename: str, status: str,
     })
 
 
-def _download_single_sync(resource: dict, api_key: str, task_id: str,
-                          cancel_event: threading.Event) -> bool:
+# Bandwidth limits (CIVITAI_DOWNLOAD_MBPS, /civitai/bandwidth)
+_bandwidth = shaper_from_env()
+
+# Queue, concurrency limits and deduplication shared by all download tasks
+_download_manager = DownloadManager(
+    lambda task_id, filename, status, fields: _send_progress(task_id, filename, status, **fields),
+    shaper=_bandwidth,
+)
+
+
+def _download_single_sync(resource: dict, api_key: str, report: Callable,
+                          cancel_event: threading.Event,
+                          reservation: Optional[Reservation] = None,
+                          throttle: Optional[Callable] = None,
+                          target_dir: Optional[Path] = None) -> bool:
     """
     Download a single model file synchronously using requests.
 
-    Designed to run inside asyncio.to_thread(). Sends progress updates
-    via WebSocket (thread-safe via PromptServer.send_sync).
+    Designed to run as a DownloadManager transfer, inside
+    asyncio.to_thread(). Progress goes to report(filename, status,
+    **fields), which fans it out to every subscribed task.
+
+    Disk space for the file is reserved before the request is made, unless
+    a reservation admitted up front (batch downloads) is passed in; it is
+    released when the download ends, whatever the outcome. target_dir is
+    the directory chosen for it then (see _download_dir()). throttle(n),
+    if given, is called with every received chunk to limit bandwidth.
+    Returns True on success, False on failure/cancel.
+    """
+    if target_dir is None:
+        target_dir = _download_dir(resource)
+    if reservation is None:
+        size_bytes = _space_needed(resource, target_dir)
+        if size_bytes:
+            filename = resource.get("filename", "model.safetensors")
+            try:
+                reservation = _reserve_space(target_dir, size_bytes, report,
+                                             filename, cancel_event)
+            except InsufficientSpaceError as e:
+                report(filename, "failed", error=str(e))
+                return False
+            if reservation is None:
+                report(filename, "cancelled")
+                return False
+    try:
+        return _transfer_single_sync(resource, api_key, report, cancel_event,
+                                     target_dir, reservation, throttle)
+    finally:
+        space_ledger.release(reservation)
+
+
+def _reserve_space(directory: Path, size: int, report: Callable, filename: str,
+                   cancel_event: threading.Event) -> Optional[Reservation]:
+    """
+    Reserve disk space for a download.
+
+    If the space is only held by other in-flight downloads, reports
+    "waiting" and queues until they finish. Returns None if cancelled
+    while queued; raises InsufficientSpaceError if it can never fit.
+    """
+    try:
+        return space_ledger.reserve(directory, size)
+    except InsufficientSpaceError as e:
+        if not e.retryable:
+            raise
+    report(filename, "waiting")
+    return space_ledger.reserve(directory, size, wait=True, cancel_event=cancel_event)
+
+
+def _transfer_single_sync(resource: dict, api_key: str, report: Callable,
+                          cancel_event: threading.Event, target_dir: Path,
+                          reservation: Optional[Reservation],
+                          throttle: Optional[Callable] = None) -> bool:
+    """
+    Transfer one model file into place (see _download_single_sync).
 
-    Writes to a .part temp file, verifies SHA256, then renames.
+    The download engine writes a .part temp file, retries transient
+    failures, verifies SHA256 and renames; this adds the content store,
+    model-directory quota, disk-space ledger and library bookkeeping.
+    Ranged downloads keep the .part file and its sidecar when cancelled
+    or failed and continue from them on the next attempt.
     Returns True on success, False on failure/cancel.
     """
     adapter = FolderPathsModelAdapter()
@@ -292,147 +807,151 @@ def _download_single_sync(resource: dict, api_key: str, task_id: str,
     download_url = resource.get("download_url", "")
 
     if not download_url:
-        _send_progress(task_id, filename, "failed", error="No download URL")
+        report(filename, "failed", error="No download URL")
         return False
 
-    # Determine target directory
-    target_dir = adapter.get_model_dir(model_type)
     target_dir.mkdir(parents=True, exist_ok=True)
     target_path = target_dir / filename
-    part_path = target_dir / f"{filename}.part"
+
+    # Already in the content store: link instead of downloading
+    expected_hash = _get_expected_hash(resource)
+    store = _get_content_store()
+    if expected_hash and store is not None:
+        try:
+            if store.place(expected_hash, target_path):
+                adapter.notify_library_changed(model_type)
+                size = target_path.stat().st_size
+                report(filename, "completed", progress=100,
+                       downloaded_bytes=size, total_bytes=size)
+                return True
+        except OSError as e:
+            print(f"[Civitai Alchemist] Warning: Linking {filename} from the store failed: {e}")
 
     # Civitai download URL needs API key as query parameter
     separator = "&" if "?" in download_url else "?"
     auth_url = f"{download_url}{separator}token={api_key}"
 
-    try:
-        resp = requests.get(auth_url, stream=True,
-                            timeout=(60, None), allow_redirects=True)
-
-        if resp.status_code != 200:
-            error_msg = _download_error_message_sync(resp)
-            _send_progress(task_id, filename, "failed", error=error_msg)
-            return False
+    late_reservation = None
+    quota_path = None
+
+    def prepare(path: Path, total_bytes: int, needed_bytes: int):
+        nonlocal reservation, late_reservation, quota_path
+        if total_bytes and _in_models_dir(target_dir):
+            # Held against the quota until the download ends
+            adapter.make_room(total_bytes, protect=[path], reserve_for=path)
+            quota_path = path
+        if reservation is not None and not needed_bytes:
+            # Resuming a .part that already holds the whole file
+            space_ledger.release(reservation)
+        elif reservation is None and needed_bytes:
+            # Size unknown until now: admit before writing anything
+            reservation = late_reservation = space_ledger.reserve(target_dir, needed_bytes)
+
+    def on_allocated():
+        # The preallocated .part now shows in the free space itself:
+        # holding the reservation too would count the file twice
+        space_ledger.release(reservation)
+
+    def on_event(name: str, status: str, **fields):
+        nonlocal filename
+        filename = name
+        if status == "downloading" and reservation is not None:
+            space_ledger.update(reservation, fields["downloaded_bytes"])
+        report(name, status, **fields)
 
-        # Check Content-Disposition for actual filename
-        content_disp = resp.headers.get("Content-Disposition", "")
-        if "filename=" in content_disp:
-            match = re.search(r'filename="?([^";\n]+)"?', content_disp)
-            if match:
-                actual_filename = match.group(1).strip()
-                filename = actual_filename
-                target_path = target_dir / filename
-                part_path = target_dir / f"{filename}.part"
-
-        total_bytes = int(resp.headers.get("Content-Length", 0))
-        downloaded_bytes = 0
-        last_progress_time = 0.0
-        sha256_hash = hashlib.sha256()
-
-        cancelled = False
-        with open(part_path, "wb") as f:
-            for chunk in resp.iter_content(chunk_size=DOWNLOAD_CHUNK_SIZE):
-                if cancel_event.is_set():
-                    cancelled = True
-                    break
-
-                if chunk:
-                    f.write(chunk)
-                    sha256_hash.update(chunk)
-                    downloaded_bytes += len(chunk)
-
-                    # Throttle progress updates (inside with block)
-                    now = time.monotonic()
-                    if now - last_progress_time >= PROGRESS_INTERVAL:
-                        last_progress_time = now
-                        progress = int(downloaded_bytes * 100 / total_bytes) if total_bytes else 0
-                        _send_progress(task_id, filename, "downloading",
-                                       progress=progress,
-                                       downloaded_bytes=downloaded_bytes,
-                                       total_bytes=total_bytes)
-
-        # File handle is now closed; safe to delete on Windows
-        if cancelled:
-            _cleanup_part(part_path)
-            _send_progress(task_id, filename, "cancelled")
+    try:
+        result = download(
+            auth_url, target_dir, filename, expected_sha256=expected_hash,
+            on_event=on_event, cancel_event=cancel_event, throttle=throttle,
+            prepare=prepare, on_allocated=on_allocated, resume_key=download_url,
+            progress_interval=PROGRESS_INTERVAL,
+        )
+        if result is None:
+            report(filename, "cancelled")
             return False
-
-        # Final 100% progress
-        _send_progress(task_id, filename, "downloading",
-                       progress=100,
-                       downloaded_bytes=downloaded_bytes,
-                       total_bytes=total_bytes)
-
-        # SHA256 verification
-        _send_progress(task_id, filename, "verifying",
-                       downloaded_bytes=downloaded_bytes,
-                       total_bytes=total_bytes)
-
-        expected_hash = _get_expected_hash(resource)
-        if expected_hash:
-            actual_hash = sha256_hash.hexdigest().upper()
-            if actual_hash != expected_hash.upper():
-                _cleanup_part(part_path)
-                _send_progress(task_id, filename, "failed",
-                               error="Checksum mismatch")
-                return False
-
-        # Rename .part to final filename
-        if target_path.exists():
-            target_path.unlink()
-        part_path.rename(target_path)
-
-        _send_progress(task_id, filename, "completed",
-                       progress=100,
-                       downloaded_bytes=downloaded_bytes,
-                       total_bytes=total_bytes)
+        if store is not None:
+            store.add(result.path, result.sha256)
+        adapter.notify_library_changed(model_type)
+
+        report(filename, "completed",
+               progress=100,
+               downloaded_bytes=result.size,
+               total_bytes=result.size)
         return True
 
     except Exception as e:
-        _cleanup_part(part_path)
-        _send_progress(task_id, filename, "failed", error=str(e))
+        report(filename, "failed", error=str(e))
         return False
+    finally:
+        space_ledger.release(late_reservation)
+        if quota_path is not None:
+            _get_quota().release(quota_path)
 
 
 async def _download_single(resource: dict, api_key: str, task_id: str,
-                           cancel_event: asyncio.Event) -> bool:
+                           priority: int = PRIORITY_BATCH,
+                           reservation: Optional[Reservation] = None,
+                           target_dir: Optional[Path] = None) -> bool:
     """
-    Download a single model file.
+    Download a single model file through the shared download manager.
 
-    Bridges the async interface to _download_single_sync() running in a
-    thread pool via asyncio.to_thread(), keeping the event loop free.
+    The transfer runs _download_single_sync() in a worker thread, keeping
+    the event loop free. If an identical request from another task is
+    already queued or in flight, this task attaches to it instead (and a
+    reservation made for this request is released).
     """
-    # Bridge asyncio.Event -> threading.Event for the sync worker
-    thread_cancel = threading.Event()
-
-    async def _monitor_cancel():
-        await cancel_event.wait()
-        thread_cancel.set()
+    def work(emit, cancel_event: threading.Event, throttle) -> bool:
+        return _download_single_sync(resource, api_key, emit, cancel_event,
+                                     reservation, throttle, target_dir)
+
+    future, attached = _download_manager.submit(
+        task_id, _download_keys(resource), work,
+        filename=resource.get("filename", "unknown"),
+        url=resource.get("download_url", ""),
+        priority=priority, size=_resource_size(resource),
+    )
+    if attached:
+        space_ledger.release(reservation)
+    # Other tasks may share the transfer: never cancel it from here
+    return await asyncio.shield(future)
+
+
+def _download_keys(resource: dict) -> list:
+    """Identities under which identical download requests share a transfer."""
+    keys = []
+    if resource.get("model_version_id"):
+        keys.append(f"version:{resource['model_version_id']}")
+    expected_hash = _get_expected_hash(resource)
+    if expected_hash:
+        keys.append(f"sha256:{expected_hash.upper()}")
+    if resource.get("download_url"):
+        keys.append(f"url:{resource['download_url']}")
+    return keys
+
+
+def _resource_size(resource: dict) -> int:
+    """Expected file size of a resource in bytes (0 if unknown)."""
+    return int((resource.get("size_kb") or 0) * 1024)
+
+
+def _download_dir(resource: dict) -> Path:
+    """
+    Directory a resource is downloaded into.
 
-    monitor_task = asyncio.create_task(_monitor_cancel())
-    try:
-        return await asyncio.to_thread(
-            _download_single_sync, resource, api_key, task_id, thread_cancel
-        )
-    except asyncio.CancelledError:
-        thread_cancel.set()
-        _cleanup_part_for_resource(resource)
-        return False
-    finally:
-        monitor_task.cancel()
-        try:
-            await monitor_task
-        except asyncio.CancelledError:
-            pass
+    Chosen once per download, and passed on to the disk-space reservation,
+    the transfer and its retries, so they all use the same volume. With
+    storage tiers, a root holding a resumable .part of the file wins, and
+    room on the others is counted net of other downloads' reservations.
+    """
+    return FolderPathsModelAdapter().get_model_dir(
+        resource.get("type", "checkpoint"), _resource_size(resource),
+        resource.get("filename", "model.safetensors"))
 
 
-def _cleanup_part_for_resource(resource: dict):
-    """Best-effort cleanup of .part file for a resource."""
-    adapter = FolderPathsModelAdapter()
-    model_type = resource.get("type", "checkpoint")
+def _space_needed(resource: dict, target_dir: Path) -> int:
+    """Disk space a resource's download into target_dir still needs (0 if unknown)."""
     filename = resource.get("filename", "model.safetensors")
-    target_dir = adapter.get_model_dir(model_type)
-    _cleanup_part(target_dir / f"{filename}.part")
+    return unallocated_bytes(part_path(target_dir / filename), _resource_size(resource))
 
 
 def _get_expected_hash(resource: dict) -> Optional[str]:
@@ -443,63 +962,88 @@ def _get_expected_hash(resource: dict) -> Optional[str]:
     return None
 
 
-def _cleanup_part(part_path: Path):
-    """Delete .part file if it exists."""
-    try:
-        if part_path.exists():
-            part_path.unlink()
-    except OSError:
-        pass
-
-
-def _download_error_message_sync(resp: requests.Response) -> str:
-    """Build a user-friendly error message from a failed download response."""
-    status = resp.status_code
-
-    if status == 401:
-        # Civitai returns JSON with a "message" field for auth errors.
-        # Common cause: model is in Early Access (paid download period).
-        try:
-            body = resp.json()
-            api_msg = body.get("message", "")
-        except Exception:
-            api_msg = ""
-
-        if "logged in" in api_msg.lower() or "early access" in api_msg.lower():
-            return (
-                "This model requires Early Access purchase on Civitai. "
-                "API keys cannot bypass this restriction."
-            )
-        return f"HTTP 401 — Unauthorized ({api_msg or 'check your API key'})"
-
-    if status == 404:
-        return "HTTP 404 — Model file not found on Civitai"
-
-    return f"HTTP {status}"
-
-
 async def _run_single_download(resource: dict, api_key: str, task_id: str,
-                               cancel_event: asyncio.Event):
+                               priority: int = PRIORITY_INTERACTIVE):
     """Coroutine wrapper for single download task."""
     try:
-        await _download_single(resource, api_key, task_id, cancel_event)
+        await _download_single(resource, api_key, task_id, priority)
     finally:
         _active_downloads.pop(task_id, None)
+        _bandwidth.forget_task(task_id)
+
+
+def _admit_batch(resources: list, task_id: str) -> list:
+    """
+    Reserve disk space for a whole batch before anything is downloaded.
+
+    Returns (resource, target directory, reservation) triples for the
+    resources to download, smallest first (unknown sizes last) so small files are ready early.
+    Resources that can never fit on their filesystem are reported as
+    failed right away; those only blocked by other in-flight downloads
+    are reported as waiting, placed after everything that was admitted,
+    and reserve again (queued) when their turn comes.
+    """
+    by_size = sorted(resources, key=lambda r: (_resource_size(r) == 0, _resource_size(r)))
+    ordered = []
+    for resource in by_size:
+        target_dir = _download_dir(resource)
+        ordered.append((resource, target_dir, _space_needed(resource, target_dir)))
+    results = space_ledger.admit((target_dir, size) for _, target_dir, size in ordered)
+
+    admitted, waiting = [], []
+    for (resource, target_dir, size), result in zip(ordered, results):
+        filename = resource.get("filename", "unknown")
+        if not isinstance(result, InsufficientSpaceError):
+            # Unknown sizes are reserved from Content-Length instead;
+            # fully preallocated resumable .part files need nothing
+            admitted.append((resource, target_dir, result if size else None))
+            if not size:
+                space_ledger.release(result)
+        elif result.retryable:
+            _send_progress(task_id, filename, "waiting")
+            waiting.append((resource, target_dir, None))
+        else:
+            _send_progress(task_id, filename, "failed", error=str(result))
+    return admitted + waiting
 
 
 async def _run_batch_download(resources: list, api_key: str, task_id: str,
-                              cancel_event: asyncio.Event):
-    """Coroutine wrapper for batch download: downloads resources sequentially."""
-    try:
-        for resource in resources:
+                              cancel_event: asyncio.Event,
+                              concurrency: int = BATCH_CONCURRENCY,
+                              priority: int = PRIORITY_BATCH):
+    """
+    Coroutine wrapper for batch download.
+
+    Submits up to `concurrency` resources at once to the download manager,
+    in the order _admit_batch returns (smallest first). Files still queued
+    here when the task is cancelled are reported as cancelled without
+    starting.
+    """
+    semaphore = asyncio.Semaphore(max(1, concurrency))
+    unsubmitted = []
+
+    async def _download_when_ready(resource: dict, target_dir: Path,
+                                   reservation: Optional[Reservation]):
+        async with semaphore:
+            unsubmitted.remove(reservation)
             if cancel_event.is_set():
-                # Send cancelled for remaining resources
-                filename = resource.get("filename", "unknown")
-                _send_progress(task_id, filename, "cancelled")
-                continue
-            await _download_single(resource, api_key, task_id, cancel_event)
+                space_ledger.release(reservation)
+                _send_progress(task_id, resource.get("filename", "unknown"), "cancelled")
+                return False
+            # From here the transfer owns (or releases) the reservation
+            return await _download_single(resource, api_key, task_id, priority,
+                                          reservation, target_dir)
+
+    try:
+        admitted = await asyncio.to_thread(_admit_batch, resources, task_id)
+        unsubmitted.extend(reservation for _, _, reservation in admitted)
+        await asyncio.gather(*(_download_when_ready(resource, target_dir, reservation)
+                               for resource, target_dir, reservation in admitted))
     finally:
+        for reservation in unsubmitted:
+            space_ledger.release(reservation)
         _active_downloads.pop(task_id, None)
+        _bandwidth.forget_task(task_id)
 
 
 @routes.post("/civitai/download")
@@ -507,8 +1051,10 @@ async def handle_download(request):
     """
     POST /civitai/download
 
-    Accepts: { "resource": {...}, "api_key": "sk_..." }
-    Starts a background download for a single model.
+    Accepts: { "resource": {...}, "api_key": "sk_...", "priority": "interactive" }
+    Starts a background download for a single model. priority is
+    "interactive" (default), "batch" or "background"; a model already
+    being downloaded by another task is shared rather than fetched twice.
     Returns: { "task_id": "uuid" }
     """
     try:
@@ -523,13 +1069,16 @@ async def handle_download(request):
         return web.json_response({"error": "resource is required"}, status=400)
     if not api_key:
         return web.json_response({"error": "API key is required"}, status=401)
+    priority = PRIORITIES.get(data.get("priority", "interactive"))
+    if priority is None:
+        return web.json_response({"error": "Unknown priority"}, status=400)
 
     task_id = str(uuid.uuid4())
     cancel_event = asyncio.Event()
     task = DownloadTask(task_id=task_id, cancel_event=cancel_event,
                         resources=[resource])
 
-    coro = _run_single_download(resource, api_key, task_id, cancel_event)
+    coro = _run_single_download(resource, api_key, task_id, priority)
     task.asyncio_task = asyncio.create_task(coro)
     _active_downloads[task_id] = task
 
@@ -541,8 +1090,12 @@ async def handle_download_all(request):
     """
     POST /civitai/download-all
 
-    Accepts: { "resources": [...], "api_key": "sk_..." }
-    Starts background sequential download for multiple models.
+    Accepts: { "resources": [...], "api_key": "sk_...", "concurrency": 3,
+               "priority": "batch" }
+    Starts a background download of multiple models, `concurrency` files
+    at a time (default 3, capped at MAX_BATCH_CONCURRENCY, i.e.
+    min(MAX_ACTIVE, MAX_PER_HOST) = 3), smallest files first, at "batch"
+    (default), "interactive" or "background" priority.
     Returns: { "task_id": "uuid" }
     """
     try:
@@ -557,13 +1110,22 @@ async def handle_download_all(request):
         return web.json_response({"error": "resources list is required"}, status=400)
     if not api_key:
         return web.json_response({"error": "API key is required"}, status=401)
+    try:
+        concurrency = int(data.get("concurrency", BATCH_CONCURRENCY))
+    except (TypeError, ValueError):
+        return web.json_response({"error": "concurrency must be an integer"}, status=400)
+    concurrency = min(max(concurrency, 1), MAX_BATCH_CONCURRENCY)
+    priority = PRIORITIES.get(data.get("priority", "batch"))
+    if priority is None:
+        return web.json_response({"error": "Unknown priority"}, status=400)
 
     task_id = str(uuid.uuid4())
     cancel_event = asyncio.Event()
     task = DownloadTask(task_id=task_id, cancel_event=cancel_event,
                         resources=resources)
 
-    coro = _run_batch_download(resources, api_key, task_id, cancel_event)
+    coro = _run_batch_download(resources, api_key, task_id, cancel_event,
+                               concurrency, priority)
     task.asyncio_task = asyncio.create_task(coro)
     _active_downloads[task_id] = task
 
@@ -577,6 +1139,7 @@ async def handle_download_cancel(request):
 
     Accepts: { "task_id": "uuid" } or { "cancel_all": true }
     Signals cancellation; the download loop will stop on the next chunk.
+    Transfers shared with other tasks keep running for those tasks.
     """
     try:
         data = await request.json()
@@ -589,6 +1152,7 @@ async def handle_download_cancel(request):
     if cancel_all:
         for dt in list(_active_downloads.values()):
             dt.cancel_event.set()
+            _download_manager.cancel(dt.task_id)
         return web.json_response({"cancelled": True})
 
     if not task_id:
@@ -597,11 +1161,57 @@ async def handle_download_cancel(request):
     dt = _active_downloads.get(task_id)
     if dt:
         dt.cancel_event.set()
+        _download_manager.cancel(task_id)
         return web.json_response({"cancelled": True})
 
     return web.json_response({"error": "Task not found"}, status=404)
 
 
+@routes.post("/civitai/bandwidth")
+async def handle_bandwidth(request):
+    """
+    POST /civitai/bandwidth
+
+    Accepts: { "global_mbps": 50, "per_task_mbps": 0, "per_host_mbps": 0,
+               "task_id": "uuid", "task_mbps": 10 }  (all optional)
+    Changes download bandwidth limits at runtime, for running downloads
+    too; 0 means unlimited. task_mbps overrides the limit of one task
+    (null restores the per-task default). An empty body changes nothing.
+    Returns: { "global_mbps": ..., "per_task_mbps": ..., "per_host_mbps": ...,
+               "tasks": { "uuid": mbps } }
+    """
+    try:
+        data = await request.json()
+    except Exception:
+        data = {}
+
+    rates = {}
+    for key in ("global_mbps", "per_task_mbps", "per_host_mbps", "task_mbps"):
+        value = data.get(key)
+        if value is None:
+            rates[key] = None
+            continue
+        try:
+            rates[key] = max(float(value), 0) * 1024 * 1024
+        except (TypeError, ValueError):
+            return web.json_response({"error": f"{key} must be a number"}, status=400)
+
+    _bandwidth.configure(global_rate=rates["global_mbps"],
+                         task_rate=rates["per_task_mbps"],
+                         host_rate=rates["per_host_mbps"])
+    if data.get("task_id"):
+        _bandwidth.set_task_rate(data["task_id"], rates["task_mbps"])
+
+    limits = _bandwidth.limits()
+    mb = 1024 * 1024
+    return web.json_response({
+        "global_mbps": limits["global"] / mb,
+        "per_task_mbps": limits["per_task"] / mb,
+        "per_host_mbps": limits["per_host"] / mb,
+        "tasks": {task_id: rate / mb for task_id, rate in limits["tasks"].items()},
+    })
+
+
 # ── Workflow generation ──────────────────────────────────────────────
 
 
@@ -664,6 +1274,16 @@ async def handle_generate_workflow(request):
             status=500,
         )
 
+    try:
+        await asyncio.to_thread(FolderPathsModelAdapter().record_usage,
+                                resources_dict.get("resources", []))
+    except Exception as e:
+        print(f"[Civitai Alchemist] Warning: Failed to record model usage: {e}")
+
+    # Load the models into the page cache while the user reviews the workflow
+    if _prewarmer is not None:
+        _prewarmer.request(paths_for_resources(resources_dict.get("resources", [])))
+
     # Determine workflow type
     workflow_type = metadata.get("workflow_type", "txt2img")
 
@@ -0,0 +1,203 @@
+"""
+Bandwidth Shaping
+
+Token-bucket rate limits for downloads, so a multi-GB checkpoint does not
+starve the rest of the machine's traffic (API submissions, output sync).
+Limits apply at three levels, all adjustable at runtime (0 = unlimited):
+
+- global: all downloads of the process together,
+- per task: all transfers of one download task (e.g. a batch),
+- per host: all transfers from one download host.
+
+Each transfer gets a Throttle that it calls with every chunk it receives;
+the call sleeps until every bucket involved has the bytes to spare.
+While interactive transfers run, background transfers yield their share
+of the bandwidth down to a trickle (BACKGROUND_MIN_RATE between them), so
+their connections keep moving instead of idling into a server timeout.
+"""
+
+import os
+import threading
+import time
+from typing import Dict, List, Optional
+
+from civitai_utils.download_manager import PRIORITY_BACKGROUND, PRIORITY_INTERACTIVE
+
+# Bytes per second all background transfers together keep receiving while
+# interactive ones run
+BACKGROUND_MIN_RATE = 256 * 1024
+
+
+class TokenBucket:
+    """Thread-safe token bucket; rate in bytes per second, 0 = unlimited."""
+
+    def __init__(self, rate: float = 0):
+        self.rate = rate
+        self._tokens = float(rate)
+        self._stamp = time.monotonic()
+        self._lock = threading.Lock()
+
+    def set_rate(self, rate: float):
+        with self._lock:
+            self.rate = rate
+            self._tokens = min(self._tokens, float(rate))
+
+    def consume(self, n: int) -> float:
+        """
+        Take n bytes from the bucket.
+
+        Returns:
+            Seconds to wait before the bytes are within the rate (the
+            bucket goes into debt, so concurrent callers queue up fairly)
+        """
+        with self._lock:
+            if self.rate <= 0:
+                return 0.0
+            now = time.monotonic()
+            # Bursts of up to one second's worth
+            self._tokens = min(float(self.rate),
+                               self._tokens + (now - self._stamp) * self.rate)
+            self._stamp = now
+            self._tokens -= n
+            return -self._tokens / self.rate if self._tokens < 0 else 0.0
+
+
+class Throttle:
+    """Paces one transfer against its global, task and host buckets."""
+
+    def __init__(self, shaper: "BandwidthShaper", buckets: List[TokenBucket],
+                 priority: int, cancel_event: Optional[threading.Event] = None,
+                 yield_bucket: Optional[TokenBucket] = None):
+        self._shaper = shaper
+        self._buckets = buckets
+        self._yield_bucket = yield_bucket
+        self.priority = priority
+        self._cancel_event = cancel_event or threading.Event()
+        self._closed = False
+
+    def __call__(self, n: int):
+        """Account for n received bytes, sleeping as the limits require."""
+        buckets = self._buckets
+        if self._yield_bucket is not None and self._shaper.interactive_active():
+            buckets = buckets + [self._yield_bucket]
+        delay = max(bucket.consume(n) for bucket in buckets)
+        if delay > 0:
+            self._cancel_event.wait(delay)
+
+    def close(self):
+        """End the transfer (idempotent)."""
+        if not self._closed:
+            self._closed = True
+            self._shaper._closed(self)
+
+
+class BandwidthShaper:
+    """
+    Global, per-task and per-host download rate limits.
+    """
+
+    def __init__(self, global_rate: float = 0, task_rate: float = 0,
+                 host_rate: float = 0):
+        """
+        Args:
+            global_rate: Bytes per second for all downloads (0 = unlimited)
+            task_rate: Default bytes per second per task
+            host_rate: Bytes per second per download host
+        """
+        self.task_rate = task_rate
+        self.host_rate = host_rate
+        self._global = TokenBucket(global_rate)
+        self._tasks: Dict[str, TokenBucket] = {}
+        self._task_overrides: Dict[str, float] = {}
+        self._hosts: Dict[str, TokenBucket] = {}
+        self._background = TokenBucket(BACKGROUND_MIN_RATE)
+        self._interactive = 0
+        self._lock = threading.Lock()
+
+    def open(self, task_id: str, host: str, priority: int,
+             cancel_event: Optional[threading.Event] = None) -> Throttle:
+        """
+        Start pacing a transfer.
+
+        Args:
+            task_id: Task the transfer belongs to
+            host: Download host
+            priority: PRIORITY_* of the transfer
+            cancel_event: Cuts waits short when set
+        """
+        with self._lock:
+            task = self._tasks.get(task_id)
+            if task is None:
+                task = self._tasks[task_id] = TokenBucket(
+                    self._task_overrides.get(task_id, self.task_rate))
+            bucket = self._hosts.get(host)
+            if bucket is None:
+                bucket = self._hosts[host] = TokenBucket(self.host_rate)
+            if priority == PRIORITY_INTERACTIVE:
+                self._interactive += 1
+        return Throttle(self, [self._global, task, bucket], priority, cancel_event,
+                        self._background if priority == PRIORITY_BACKGROUND else None)
+
+    def configure(self, global_rate: Optional[float] = None,
+                  task_rate: Optional[float] = None,
+                  host_rate: Optional[float] = None):
+        """Change limits (None leaves one unchanged); applies to running transfers."""
+        with self._lock:
+            if global_rate is not None:
+                self._global.set_rate(global_rate)
+            if task_rate is not None:
+                self.task_rate = task_rate
+                for task_id, bucket in self._tasks.items():
+                    if task_id not in self._task_overrides:
+                        bucket.set_rate(task_rate)
+            if host_rate is not None:
+                self.host_rate = host_rate
+                for bucket in self._hosts.values():
+                    bucket.set_rate(host_rate)
+
+    def set_task_rate(self, task_id: str, rate: Optional[float]):
+        """Override the limit of one task (None restores the default)."""
+        with self._lock:
+            if rate is None:
+                self._task_overrides.pop(task_id, None)
+                rate = self.task_rate
+            else:
+                self._task_overrides[task_id] = rate
+            bucket = self._tasks.get(task_id)
+            if bucket is not None:
+                bucket.set_rate(rate)
+
+    def forget_task(self, task_id: str):
+        """Drop the bucket and override of a finished task."""
+        with self._lock:
+            self._tasks.pop(task_id, None)
+            self._task_overrides.pop(task_id, None)
+
+    def interactive_active(self) -> bool:
+        """True while any interactive transfer is running."""
+        return self._interactive > 0
+
+    def limits(self) -> Dict:
+        """Current limits in bytes per second (0 = unlimited)."""
+        with self._lock:
+            return {
+                "global": self._global.rate,
+                "per_task": self.task_rate,
+                "per_host": self.host_rate,
+                "tasks": dict(self._task_overrides),
+            }
+
+    def _closed(self, throttle: Throttle):
+        if throttle.priority == PRIORITY_INTERACTIVE:
+            with self._lock:
+                self._interactive -= 1
+
+
+def shaper_from_env() -> BandwidthShaper:
+    """BandwidthShaper with the global limit from CIVITAI_DOWNLOAD_MBPS (MB/s)."""
+    value = os.environ.get("CIVITAI_DOWNLOAD_MBPS", "").strip()
+    try:
+        rate = max(float(value), 0) * 1024 * 1024 if value else 0
+    except ValueError:
+        rate = 0
+    return BandwidthShaper(global_rate=rate)
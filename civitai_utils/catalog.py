@@ -0,0 +1,246 @@
+"""
+Model Version Catalog
+
+Local SQLite catalog of Civitai model versions, imported from a bulk JSONL
+dump. Lets resources be resolved by version ID, file hash or name without
+any network access (useful on machines with restricted egress).
+
+Each JSONL line is one model version as returned by the Civitai
+/model-versions endpoint (id, modelId, type, files, hashes, downloadUrl, ...).
+"""
+
+import json
+import sqlite3
+import threading
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Union
+
+
+# Shortest model name matched inside a longer query (shorter ones would
+# match almost any resource name)
+_MIN_REVERSE_MATCH = 3
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS versions (
+    version_id  INTEGER PRIMARY KEY,
+    model_id    INTEGER,
+    model_name  TEXT,
+    model_type  TEXT,
+    data        TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS hashes (
+    hash        TEXT NOT NULL,
+    hash_type   TEXT NOT NULL,
+    version_id  INTEGER NOT NULL,
+    PRIMARY KEY (hash, version_id)
+);
+CREATE INDEX IF NOT EXISTS idx_hashes_version ON hashes (version_id);
+"""
+
+
+class ModelCatalog:
+    """
+    SQLite-backed catalog of Civitai model versions.
+
+    Lookup methods mirror the corresponding CivitaiAPI methods and return
+    version dicts in the same shape, so resolve_resource can use either.
+    """
+
+    def __init__(self, db_path: Union[str, Path]):
+        """
+        Open (or create) a catalog database.
+
+        Args:
+            db_path: Path to the SQLite catalog file
+        """
+        self.db_path = Path(db_path)
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        # Route handlers and download threads may share one instance
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(self.db_path), check_same_thread=False)
+        self._conn.executescript(_SCHEMA)
+
+    def close(self):
+        """Close the underlying database connection."""
+        with self._lock:
+            self._conn.close()
+
+    def import_jsonl(self, jsonl_path: Union[str, Path]) -> int:
+        """
+        Import model versions from a JSONL dump.
+
+        Existing versions with the same ID are replaced, so re-importing a
+        newer dump updates the catalog in place.
+
+        Args:
+            jsonl_path: Path to the JSONL file (one model version per line)
+
+        Returns:
+            Number of versions imported
+        """
+        with open(jsonl_path, "r", encoding="utf-8") as f:
+            return self.import_versions(
+                json.loads(line) for line in f if line.strip()
+            )
+
+    def import_versions(self, versions: Iterable[Dict]) -> int:
+        """
+        Import model version dicts into the catalog in a single transaction.
+
+        Args:
+            versions: Iterable of model version dicts
+
+        Returns:
+            Number of versions imported
+        """
+        count = 0
+        with self._lock, self._conn:
+            for raw in versions:
+                version = _normalize_version(raw)
+                version_id = version.get("id")
+                if not version_id:
+                    continue
+                model = version.get("model", {})
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO versions "
+                    "(version_id, model_id, model_name, model_type, data) "
+                    "VALUES (?, ?, ?, ?, ?)",
+                    (version_id, version.get("modelId"), model.get("name"),
+                     model.get("type"), json.dumps(version, ensure_ascii=False)),
+                )
+                self._conn.execute(
+                    "DELETE FROM hashes WHERE version_id = ?", (version_id,)
+                )
+                self._conn.executemany(
+                    "INSERT OR IGNORE INTO hashes (hash, hash_type, version_id) "
+                    "VALUES (?, ?, ?)",
+                    [(value.upper(), hash_type, version_id)
+                     for hash_type, value in _iter_hashes(version)],
+                )
+                count += 1
+        return count
+
+    def get_model_version(self, version_id: int) -> Optional[Dict]:
+        """
+        Get a model version by version ID.
+
+        Args:
+            version_id: Model version ID
+
+        Returns:
+            Model version data dictionary, or None if not in the catalog
+        """
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT data FROM versions WHERE version_id = ?", (int(version_id),)
+            ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def get_model_version_by_hash(self, file_hash: str) -> Optional[Dict]:
+        """
+        Look up a model version by any file hash Civitai publishes
+        (SHA256, AutoV1, AutoV2, CRC32, BLAKE3).
+
+        Args:
+            file_hash: Hash string (case-insensitive)
+
+        Returns:
+            Model version data dictionary, or None if not in the catalog
+        """
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT v.data FROM hashes h "
+                "JOIN versions v ON v.version_id = h.version_id "
+                "WHERE h.hash = ? LIMIT 1",
+                (file_hash.upper(),),
+            ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def search_models(self, query: str, limit: int = 5) -> List[Dict]:
+        """
+        Search catalog models by name (case-insensitive substring match).
+
+        Matches models whose name contains the query, then models whose
+        name is contained in it, longest name first (a resource named
+        "Foo v2 by bar" finds model "Foo"). Results use the /models
+        response shape: one dict per model with its catalogued versions
+        under "modelVersions", newest version first.
+
+        Args:
+            query: Search query
+            limit: Max models to return
+
+        Returns:
+            List of model data dictionaries
+        """
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT model_id, model_name, model_type, data FROM versions "
+                "WHERE model_name LIKE ?1 ESCAPE '\\' "
+                "OR (length(model_name) >= ?3 AND instr(?2, lower(model_name)) > 0) "
+                "ORDER BY model_name LIKE ?1 ESCAPE '\\' DESC, "
+                "CASE WHEN model_name LIKE ?1 ESCAPE '\\' THEN 0 "
+                "ELSE length(model_name) END DESC, model_id, version_id DESC",
+                (f"%{_escape_like(query)}%", query.lower(), _MIN_REVERSE_MATCH),
+            ).fetchall()
+
+        models: Dict[int, Dict] = {}
+        for model_id, model_name, model_type, data in rows:
+            model = models.get(model_id)
+            if model is None:
+                if len(models) >= limit:
+                    continue
+                model = models[model_id] = {
+                    "id": model_id,
+                    "name": model_name,
+                    "type": model_type,
+                    "modelVersions": [],
+                }
+            model["modelVersions"].append(json.loads(data))
+        return list(models.values())
+
+    def count(self) -> int:
+        """Return the number of model versions in the catalog."""
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM versions").fetchone()[0]
+
+
+def _normalize_version(raw: Dict) -> Dict:
+    """
+    Fill in fields that bulk dumps sometimes keep only at the top level,
+    so catalog entries look like regular /model-versions responses.
+    """
+    version = dict(raw)
+    model = dict(version.get("model") or {})
+    if not model.get("type") and version.get("type"):
+        model["type"] = version["type"]
+    if not model.get("name"):
+        model["name"] = version.get("modelName")
+    if not model.get("id") and version.get("modelId"):
+        model["id"] = version["modelId"]
+    version["model"] = model
+
+    files = [dict(f) for f in version.get("files") or []]
+    primary = next((f for f in files if f.get("primary")), files[0] if files else None)
+    if primary is not None:
+        if not primary.get("downloadUrl") and version.get("downloadUrl"):
+            primary["downloadUrl"] = version["downloadUrl"]
+        if not primary.get("hashes") and version.get("hashes"):
+            primary["hashes"] = version["hashes"]
+    version["files"] = files
+    return version
+
+
+def _iter_hashes(version: Dict):
+    """Yield (hash_type, value) pairs for every hash attached to a version."""
+    sources = [version.get("hashes")] + [f.get("hashes") for f in version["files"]]
+    for hashes in sources:
+        if isinstance(hashes, dict):
+            for hash_type, value in hashes.items():
+                if value:
+                    yield hash_type, str(value)
+
+
+def _escape_like(text: str) -> str:
+    """Escape LIKE wildcards in a user-supplied search string."""
+    return text.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
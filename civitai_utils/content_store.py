@@ -0,0 +1,177 @@
+"""
+Content-Addressed Model Store
+
+Optional store that keeps each model body once, under its SHA256, in
+<models_dir>/.civitai_alchemist/store. Files in the type folders become
+links to the stored object: reflinks on copy-on-write filesystems (btrfs,
+XFS, ...), hardlinks elsewhere. Identical checkpoints saved under
+different names or folders then take disk space (and page cache) once,
+and downloading an already-stored hash completes by linking.
+
+Objects can only be linked within one filesystem; model folders on other
+devices simply fall back to normal downloads.
+"""
+
+import errno
+import os
+import sys
+from pathlib import Path
+from typing import Iterable, Optional, Tuple, Union
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+# ioctl(dest_fd, FICLONE, src_fd) from linux/fs.h
+_FICLONE = 0x40049409
+
+# Errors meaning "cannot link here" rather than a real failure
+_UNSUPPORTED = {errno.EXDEV, errno.EPERM, errno.EOPNOTSUPP, errno.ENOTTY,
+                errno.EINVAL, errno.EMLINK, errno.ENOSYS}
+
+
+class ContentStore:
+    """
+    SHA256-addressed object store linked into the model folders.
+    """
+
+    def __init__(self, root: Union[str, Path]):
+        """
+        Args:
+            root: Store directory (created on first write)
+        """
+        self.root = Path(root)
+
+    def path_for(self, sha256: str) -> Path:
+        """Object path of a SHA256 (fanned out by its first two digits)."""
+        sha256 = sha256.upper()
+        return self.root / sha256[:2] / sha256
+
+    def contains(self, sha256: str) -> bool:
+        """True if an object with this SHA256 is stored."""
+        return bool(sha256) and self.path_for(sha256).is_file()
+
+    def place(self, sha256: str, target: Union[str, Path]) -> Optional[str]:
+        """
+        Materialize a stored object at target (replacing any existing file).
+
+        Args:
+            sha256: SHA256 of the wanted file
+            target: Destination path in a model folder
+
+        Returns:
+            "reflink" or "hardlink", or None if the object is not stored or
+            cannot be linked to target's filesystem
+        """
+        if not self.contains(sha256):
+            return None
+        target = Path(target)
+        target.parent.mkdir(parents=True, exist_ok=True)
+        return _link(self.path_for(sha256), target)
+
+    def add(self, path: Union[str, Path], sha256: str) -> Optional[str]:
+        """
+        Ingest a verified file into the store.
+
+        If the hash is new, the file becomes the stored object (linked, not
+        copied). If it is already stored, the file is replaced by a link to
+        the existing object, freeing its own copy.
+
+        Args:
+            path: Model file whose content hashes to sha256
+            sha256: SHA256 of the file
+
+        Returns:
+            "present" (already shared with the store), "stored" (new object),
+            "linked" (replaced by a link to an existing object), or None if
+            the file could not be linked (e.g. on another filesystem)
+        """
+        path = Path(path)
+        obj = self.path_for(sha256)
+        try:
+            if obj.is_file():
+                if os.path.samefile(obj, path):
+                    return "present"
+                if obj.stat().st_size != path.stat().st_size:
+                    return None  # Corrupt object or wrong hash: leave both alone
+                return "linked" if _link(obj, path) else None
+            obj.parent.mkdir(parents=True, exist_ok=True)
+            return "stored" if _link(path, obj) else None
+        except OSError:
+            return None
+
+    def prune(self, keep: Iterable[str] = (),
+              keep_sizes: Iterable[int] = ()) -> Tuple[int, int]:
+        """
+        Delete objects that no model folder links to any more.
+
+        Hardlinked objects are unreferenced once their link count is 1.
+        Reflinked objects always have a link count of 1, so objects whose
+        hash is in keep (e.g. every SHA256 in the hash index) are retained,
+        and so are objects of a size in keep_sizes: a reflink clone the
+        index has not hashed yet is only known by its size.
+
+        Returns:
+            (objects removed, bytes freed)
+        """
+        keep = {h.upper() for h in keep}
+        keep_sizes = set(keep_sizes)
+        removed, freed = 0, 0
+        if not self.root.is_dir():
+            return removed, freed
+        for fan_dir in self.root.iterdir():
+            if not fan_dir.is_dir():
+                continue
+            for obj in fan_dir.iterdir():
+                if obj.name in keep or obj.name.endswith(".tmp"):
+                    continue
+                try:
+                    st = obj.stat()
+                    if st.st_nlink > 1 or st.st_size in keep_sizes:
+                        continue
+                    obj.unlink()
+                except OSError:
+                    continue
+                removed += 1
+                freed += st.st_size
+        return removed, freed
+
+
+def _link(src: Path, dst: Path) -> Optional[str]:
+    """
+    Atomically make dst share src's data: reflink if the filesystem
+    supports it, else hardlink. Returns the method used, or None.
+    """
+    tmp = dst.with_name(f".{dst.name}.{os.getpid()}.tmp")
+    try:
+        for method, link in (("reflink", _reflink), ("hardlink", os.link)):
+            try:
+                link(src, tmp)
+            except OSError as e:
+                _unlink_quiet(tmp)
+                if e.errno in _UNSUPPORTED:
+                    continue
+                raise
+            os.replace(tmp, dst)
+            return method
+        return None
+    finally:
+        _unlink_quiet(tmp)
+
+
+def _reflink(src: Path, dst: Path):
+    """Clone src to a new file dst sharing its extents (FICLONE)."""
+    if fcntl is None or not sys.platform.startswith("linux"):
+        raise OSError(errno.EOPNOTSUPP, "reflink not supported")
+    with open(src, "rb") as s, open(dst, "xb") as d:
+        fcntl.ioctl(d.fileno(), _FICLONE, s.fileno())
+    st = os.stat(src)
+    os.utime(dst, ns=(st.st_atime_ns, st.st_mtime_ns))
+
+
+def _unlink_quiet(path: Path):
+    try:
+        os.unlink(path)
+    except OSError:
+        pass
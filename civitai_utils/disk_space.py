@@ -0,0 +1,209 @@
+"""
+Disk Space Admission
+
+Checks that downloads fit on their target filesystem before any byte is
+transferred, instead of failing at 95% with a half-written .part file.
+
+A process-wide ledger tracks space reserved by in-flight downloads per
+filesystem (st_dev), so concurrent downloads cannot all admit themselves
+against the same free space. As a download writes, its reservation
+shrinks by the bytes written (those are already gone from the free space
+reported by the OS); finishing, failing or cancelling releases the rest.
+"""
+
+import os
+import shutil
+import threading
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple, Union
+
+# Free space always left on a filesystem (logs, temp files, the OS)
+MIN_FREE_BYTES = 512 * 1024 * 1024
+
+
+class InsufficientSpaceError(ValueError):
+    """A download does not fit on its target filesystem."""
+
+    def __init__(self, directory: Path, needed: int, available: int, free: int):
+        """
+        Args:
+            directory: Target directory
+            needed: Bytes requested
+            available: Bytes admissible now (after margin and reservations)
+            free: Bytes admissible if no other download held a reservation
+        """
+        self.directory = directory
+        self.needed = needed
+        self.available = available
+        self.free = free
+        super().__init__(
+            f"Not enough disk space in {directory}: need {_gb(needed)}, "
+            f"{_gb(max(available, 0))} available"
+        )
+
+    @property
+    def retryable(self) -> bool:
+        """True if it would fit once other in-flight downloads finish or stop."""
+        return self.needed <= self.free
+
+
+@dataclass(eq=False)
+class Reservation:
+    """Space held for one download on one filesystem."""
+    directory: Path
+    device: int
+    size: int
+    written: int = 0
+    released: bool = False
+
+    @property
+    def outstanding(self) -> int:
+        """Reserved bytes not yet written to disk."""
+        return 0 if self.released else max(self.size - self.written, 0)
+
+
+class DiskSpaceLedger:
+    """
+    Reservations of in-flight downloads against per-filesystem free space.
+    """
+
+    def __init__(self, min_free: int = MIN_FREE_BYTES):
+        """
+        Args:
+            min_free: Bytes to leave free on every filesystem
+        """
+        self.min_free = min_free
+        self._reservations: List[Reservation] = []
+        self._cond = threading.Condition()
+
+    def reserve(self, directory: Union[str, Path], size: int,
+                wait: bool = False,
+                cancel_event: Optional[threading.Event] = None) -> Optional[Reservation]:
+        """
+        Reserve space for a download into directory.
+
+        Args:
+            directory: Target directory (need not exist yet)
+            size: Bytes to reserve
+            wait: If the space is only held by other in-flight downloads,
+                  wait until it is released instead of failing
+            cancel_event: Stops waiting when set (returns None)
+
+        Returns:
+            The Reservation, or None if cancelled while waiting
+
+        Raises:
+            InsufficientSpaceError: If the download does not fit
+        """
+        directory = Path(directory)
+        device = _device_of(directory)
+        with self._cond:
+            while True:
+                try:
+                    return self._try_reserve(directory, device, size)
+                except InsufficientSpaceError as e:
+                    if not (wait and e.retryable):
+                        raise
+                if cancel_event is not None and cancel_event.is_set():
+                    return None
+                self._cond.wait(timeout=1.0)
+
+    def admit(self, items: Iterable[Tuple[Union[str, Path], int]]
+              ) -> List[Union[Reservation, InsufficientSpaceError]]:
+        """
+        Reserve space for a batch, item by item in order.
+
+        Items that fit are reserved; for the others the error is returned in
+        their place (check its retryable flag to queue rather than reject).
+
+        Args:
+            items: (target directory, size in bytes) per download
+        """
+        results: List[Union[Reservation, InsufficientSpaceError]] = []
+        with self._cond:
+            for directory, size in items:
+                try:
+                    results.append(self.reserve(directory, size))
+                except InsufficientSpaceError as e:
+                    results.append(e)
+        return results
+
+    def shortfalls(self, items: Iterable[Tuple[Union[str, Path], int]]
+                   ) -> List[InsufficientSpaceError]:
+        """
+        Check whether a batch fits, summed per filesystem, without reserving.
+
+        Returns:
+            One error per filesystem the batch does not fit on
+        """
+        needed: Dict[int, Tuple[Path, int]] = {}
+        for directory, size in items:
+            directory = Path(directory)
+            device = _device_of(directory)
+            first_dir, total = needed.get(device, (directory, 0))
+            needed[device] = (first_dir, total + size)
+
+        errors = []
+        with self._cond:
+            for device, (directory, total) in needed.items():
+                free, available = self._available(directory, device)
+                if total > available:
+                    errors.append(InsufficientSpaceError(directory, total, available,
+                                                         free - self.min_free))
+        return errors
+
+    def available(self, directory: Union[str, Path]) -> int:
+        """Bytes admissible in directory now (after margin and reservations)."""
+        directory = Path(directory)
+        with self._cond:
+            return self._available(directory, _device_of(directory))[1]
+
+    def update(self, reservation: Reservation, written: int):
+        """Record how many bytes of a reserved download are on disk."""
+        with self._cond:
+            reservation.written = written
+
+    def release(self, reservation: Optional[Reservation]):
+        """Release a reservation (idempotent; None is ignored)."""
+        if reservation is None:
+            return
+        with self._cond:
+            if not reservation.released:
+                reservation.released = True
+                self._reservations.remove(reservation)
+                self._cond.notify_all()
+
+    def _try_reserve(self, directory: Path, device: int, size: int) -> Reservation:
+        free, available = self._available(directory, device)
+        if size > available:
+            raise InsufficientSpaceError(directory, size, available, free - self.min_free)
+        reservation = Reservation(directory=directory, device=device, size=size)
+        self._reservations.append(reservation)
+        return reservation
+
+    def _available(self, directory: Path, device: int) -> Tuple[int, int]:
+        """(free bytes, free bytes minus margin and outstanding reservations)."""
+        free = shutil.disk_usage(_existing_ancestor(directory)).free
+        held = sum(r.outstanding for r in self._reservations if r.device == device)
+        return free, free - self.min_free - held
+
+
+# Shared by every download in this process
+space_ledger = DiskSpaceLedger()
+
+
+def _existing_ancestor(path: Path) -> Path:
+    """Closest existing directory at or above path."""
+    path = path.absolute()
+    while not path.exists() and path.parent != path:
+        path = path.parent
+    return path
+
+
+def _device_of(path: Path) -> int:
+    return os.stat(_existing_ancestor(path)).st_dev
+
+
+def _gb(size: int) -> str:
+    return f"{size / (1024 ** 3):.2f} GB"
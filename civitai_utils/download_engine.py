@@ -0,0 +1,354 @@
+"""
+Download Engine
+
+The one transfer routine behind every model download: the CLI
+(ModelManager.download_file, used by download_models and reproduce) and
+the ComfyUI routes both call download(). It owns the path from request
+to published file:
+
+- the real filename from Content-Disposition,
+- a <name>.part file written by download_segmented() (Range requests,
+  resumable through its sidecar) or stream_to_file() (a single stream),
+  both with throughput-sized reads and a preallocated, fsynced file,
+- retries with backoff of dropped connections, timeouts and 5xx/429
+  answers; ranged downloads resume where the failed attempt stopped, and
+  fall back to a single stream if the server does not honor ranges,
+- SHA256 verification, hashed while the file downloads (ranged
+  downloads in file order, as the complete prefix grows), repairing
+  ranged downloads block by block, or, without a published hash, a
+  safetensors header check,
+- an atomic rename of the verified .part into place.
+
+Callers follow a download through one callback, on_event(filename,
+status, **fields), with the "downloading" and "verifying" events the
+sidebar shows, and admit its disk usage through prepare() once the size
+is known. Content store, quota and library bookkeeping stay with them.
+"""
+
+import hashlib
+import logging
+import os
+import re
+import threading
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Callable, Dict, Optional, Tuple, Union
+from urllib.parse import urlsplit
+
+import requests
+
+from civitai_utils.downloader import (
+    PartState, RangeNotSupportedError, discard_part, download_segmented,
+    reopen_corrupt_blocks, resume_state, state_path, stream_to_file, supports_ranges,
+)
+from civitai_utils.safetensors_header import validate_safetensors
+
+logger = logging.getLogger("civitai_alchemist.download")
+
+# Attempts after the first, and the wait before the first retry (doubled
+# for each further one)
+RETRIES = 3
+RETRY_BACKOFF = 2.0
+
+# Answers worth retrying: the server or a proxy is having a moment
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+_RETRYABLE = (requests.ConnectionError, requests.Timeout,
+              requests.exceptions.ChunkedEncodingError, requests.HTTPError)
+
+# on_event(filename, status, **fields)
+OnEvent = Callable[..., None]
+# prepare(target_path, total_bytes, unallocated_bytes), may raise to refuse
+Prepare = Callable[[Path, int, int], None]
+
+
+class DownloadError(ValueError):
+    """A download failed for good: HTTP error, checksum mismatch, invalid file."""
+
+
+class DownloadCancelled(Exception):
+    """A download was cancelled, for callers that must return a file."""
+
+
+@dataclass
+class DownloadResult:
+    """A verified file in place."""
+    path: Path
+    sha256: str
+    size: int
+
+
+def download(url: str, target_dir: Union[str, Path], filename: str,
+             expected_sha256: Optional[str] = None,
+             headers: Optional[Dict[str, str]] = None,
+             on_event: Optional[OnEvent] = None,
+             cancel_event: Optional[threading.Event] = None,
+             throttle: Optional[Callable[[int], None]] = None,
+             prepare: Optional[Prepare] = None,
+             on_allocated: Optional[Callable[[], None]] = None,
+             resume_key: Optional[str] = None,
+             retries: int = RETRIES,
+             progress_interval: float = 0.5,
+             timeout: Tuple[float, float] = (60, 60)) -> Optional[DownloadResult]:
+    """
+    Download a model file into target_dir, verified and atomically renamed.
+
+    Args:
+        url: Download URL (redirects are followed)
+        target_dir: Directory to place the file in (created if missing)
+        filename: File name, unless the server sends another one in
+                  Content-Disposition
+        expected_sha256: Published SHA256 of the file, if known
+        headers: Request headers (e.g. Authorization); the Range requests
+                 only send them to the same origin as url, not to a
+                 redirect target elsewhere (a signed CDN URL)
+        on_event: Receives "downloading" (progress, downloaded_bytes,
+                  total_bytes) and "verifying" events
+        cancel_event: Stops the download when set
+        throttle: Called with every read's size; may sleep to limit bandwidth
+        prepare: Called once before anything is written, with the target
+                 path, the size (0 if unknown) and the bytes still to be
+                 allocated on disk (less when resuming); raising aborts
+        on_allocated: Called when the .part file has been preallocated to
+                      the full size, so the disk space it was admitted for
+                      is now taken (e.g. to release a reservation)
+        resume_key: Identity of the remote file in the .part sidecar
+                    (default: url; pass it without credentials)
+        retries: Attempts after a transient failure
+        progress_interval: Seconds between "downloading" events
+        timeout: (connect, read) timeout of every request in seconds
+
+    Returns:
+        DownloadResult, or None if cancelled (a ranged .part file is kept
+        to resume from)
+
+    Raises:
+        DownloadError: If the server refuses the file or it fails
+                       verification
+        requests.RequestException: If the transfer still fails after the
+                                   retries
+        OSError: If writing fails
+    """
+    transfer = _Transfer(url, Path(target_dir), filename, expected_sha256,
+                         headers or {}, on_event, cancel_event, throttle, prepare,
+                         on_allocated, resume_key or url, progress_interval, timeout)
+    delay = RETRY_BACKOFF
+    attempt = 0
+    while True:
+        try:
+            return transfer.attempt()
+        except RangeNotSupportedError as e:
+            if not transfer.use_ranges:
+                raise
+            # Advertised byte ranges but does not serve them: stream instead
+            logger.warning("Downloading %s: %s; using a single stream", transfer.filename, e)
+            transfer.use_ranges = False
+            discard_part(transfer.part_path)
+        except _RETRYABLE as e:
+            if transfer.cancelled():
+                # The cancel cut the request short: not a failure
+                return None
+            if attempt >= retries:
+                raise
+            attempt += 1
+            logger.warning("Downloading %s failed (%s); retry %d of %d in %.0f s",
+                           transfer.filename, e, attempt, retries, delay)
+            if (cancel_event or threading.Event()).wait(delay):
+                return None
+            delay *= 2
+
+
+def part_path(target_path: Union[str, Path]) -> Path:
+    """The .part file a download of target_path is written to."""
+    target_path = Path(target_path)
+    return target_path.with_name(f"{target_path.name}.part")
+
+
+def unallocated_bytes(part: Union[str, Path], size: int) -> int:
+    """
+    Bytes of a size-byte download not yet allocated on disk.
+
+    A resumable .part file is preallocated to the full size, so a resumed
+    download only needs the rest (usually nothing).
+    """
+    if size and state_path(part).exists():
+        try:
+            return max(size - os.path.getsize(part), 0)
+        except OSError:
+            pass
+    return size
+
+
+def http_error_message(resp: requests.Response) -> str:
+    """Build a user-friendly error message from a failed download response."""
+    status = resp.status_code
+
+    if status == 401:
+        # Civitai returns JSON with a "message" field for auth errors.
+        # Common cause: model is in Early Access (paid download period).
+        try:
+            body = resp.json()
+            api_msg = body.get("message", "")
+        except Exception:
+            api_msg = ""
+
+        if "logged in" in api_msg.lower() or "early access" in api_msg.lower():
+            return (
+                "This model requires Early Access purchase on Civitai. "
+                "API keys cannot bypass this restriction."
+            )
+        return f"HTTP 401 — Unauthorized ({api_msg or 'check your API key'})"
+
+    if status == 404:
+        return "HTTP 404 — Model file not found on Civitai"
+
+    return f"HTTP {status}"
+
+
+class _Transfer:
+    """State of one download() across its attempts."""
+
+    def __init__(self, url: str, target_dir: Path, filename: str,
+                 expected_sha256: Optional[str], headers: Dict[str, str],
+                 on_event: Optional[OnEvent],
+                 cancel_event: Optional[threading.Event],
+                 throttle: Optional[Callable[[int], None]],
+                 prepare: Optional[Prepare],
+                 on_allocated: Optional[Callable[[], None]], resume_key: str,
+                 progress_interval: float, timeout: Tuple[float, float]):
+        self.url = url
+        self.target_dir = target_dir
+        self.filename = filename
+        self.expected_sha256 = expected_sha256.upper() if expected_sha256 else None
+        self.headers = headers
+        self.on_event = on_event
+        self.cancel_event = cancel_event
+        self.throttle = throttle
+        self.prepare = prepare
+        self.on_allocated = on_allocated
+        self.resume_key = resume_key
+        self.progress_interval = progress_interval
+        self.timeout = timeout
+        self.prepared = False
+        self.use_ranges = True
+        self.total_bytes = 0
+
+    @property
+    def target_path(self) -> Path:
+        return self.target_dir / self.filename
+
+    @property
+    def part_path(self) -> Path:
+        return part_path(self.target_path)
+
+    def cancelled(self) -> bool:
+        return self.cancel_event is not None and self.cancel_event.is_set()
+
+    def attempt(self) -> Optional[DownloadResult]:
+        resp = requests.get(self.url, headers=self.headers, stream=True,
+                            timeout=self.timeout, allow_redirects=True)
+        with resp:
+            if resp.status_code in RETRY_STATUSES:
+                raise requests.HTTPError(http_error_message(resp), response=resp)
+            if resp.status_code != 200:
+                raise DownloadError(http_error_message(resp))
+
+            # Check Content-Disposition for actual filename
+            content_disp = resp.headers.get("Content-Disposition", "")
+            match = re.search(r'filename="?([^";\n]+)"?', content_disp)
+            if match:
+                self.filename = match.group(1).strip()
+            self.target_dir.mkdir(parents=True, exist_ok=True)
+
+            self.total_bytes = int(resp.headers.get("Content-Length", 0))
+            if not self.prepared:
+                if self.prepare is not None:
+                    self.prepare(self.target_path, self.total_bytes,
+                                 unallocated_bytes(self.part_path, self.total_bytes))
+                self.prepared = True
+
+            if self.use_ranges and self.total_bytes and supports_ranges(resp):
+                # Range requests (several connections for large files) into
+                # one preallocated .part, continuing an earlier attempt if it
+                # matches
+                resp.close()
+                state = resume_state(self.part_path, self.resume_key, self.total_bytes,
+                                     resp.headers.get("ETag", ""))
+                sha = hashlib.sha256()
+                if not self._fetch_ranges(resp.url, state, sha):
+                    return None
+                return self._finish(sha.hexdigest().upper(), self.total_bytes, resp.url, state)
+
+            # Cannot be resumed: drop any earlier attempt and start over
+            discard_part(self.part_path)
+            try:
+                result = stream_to_file(
+                    resp, self.part_path, self.total_bytes,
+                    cancel_event=self.cancel_event, progress=self._progress,
+                    progress_interval=self.progress_interval, throttle=self.throttle,
+                    on_allocated=self.on_allocated,
+                )
+            except BaseException:
+                discard_part(self.part_path)
+                raise
+            if result is None:
+                discard_part(self.part_path)
+                return None
+        sha256, size = result
+        return self._finish(sha256, size, None, None)
+
+    def _fetch_ranges(self, url: str, state: PartState, hasher=None) -> bool:
+        return download_segmented(
+            url, self.part_path, self.total_bytes,
+            headers=self.headers if _same_origin(url, self.url) else None,
+            cancel_event=self.cancel_event,
+            progress=self._progress, progress_interval=self.progress_interval,
+            timeout=self.timeout, state=state, throttle=self.throttle,
+            on_allocated=self.on_allocated, hasher=hasher,
+        )
+
+    def _finish(self, sha256: str, size: int, url: Optional[str],
+                state: Optional[PartState]) -> Optional[DownloadResult]:
+        """Verify the complete .part file and rename it into place."""
+        self._emit("downloading", progress=100, downloaded_bytes=size,
+                   total_bytes=self.total_bytes)
+        self._emit("verifying", downloaded_bytes=size, total_bytes=self.total_bytes)
+
+        if self.expected_sha256:
+            if sha256 != self.expected_sha256 and state is not None \
+                    and reopen_corrupt_blocks(self.part_path, state):
+                # Only some blocks on disk differ from what was received:
+                # refetch those instead of the whole file
+                sha = hashlib.sha256()
+                if not self._fetch_ranges(url, state, sha):
+                    return None
+                sha256 = sha.hexdigest().upper()
+            if sha256 != self.expected_sha256:
+                discard_part(self.part_path)
+                raise DownloadError("Checksum mismatch")
+        elif self.filename.lower().endswith(".safetensors"):
+            # No published hash: at least reject truncated files and
+            # error pages by checking the header against the file size
+            invalid = validate_safetensors(self.part_path)
+            if invalid:
+                discard_part(self.part_path)
+                raise DownloadError(f"Invalid safetensors file: {invalid}")
+
+        os.replace(self.part_path, self.target_path)
+        discard_part(self.part_path)
+        return DownloadResult(self.target_path, sha256, size)
+
+    def _progress(self, done: int):
+        percent = int(done * 100 / self.total_bytes) if self.total_bytes else 0
+        self._emit("downloading", progress=percent, downloaded_bytes=done,
+                   total_bytes=self.total_bytes)
+
+    def _emit(self, status: str, **fields):
+        if self.on_event is not None:
+            self.on_event(self.filename, status, **fields)
+
+
+def _same_origin(a: str, b: str) -> bool:
+    """True if two URLs share scheme, host and port."""
+    a, b = urlsplit(a), urlsplit(b)
+    return (a.scheme, a.netloc.lower()) == (b.scheme, b.netloc.lower())
@@ -0,0 +1,233 @@
+"""
+Download Manager
+
+One scheduler for every model download in the process. Requests are
+queued by priority (interactive before batch before background, then
+smallest first) and started within a global and a per-host concurrency
+limit.
+
+A request for a file that is already queued or in flight (same model
+version ID or SHA256) attaches to the existing transfer instead of
+starting a second one racing on the same .part file. Every subscriber
+receives the same progress events, and a transfer is only cancelled once
+all of its subscribers have cancelled.
+
+The manager lives on the asyncio event loop; transfers run in worker
+threads via asyncio.to_thread() and report progress through an emit
+callback that fans events out to the subscribers. With a bandwidth shaper
+(see bandwidth.py), each transfer also gets a throttle to call with every
+chunk it receives.
+"""
+
+import asyncio
+import itertools
+import threading
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+from urllib.parse import urlparse
+
+PRIORITY_INTERACTIVE = 0
+PRIORITY_BATCH = 1
+PRIORITY_BACKGROUND = 2
+
+PRIORITIES = {
+    "interactive": PRIORITY_INTERACTIVE,
+    "batch": PRIORITY_BATCH,
+    "background": PRIORITY_BACKGROUND,
+}
+
+# Transfers running at once, in total and per host
+MAX_ACTIVE = 4
+MAX_PER_HOST = 3
+
+# emit(filename, status, **fields), called from the worker thread
+Emit = Callable[..., None]
+# throttle(n_bytes), paces a transfer (None without a shaper)
+Throttle = Optional[Callable[[int], None]]
+# work(emit, cancel_event, throttle) -> success, run in a worker thread
+Work = Callable[[Emit, threading.Event, Throttle], bool]
+# send(task_id, filename, status, fields), delivers one event to one task
+Send = Callable[[str, str, str, Dict[str, Any]], None]
+
+
+@dataclass(eq=False)
+class DownloadJob:
+    """One transfer, shared by every task subscribed to it."""
+    keys: Tuple[str, ...]
+    work: Work
+    filename: str
+    host: str
+    priority: int
+    size: int
+    seq: int
+    # (task_id, future resolved with the outcome) per subscription
+    subscribers: List[Tuple[str, asyncio.Future]] = field(default_factory=list)
+    cancel_event: threading.Event = field(default_factory=threading.Event)
+    started: bool = False
+    last_event: Optional[Tuple[str, str, Dict[str, Any]]] = None
+    # Cancelled transfer of the same file still winding down; this one
+    # waits for it, so the two never write the same .part at once
+    after: Optional["DownloadJob"] = None
+    lock: threading.Lock = field(default_factory=threading.Lock)
+
+
+class DownloadManager:
+    """
+    Priority queue and concurrency limits for downloads, with deduplication.
+    """
+
+    def __init__(self, send: Send, max_active: int = MAX_ACTIVE,
+                 max_per_host: int = MAX_PER_HOST, shaper=None):
+        """
+        Args:
+            send: Delivers a progress event to one task
+            max_active: Transfers running at once
+            max_per_host: Transfers running at once per download host
+            shaper: BandwidthShaper pacing the transfers (None = unlimited)
+        """
+        self.send = send
+        self.shaper = shaper
+        self.max_active = max_active
+        self.max_per_host = max_per_host
+        self._queue: List[DownloadJob] = []
+        self._active: List[DownloadJob] = []
+        self._by_key: Dict[str, DownloadJob] = {}
+        self._seq = itertools.count()
+
+    def submit(self, task_id: str, keys: Iterable[str], work: Work,
+               filename: str, url: str = "", priority: int = PRIORITY_BATCH,
+               size: int = 0) -> Tuple[asyncio.Future, bool]:
+        """
+        Queue a download for a task, or attach the task to an identical one.
+
+        Must be called on the event loop.
+
+        Args:
+            task_id: Task receiving the progress events
+            keys: Identities of the file (e.g. "version:123", "sha256:..."),
+                  shared by requests for the same file
+            work: Performs the transfer (see Work)
+            filename: File name for events sent by the manager itself
+            url: Download URL (its host is subject to max_per_host)
+            priority: PRIORITY_* (lower starts first)
+            size: Expected size in bytes (smaller starts first; 0 = unknown)
+
+        Returns:
+            (future resolved with True on success, False on failure or
+            cancel; True if the task attached to an existing transfer)
+        """
+        keys = tuple(k for k in keys if k)
+        future = asyncio.get_running_loop().create_future()
+        job = next((self._by_key[k] for k in keys if k in self._by_key), None)
+        stopping = None
+        if job is not None and job.cancel_event.is_set():
+            # Stopping: start over rather than share its fate, but only
+            # once it has let go of the file
+            stopping, job = job, None
+        attached = job is not None
+        if job is None:
+            job = DownloadJob(keys=keys, work=work, filename=filename,
+                              host=urlparse(url).hostname or "",
+                              priority=priority, size=size, seq=next(self._seq),
+                              after=stopping)
+            for key in keys:
+                self._by_key[key] = job
+            self._queue.append(job)
+        elif not job.started:
+            job.priority = min(job.priority, priority)
+
+        with job.lock:
+            job.subscribers.append((task_id, future))
+            last_event = job.last_event
+        if last_event is not None:
+            self.send(task_id, *last_event)
+
+        self._pump()
+        if not job.started:
+            self.send(task_id, filename, "waiting", {})
+        return future, attached
+
+    def cancel(self, task_id: str) -> bool:
+        """
+        Unsubscribe a task from all of its transfers.
+
+        Transfers left without subscribers are cancelled (running) or
+        dropped (queued). The task gets a "cancelled" event per file.
+
+        Returns:
+            True if the task had any transfer
+        """
+        found = False
+        for job in self._queue + self._active:
+            with job.lock:
+                mine = [f for t, f in job.subscribers if t == task_id]
+                if not mine:
+                    continue
+                job.subscribers = [(t, f) for t, f in job.subscribers if t != task_id]
+                orphaned = not job.subscribers
+                filename = job.last_event[0] if job.last_event else job.filename
+            found = True
+            for future in mine:
+                if not future.done():
+                    future.set_result(False)
+            if orphaned:
+                if job.started:
+                    job.cancel_event.set()
+                else:
+                    self._queue.remove(job)
+                    self._forget(job)
+            self.send(task_id, filename, "cancelled", {})
+        return found
+
+    def _pump(self):
+        """Start queued transfers while the limits allow."""
+        self._queue.sort(key=lambda j: (j.priority, j.size == 0, j.size, j.seq))
+        for job in list(self._queue):
+            if len(self._active) >= self.max_active:
+                break
+            if job.after is not None and job.after in self._active:
+                continue
+            if sum(1 for a in self._active if a.host == job.host) >= self.max_per_host:
+                continue
+            self._queue.remove(job)
+            self._active.append(job)
+            job.after = None
+            job.started = True
+            asyncio.ensure_future(self._run(job))
+
+    async def _run(self, job: DownloadJob):
+        def emit(filename: str, status: str, **fields):
+            with job.lock:
+                job.last_event = (filename, status, fields)
+                task_ids = list(dict.fromkeys(t for t, _ in job.subscribers))
+            for task_id in task_ids:
+                self.send(task_id, filename, status, fields)
+
+        throttle = None
+        if self.shaper is not None:
+            # Task limits apply to the task that started the transfer
+            with job.lock:
+                owner = job.subscribers[0][0] if job.subscribers else ""
+            throttle = self.shaper.open(owner, job.host, job.priority, job.cancel_event)
+
+        ok = False
+        try:
+            ok = await asyncio.to_thread(job.work, emit, job.cancel_event, throttle)
+        except Exception as e:
+            emit(job.filename, "failed", error=str(e))
+        finally:
+            if throttle is not None:
+                throttle.close()
+            self._active.remove(job)
+            self._forget(job)
+            with job.lock:
+                futures = [f for _, f in job.subscribers]
+            for future in futures:
+                if not future.done():
+                    future.set_result(ok)
+            self._pump()
+
+    def _forget(self, job: DownloadJob):
+        for key in job.keys:
+            if self._by_key.get(key) is job:
+                del self._by_key[key]
@@ -0,0 +1,783 @@
+"""
+Downloader
+
+File I/O for model downloads. Socket reads are sized to the measured
+throughput (ChunkSizer: 64 KB on a slow link, up to 4 MB on a fast one),
+so Python's per-read overhead does not cap gigabit transfers. Writing
+reads straight through would still grow multi-GB files in small steps,
+which fragments them on XFS/ext4 and slows every later load. PartFileWriter instead:
+
+- preallocates the full expected size up front (fallocate), so the
+  filesystem can lay the file out contiguously,
+- coalesces reads into large, aligned writes,
+- fsyncs once at the end, so the atomic rename that follows publishes a
+  file whose data is on disk.
+
+Downloads over a single stream run as a pipeline (stream_to_file): the
+network reader, the SHA256 hasher and the disk writer are separate
+threads handing a fixed pool of buffers along bounded queues, so the
+socket keeps receiving while earlier data is hashed and written, and
+throughput is set by the slowest stage rather than the sum of all three.
+Response bodies are read with readinto() into those preallocated buffers
+and passed on as memoryviews, so a download allocates the same few
+buffers however large the file is, instead of a bytes object per chunk.
+
+A single HTTP stream is also capped by one TCP connection's throughput
+from the CDN, far below a fast link. Large files from servers that accept
+byte ranges are therefore fetched by download_segmented(): split into N
+ranges fetched in parallel, each written at its offset into one
+preallocated .part file.
+
+Ranged downloads are resumable: their progress (URL without credentials,
+size, ETag and the bytes on disk per segment) is kept in a PartState
+sidecar next to the .part file (<name>.part.json), so a cancelled or
+failed download continues where it stopped instead of starting over.
+The sidecar also holds a manifest of SHA256 digests per 8 MB block, taken
+from the data as received. Resuming only re-reads the last blocks of each
+segment (the ones an interrupted write may have left incomplete), and a
+file failing its checksum is repaired by refetching just the blocks whose
+data on disk no longer matches the manifest.
+"""
+
+import ctypes
+import ctypes.util
+import errno
+import hashlib
+import http.client
+import json
+import os
+import queue
+import sys
+import threading
+import time
+from concurrent.futures import FIRST_EXCEPTION, ThreadPoolExecutor, wait
+from dataclasses import asdict, dataclass, field
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Tuple, Union
+
+import requests
+import urllib3
+
+# Writes are issued in multiples of this many bytes
+WRITE_BUFFER_SIZE = 8 * 1024 * 1024
+
+# Files at least this large are fetched over several connections
+SEGMENT_MIN_SIZE = 128 * 1024 * 1024
+SEGMENT_COUNT = 4
+
+# Block size of the SHA256 manifest; segment boundaries are aligned to it
+BLOCK_SIZE = 8 * 1024 * 1024
+
+# Socket reads adapt between these sizes, aiming at one read per
+# CHUNK_TARGET_SECONDS of measured throughput
+CHUNK_MIN = 64 * 1024
+CHUNK_MAX = 4 * 1024 * 1024
+CHUNK_TARGET_SECONDS = 0.025
+
+# Buffers in flight between the stages of stream_to_file(), and their size
+PIPELINE_BUFFERS = 4
+PIPELINE_BUFFER_SIZE = CHUNK_MAX
+
+
+class ChunkSizer:
+    """
+    Socket read size tuned to the measured throughput.
+
+    Small reads keep a slow transfer responsive (progress, cancel); large
+    reads keep the per-read Python overhead from capping a fast one.
+    """
+
+    def __init__(self, minimum: int = CHUNK_MIN, maximum: int = CHUNK_MAX,
+                 target_seconds: float = CHUNK_TARGET_SECONDS):
+        self.minimum = minimum
+        self.maximum = maximum
+        self.target_seconds = target_seconds
+        self.size = minimum
+        self._rate = 0.0
+
+    def update(self, n: int, elapsed: float):
+        """Account for a read of n bytes that took elapsed seconds."""
+        if n <= 0:
+            return
+        rate = n / max(elapsed, 1e-6)
+        self._rate = rate if not self._rate else 0.7 * self._rate + 0.3 * rate
+        size = self.minimum
+        while size < self.maximum and size < self._rate * self.target_seconds:
+            size *= 2
+        self.size = min(size, self.maximum)
+
+
+class RangeNotSupportedError(requests.RequestException):
+    """The server answered a Range request with something other than the range."""
+
+
+@dataclass
+class PartState:
+    """Progress of a ranged download, saved as the .part file's sidecar."""
+    url: str  # Download URL, without credentials
+    size: int
+    etag: str = ""
+    # [start, position, end] per segment; [start, position) is on disk
+    segments: List[List[int]] = field(default_factory=list)
+    # SHA256 of each BLOCK_SIZE block as received ("" until complete)
+    blocks: List[str] = field(default_factory=list)
+
+    @property
+    def downloaded(self) -> int:
+        """Bytes on disk across all segments."""
+        return sum(position - start for start, position, _ in self.segments)
+
+    def matches(self, url: str, size: int, etag: str = "") -> bool:
+        """True if this state belongs to the same remote file."""
+        return (self.url == url and self.size == size
+                and (not self.etag or not etag or self.etag == etag))
+
+
+class PartFileWriter:
+    """
+    Buffered, preallocated writer for a download's .part file.
+
+    Use as a context manager; leaving the block normally flushes, trims
+    and fsyncs the file, leaving it through an exception only closes it.
+    """
+
+    def __init__(self, path: Union[str, Path], expected_size: int = 0,
+                 buffer_size: int = WRITE_BUFFER_SIZE):
+        """
+        Args:
+            path: File to create (truncated if it exists)
+            expected_size: Final size if known (e.g. Content-Length), for
+                           preallocation; 0 if unknown
+            buffer_size: Bytes collected before each write
+        """
+        self.path = Path(path)
+        self.buffer_size = buffer_size
+        self.bytes_written = 0
+        self._buffer = bytearray(buffer_size)
+        self._buffered = 0
+        self._file = open(self.path, "wb", buffering=0)
+        try:
+            self.preallocated = (expected_size > 0 and
+                                 preallocate(self._file.fileno(), expected_size))
+        except OSError:
+            self._file.close()
+            raise
+
+    def write(self, data: Union[bytes, bytearray, memoryview]):
+        """Append data, writing to disk whenever a full buffer is collected."""
+        view = memoryview(data)
+        while view:
+            if not self._buffered and len(view) >= self.buffer_size:
+                # Whole buffers' worth: write straight through, no copy
+                n = len(view) - len(view) % self.buffer_size
+                self._write_all(view[:n])
+                self.bytes_written += n
+                view = view[n:]
+                continue
+            n = min(len(view), self.buffer_size - self._buffered)
+            self._buffer[self._buffered:self._buffered + n] = view[:n]
+            self._buffered += n
+            view = view[n:]
+            if self._buffered == self.buffer_size:
+                self._flush_buffer()
+
+    def close(self, sync: bool = True):
+        """
+        Write out buffered data and close the file.
+
+        Args:
+            sync: Trim any unused preallocation and fsync before closing
+        """
+        if self._file.closed:
+            return
+        try:
+            if sync:
+                self._flush_buffer()
+                if self.preallocated:
+                    # The server sent less than announced: drop the tail
+                    os.ftruncate(self._file.fileno(), self.bytes_written)
+                os.fsync(self._file.fileno())
+        finally:
+            self._file.close()
+
+    def __enter__(self) -> "PartFileWriter":
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close(sync=exc_type is None)
+
+    def _flush_buffer(self):
+        self._write_all(memoryview(self._buffer)[:self._buffered])
+        self.bytes_written += self._buffered
+        self._buffered = 0
+
+    def _write_all(self, view: memoryview):
+        while view:
+            n = self._file.write(view)
+            view = view[n:]
+
+
+def stream_to_file(response: requests.Response, path: Union[str, Path],
+                   expected_size: int = 0,
+                   cancel_event: Optional[threading.Event] = None,
+                   progress: Optional[Callable[[int], None]] = None,
+                   progress_interval: float = 0.5,
+                   throttle: Optional[Callable[[int], None]] = None,
+                   on_allocated: Optional[Callable[[], None]] = None
+                   ) -> Optional[Tuple[str, int]]:
+    """
+    Write a streamed response body to a .part file, hashing it on the way.
+
+    The calling thread reads the body straight into pooled buffers
+    (readinto, no per-chunk bytes objects); a hasher thread and a writer
+    thread (a PartFileWriter) take each full buffer in turn as a
+    memoryview, and the writer returns it to the pool. With the pool
+    empty the reader waits, so memory stays bounded and flat. Read sizes
+    follow the throughput (ChunkSizer).
+
+    Args:
+        response: Streamed response (stream=True), positioned at the body
+        path: .part file to create (truncated if it exists)
+        expected_size: Content-Length for preallocation (0 if unknown)
+        cancel_event: Stops reading when set
+        progress: Called with the bytes received so far, every
+                  progress_interval seconds, on the calling thread
+        progress_interval: Seconds between progress calls
+        throttle: Called with the size of every read; may sleep to limit
+                  bandwidth
+        on_allocated: Called once expected_size bytes are preallocated
+                      (disk space is then taken, whatever is written)
+
+    Returns:
+        (SHA256 hex digest in uppercase, bytes written), or None if
+        cancelled (the file is left closed but not synced)
+
+    Raises:
+        OSError: If writing fails
+        requests.RequestException: If reading fails
+    """
+    pool: "queue.Queue[memoryview]" = queue.Queue()
+    for _ in range(PIPELINE_BUFFERS):
+        pool.put(memoryview(bytearray(PIPELINE_BUFFER_SIZE)))
+    # Room for every buffer plus the end marker, so puts never block
+    to_hash: queue.Queue = queue.Queue(maxsize=PIPELINE_BUFFERS + 1)
+    to_write: queue.Queue = queue.Queue(maxsize=PIPELINE_BUFFERS + 1)
+    sha256 = hashlib.sha256()
+    written = [0]
+    errors: List[BaseException] = []
+    writer = PartFileWriter(path, expected_size, buffer_size=PIPELINE_BUFFER_SIZE)
+    if writer.preallocated and on_allocated is not None:
+        on_allocated()
+    readinto = _body_reader(response)
+    sizer = ChunkSizer()
+
+    def _hash_stage():
+        while True:
+            item = to_hash.get()
+            if item is not None and not errors:
+                buffer, n = item
+                sha256.update(buffer[:n])
+            to_write.put(item)
+            if item is None:
+                return
+
+    def _write_stage():
+        while True:
+            item = to_write.get()
+            if item is None:
+                return
+            buffer, n = item
+            try:
+                if not errors:
+                    writer.write(buffer[:n])
+                    written[0] += n
+            except BaseException as e:
+                errors.append(e)
+            finally:
+                pool.put(buffer)
+
+    stages = [threading.Thread(target=_hash_stage, name="download-hash", daemon=True),
+              threading.Thread(target=_write_stage, name="download-write", daemon=True)]
+    for stage in stages:
+        stage.start()
+
+    completed = False
+    buffer, filled = pool.get(), 0
+    received = 0
+    last_progress = 0.0
+    try:
+        while not errors and not (cancel_event is not None and cancel_event.is_set()):
+            started = time.monotonic()
+            n = readinto(buffer[filled:filled + sizer.size])
+            if not n:
+                if filled:
+                    to_hash.put((buffer, filled))
+                completed = True
+                break
+            if throttle is not None:
+                throttle(n)
+            # Throttled time counts too: a capped transfer keeps small reads
+            now = time.monotonic()
+            sizer.update(n, now - started)
+            filled += n
+            received += n
+            if filled == len(buffer):
+                to_hash.put((buffer, filled))
+                buffer, filled = pool.get(), 0
+            if progress is not None and now - last_progress >= progress_interval:
+                last_progress = now
+                progress(received)
+    finally:
+        to_hash.put(None)
+        for stage in stages:
+            stage.join()
+        writer.close(sync=completed and not errors)
+
+    if errors:
+        raise errors[0]
+    if not completed:
+        return None
+    return sha256.hexdigest().upper(), written[0]
+
+
+def supports_ranges(response: requests.Response) -> bool:
+    """True if the server accepts byte ranges for a response's file."""
+    return (response.headers.get("Accept-Ranges", "").lower() == "bytes"
+            and not response.headers.get("Content-Encoding"))
+
+
+def download_segmented(url: str, path: Union[str, Path], total_size: int,
+                       segments: Optional[int] = None,
+                       cancel_event: Optional[threading.Event] = None,
+                       progress: Optional[Callable[[int], None]] = None,
+                       progress_interval: float = 0.5,
+                       headers: Optional[Dict[str, str]] = None,
+                       timeout: Tuple[float, float] = (60, 60),
+                       state: Optional[PartState] = None,
+                       throttle: Optional[Callable[[int], None]] = None,
+                       on_allocated: Optional[Callable[[], None]] = None,
+                       hasher=None) -> bool:
+    """
+    Download url into path over parallel HTTP Range requests.
+
+    The file is preallocated to total_size and every segment writes at its
+    own offset, so the result is assembled in place; it is fsynced once all
+    segments are done. Segments arrive out of order, so a whole-file hash
+    cannot be taken from the received data; with a hasher, a separate
+    thread instead hashes the file in order while it downloads, following
+    the complete prefix (the first unfinished segment's position) through
+    the page cache, and only the part past that prefix is left to hash
+    once the last segment is in.
+
+    Args:
+        url: Final (post-redirect) URL of the file
+        path: .part file to write
+        total_size: File size from Content-Length
+        segments: Number of parallel connections (default: SEGMENT_COUNT
+                  for files of SEGMENT_MIN_SIZE or more, else 1)
+        cancel_event: Stops all segments when set
+        progress: Called with the bytes downloaded so far, every
+                  progress_interval seconds, on the calling thread
+        progress_interval: Seconds between progress calls
+        headers: Extra request headers
+        timeout: requests (connect, read) timeout per segment
+        state: Progress to resume (see resume_state); it is updated in
+               place and saved to the sidecar as the download proceeds.
+               Without it, path is downloaded from scratch and nothing is
+               saved.
+        throttle: Called with the size of every received chunk, from the
+                  segment threads; may sleep to limit bandwidth
+        on_allocated: Called once a new .part file is preallocated to
+                      total_size (disk space is then taken)
+        hasher: hashlib object (e.g. hashlib.sha256()) fed the whole file
+                in order; complete when True is returned
+
+    Returns:
+        True when complete, False if cancelled
+
+    Raises:
+        RangeNotSupportedError: If the server ignores the Range header
+        requests.RequestException: If a segment fails
+        OSError: If writing fails
+    """
+    persist = state is not None
+    if state is None:
+        state = PartState(url=url, size=total_size)
+    if not state.segments:
+        if segments is None:
+            segments = SEGMENT_COUNT if total_size >= SEGMENT_MIN_SIZE else 1
+        state.segments = [[start, start, end]
+                          for start, end in _split_ranges(total_size, segments)]
+        state.blocks = [""] * _block_count(total_size)
+        with open(path, "wb") as f:
+            allocated = preallocate(f.fileno(), total_size)
+            if not allocated:
+                f.truncate(total_size)
+        if allocated and on_allocated is not None:
+            on_allocated()
+    for segment in state.segments:
+        # Restart unfinished segments at a block boundary, so every block
+        # is hashed whole
+        if segment[1] < segment[2]:
+            segment[1] = max(segment[0], segment[1] // BLOCK_SIZE * BLOCK_SIZE)
+
+    stop = threading.Event()
+    hash_thread = None
+    hashed = [0]
+    if hasher is not None:
+        def _hash():
+            hashed[0] = _hash_in_order(path, total_size, state, hasher, stop)
+
+        hash_thread = threading.Thread(target=_hash, name="download-hash", daemon=True)
+        hash_thread.start()
+
+    def _fetch(segment: List[int]):
+        _, position, end = segment
+        if position >= end:
+            return
+        request_headers = dict(headers or {})
+        request_headers["Range"] = f"bytes={position}-{end - 1}"
+        with requests.get(url, headers=request_headers, stream=True,
+                          timeout=timeout) as resp:
+            content_range = resp.headers.get("Content-Range", "")
+            if resp.status_code not in (200, 206):
+                # Transient (503, 429, ...) or an expired link: the caller
+                # retries and resumes, the ranges are not at fault
+                raise requests.HTTPError(
+                    f"Range request answered with HTTP {resp.status_code}",
+                    response=resp)
+            if resp.status_code != 206 or not content_range.startswith(
+                    f"bytes {position}-{end - 1}/"):
+                raise RangeNotSupportedError(
+                    f"Range request answered with HTTP {resp.status_code}")
+            # Unbuffered, so segment positions only count bytes the OS has
+            with open(path, "r+b", buffering=0) as out:
+                out.seek(position)
+                block_hash = hashlib.sha256()
+                readinto = _body_reader(resp)
+                sizer = ChunkSizer()
+                buffer = memoryview(bytearray(sizer.maximum))
+                while True:
+                    if stop.is_set() or (cancel_event is not None and cancel_event.is_set()):
+                        return
+                    started = time.monotonic()
+                    n = readinto(buffer[:sizer.size])
+                    if not n:
+                        break
+                    if throttle is not None:
+                        throttle(n)
+                    sizer.update(n, time.monotonic() - started)
+                    view = buffer[:min(n, end - segment[1])]
+                    while view:
+                        block = segment[1] // BLOCK_SIZE
+                        block_end = min((block + 1) * BLOCK_SIZE, end)
+                        n = out.write(view[:block_end - segment[1]])
+                        block_hash.update(view[:n])
+                        if segment[1] + n == block_end:
+                            # Record the digest before the position covers it
+                            state.blocks[block] = block_hash.hexdigest()
+                            block_hash = hashlib.sha256()
+                        segment[1] += n
+                        view = view[n:]
+                    if segment[1] >= end:
+                        break
+        if segment[1] < end:
+            raise requests.ConnectionError(
+                f"Segment {segment[0]}-{end - 1} ended at byte {segment[1]}")
+
+    try:
+        with ThreadPoolExecutor(max_workers=min(len(state.segments), SEGMENT_COUNT)) as pool:
+            pending = {pool.submit(_fetch, segment) for segment in state.segments}
+            try:
+                while pending:
+                    finished, pending = wait(pending, timeout=progress_interval,
+                                             return_when=FIRST_EXCEPTION)
+                    if progress is not None:
+                        progress(state.downloaded)
+                    if persist:
+                        save_part_state(path, state)
+                    for future in finished:
+                        future.result()
+            finally:
+                stop.set()
+    finally:
+        if hash_thread is not None:
+            hash_thread.join()
+        if persist:
+            save_part_state(path, state)
+
+    if cancel_event is not None and cancel_event.is_set():
+        return False
+    if hasher is not None and hashed[0] < total_size:
+        # The hash thread failed: finish the hash here
+        _hash_in_order(path, total_size, state, hasher, stop, hashed[0])
+    with open(path, "rb+") as f:
+        os.fsync(f.fileno())
+    return True
+
+
+def _hash_in_order(path: Union[str, Path], total_size: int, state: PartState,
+                   hasher, stop: threading.Event, offset: int = 0) -> int:
+    """
+    Feed hasher the file from offset on, never past the complete prefix.
+
+    Runs beside the segment threads of download_segmented(). Once stop is
+    set, finishes the file if every segment is complete, else gives up.
+
+    Returns:
+        Offset hashed up to
+    """
+    ordered = sorted(state.segments, key=lambda seg: seg[0])
+
+    def _frontier() -> int:
+        for seg in ordered:
+            if seg[1] < seg[2]:
+                return seg[1]
+        return total_size
+
+    buffer = memoryview(bytearray(PIPELINE_BUFFER_SIZE))
+    try:
+        with open(path, "rb", buffering=0) as f:
+            while offset < total_size:
+                limit = _frontier()
+                if stop.is_set() and limit < total_size:
+                    break  # Cancelled or failed: the rest will not arrive
+                if limit <= offset:
+                    stop.wait(0.05)
+                    continue
+                f.seek(offset)
+                n = f.readinto(buffer[:min(len(buffer), limit - offset)])
+                if not n:
+                    break
+                hasher.update(buffer[:n])
+                offset += n
+    except OSError:
+        pass  # download_segmented() finishes the hash itself, raising if it must
+    return offset
+
+
+def state_path(part_path: Union[str, Path]) -> Path:
+    """Sidecar file of a .part file."""
+    part_path = Path(part_path)
+    return part_path.with_name(f"{part_path.name}.json")
+
+
+def load_part_state(part_path: Union[str, Path]) -> Optional[PartState]:
+    """The saved PartState of a .part file, or None if missing or unreadable."""
+    try:
+        with open(state_path(part_path), "r", encoding="utf-8") as f:
+            data = json.load(f)
+        return PartState(url=data["url"], size=int(data["size"]),
+                         etag=data.get("etag", ""),
+                         segments=[[int(v) for v in seg] for seg in data["segments"]],
+                         blocks=[str(digest) for digest in data.get("blocks", [])])
+    except (OSError, ValueError, KeyError, TypeError):
+        return None
+
+
+def save_part_state(part_path: Union[str, Path], state: PartState):
+    """Atomically write the sidecar of a .part file."""
+    path = state_path(part_path)
+    tmp = path.with_name(f"{path.name}.tmp")
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(asdict(state), f)
+    os.replace(tmp, path)
+
+
+def resume_state(part_path: Union[str, Path], url: str, size: int,
+                 etag: str = "") -> PartState:
+    """
+    PartState to continue a download from.
+
+    Returns the saved state if the .part file is a partial copy of the same
+    remote file (same URL, size and, when both are known, ETag); otherwise
+    a fresh state, so the download starts over. The last blocks of each
+    segment are checked against the manifest first, and segments are
+    rewound past any that an interrupted write left incomplete.
+
+    Args:
+        part_path: .part file of the download
+        url: Download URL, without credentials
+        size: File size from Content-Length
+        etag: ETag response header, if any
+    """
+    state = load_part_state(part_path)
+    try:
+        part_size = os.path.getsize(part_path)
+    except OSError:
+        part_size = -1
+    if state is not None and state.segments and state.matches(url, size, etag) \
+            and part_size == size and len(state.blocks) == _block_count(size):
+        try:
+            _verify_tail_blocks(part_path, state)
+            return state
+        except OSError:
+            pass
+    return PartState(url=url, size=size, etag=etag)
+
+
+def reopen_corrupt_blocks(part_path: Union[str, Path], state: PartState) -> int:
+    """
+    Check every downloaded block of a .part file against its manifest.
+
+    Blocks whose data on disk differs from what was received are marked
+    for refetching, so passing state to download_segmented() again
+    downloads only those blocks.
+
+    Returns:
+        Number of blocks to refetch (0 if the file matches the manifest:
+        the server sent data that is wrong as a whole)
+    """
+    corrupt = []
+    with open(part_path, "rb") as f:
+        for block, digest in enumerate(state.blocks):
+            if digest and not _block_matches(f, block, state):
+                corrupt.append(block)
+    for block in corrupt:
+        state.blocks[block] = ""
+        _reopen_block(state, block)
+    if corrupt:
+        save_part_state(part_path, state)
+    return len(corrupt)
+
+
+def discard_part(part_path: Union[str, Path]):
+    """Delete a .part file and its sidecar (missing files are ignored)."""
+    for path in (Path(part_path), state_path(part_path)):
+        try:
+            path.unlink()
+        except OSError:
+            pass
+
+
+def preallocate(fd: int, size: int) -> bool:
+    """
+    Reserve size bytes of disk blocks for an open file.
+
+    Uses fallocate(2) directly rather than posix_fallocate, which glibc
+    emulates by writing zeros on filesystems without support (doubling
+    the I/O on e.g. NFS). Elsewhere this is a no-op.
+
+    Returns:
+        True if the space was allocated (the file is now size bytes long)
+    """
+    fallocate = _libc_fallocate()
+    if fallocate is None:
+        return False
+    if fallocate(fd, 0, ctypes.c_int64(0), ctypes.c_int64(size)) == 0:
+        return True
+    err = ctypes.get_errno()
+    if err == errno.ENOSPC:
+        raise OSError(err, os.strerror(err))
+    return False  # EOPNOTSUPP, EINVAL, ...: write without preallocation
+
+
+_fallocate = None
+
+
+def _libc_fallocate():
+    """libc fallocate() on Linux, else None."""
+    global _fallocate
+    if _fallocate is None:
+        _fallocate = False
+        if sys.platform.startswith("linux"):
+            try:
+                libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6",
+                                   use_errno=True)
+                func = libc.fallocate64
+                func.argtypes = [ctypes.c_int, ctypes.c_int, ctypes.c_int64, ctypes.c_int64]
+                func.restype = ctypes.c_int
+                _fallocate = func
+            except (OSError, AttributeError):
+                pass
+    return _fallocate or None
+
+
+def _split_ranges(total_size: int, segments: int) -> List[Tuple[int, int]]:
+    """[start, end) byte ranges splitting total_size into block-aligned segments."""
+    step = -(-_block_count(total_size) // max(1, segments)) * BLOCK_SIZE
+    return [(start, min(start + step, total_size)) for start in range(0, total_size, step)]
+
+
+def _block_count(size: int) -> int:
+    return -(-size // BLOCK_SIZE)
+
+
+def _block_matches(f, block: int, state: PartState) -> bool:
+    """True if a block of the open .part file matches its manifest digest."""
+    digest = state.blocks[block]
+    if not digest:
+        return False
+    f.seek(block * BLOCK_SIZE)
+    data = f.read(min(BLOCK_SIZE, state.size - block * BLOCK_SIZE))
+    return hashlib.sha256(data).hexdigest() == digest
+
+
+def _verify_tail_blocks(part_path: Union[str, Path], state: PartState):
+    """
+    Rewind each segment past trailing blocks that fail their digest.
+
+    Data reaches the disk in order, so once the last block of a segment
+    verifies, the blocks before it are taken as intact.
+    """
+    with open(part_path, "rb") as f:
+        for segment in state.segments:
+            start, position, end = segment
+            if position < end:
+                position = max(start, position // BLOCK_SIZE * BLOCK_SIZE)
+            while position > start:
+                block = (position - 1) // BLOCK_SIZE
+                if _block_matches(f, block, state):
+                    break
+                state.blocks[block] = ""
+                position = max(start, block * BLOCK_SIZE)
+            segment[1] = position
+
+
+def _reopen_block(state: PartState, block: int):
+    """Split the segment holding a downloaded block so the block is fetched again."""
+    block_start = block * BLOCK_SIZE
+    block_end = min(block_start + BLOCK_SIZE, state.size)
+    for i, (start, position, end) in enumerate(state.segments):
+        if start <= block_start < end:
+            if position <= block_start:
+                return  # Not downloaded yet
+            pieces = [[start, block_start, block_start],
+                      [block_start, block_start, block_end],
+                      [block_end, max(position, block_end), end]]
+            state.segments[i:i + 1] = [p for p in pieces if p[0] < p[2]]
+            return
+
+
+def _body_reader(response: requests.Response) -> Callable[[memoryview], int]:
+    """
+    readinto() for the body of a streamed response (0 at the end).
+
+    An unencoded body is read from http.client directly into the caller's
+    buffer; urllib3's own readinto() would allocate a bytes object per
+    call. Compressed bodies go through urllib3 to be decoded. Either way
+    a body that ends short of its Content-Length raises, as urllib3 would.
+    """
+    raw = response.raw
+    encoding = response.headers.get("Content-Encoding", "identity").lower()
+    fp = getattr(raw, "_fp", None)
+    if encoding in ("", "identity") and hasattr(fp, "readinto"):
+        def read(view: memoryview) -> int:
+            n = fp.readinto(view)
+            # http.client returns 0 on an early EOF, leaving length > 0
+            if not n and view and fp.length:
+                raise http.client.IncompleteRead(b"", fp.length)
+            return n
+    else:
+        def read(view: memoryview) -> int:
+            data = raw.read(len(view), decode_content=True)
+            view[:len(data)] = data
+            return len(data)
+
+    def readinto(view: memoryview) -> int:
+        try:
+            return read(view)
+        except (http.client.HTTPException, OSError, urllib3.exceptions.HTTPError) as e:
+            raise requests.ConnectionError(e) from e
+
+    return readinto
@@ -0,0 +1,360 @@
+"""
+Model Hash Index
+
+Persistent SQLite index of local model files keyed by content hash
+(SHA256, AutoV2, AutoV1, CRC32), so a model version can be matched to a
+local file even after it was renamed or moved.
+
+The index is maintained incrementally: a refresh only stats files, and a
+file is (re)hashed only when its size, mtime or inode changed. Hashing is
+done lazily — by default only for files whose size matches the model
+being looked up — so a first refresh over a large library stays cheap.
+"""
+
+import os
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Set, Union
+
+from civitai_utils.hashing import HashStats, hash_files
+
+# File extensions considered model files (also ModelManager.MODEL_EXTENSIONS)
+MODEL_EXTENSIONS = (".safetensors", ".ckpt", ".pt", ".pth")
+
+# Minimum seconds between two stat walks of the same root
+REFRESH_INTERVAL = 60.0
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS files (
+    path        TEXT PRIMARY KEY,
+    root        TEXT NOT NULL,
+    size        INTEGER NOT NULL,
+    mtime_ns    INTEGER NOT NULL,
+    inode       INTEGER NOT NULL,
+    sha256      TEXT,
+    autov1      TEXT,
+    crc32       TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_files_root ON files (root);
+CREATE INDEX IF NOT EXISTS idx_files_sha256 ON files (sha256);
+CREATE INDEX IF NOT EXISTS idx_files_autov1 ON files (autov1);
+CREATE INDEX IF NOT EXISTS idx_files_crc32 ON files (crc32);
+CREATE INDEX IF NOT EXISTS idx_files_size ON files (size);
+"""
+
+
+class HashIndex:
+    """
+    Content-hash index over one or more model directories.
+    """
+
+    def __init__(self, db_path: Union[str, Path]):
+        """
+        Open (or create) a hash index database.
+
+        Args:
+            db_path: Path to the SQLite index file
+        """
+        self.db_path = Path(db_path)
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.RLock()
+        self._conn = sqlite3.connect(str(self.db_path), check_same_thread=False)
+        self._conn.executescript(_SCHEMA)
+        self._last_refresh: Dict[str, float] = {}
+
+    def close(self):
+        """Close the underlying database connection."""
+        with self._lock:
+            self._conn.close()
+
+    def refresh(self, root: Union[str, Path], force: bool = False) -> Dict[str, int]:
+        """
+        Sync the index with the model files under a directory.
+
+        Only stats files. New or changed files are recorded without hashes
+        (hashed later on demand); files that merely moved keep their hashes
+        when their inode, size and mtime match a vanished entry.
+
+        Args:
+            root: Directory to scan recursively
+            force: Rescan even if the root was scanned within REFRESH_INTERVAL
+
+        Returns:
+            Dict with "scanned", "changed" and "removed" counts
+        """
+        root = str(Path(root))
+        stats = {"scanned": 0, "changed": 0, "removed": 0}
+
+        with self._lock:
+            last = self._last_refresh.get(root)
+            if not force and last is not None and time.monotonic() - last < REFRESH_INTERVAL:
+                return stats
+
+            known = {
+                row[0]: row[1:]
+                for row in self._conn.execute(
+                    "SELECT path, size, mtime_ns, inode, sha256, autov1, crc32 "
+                    "FROM files WHERE root = ?", (root,)
+                )
+            }
+            # Hashes of vanished or changed entries, keyed by file identity,
+            # so renamed/moved files are not rehashed
+            by_identity = {
+                (size, mtime_ns, inode): (sha256, autov1, crc32)
+                for size, mtime_ns, inode, sha256, autov1, crc32 in known.values()
+                if sha256
+            }
+
+            seen = set()
+            upserts = []
+            for path, st in _walk_model_files(root):
+                stats["scanned"] += 1
+                seen.add(path)
+                identity = (st.st_size, st.st_mtime_ns, st.st_ino)
+                entry = known.get(path)
+                if entry is not None and tuple(entry[:3]) == identity:
+                    continue
+                hashes = by_identity.get(identity, (None, None, None))
+                upserts.append((path, root, *identity, *hashes))
+
+            removed = [p for p in known if p not in seen]
+            with self._conn:
+                self._conn.executemany(
+                    "INSERT OR REPLACE INTO files "
+                    "(path, root, size, mtime_ns, inode, sha256, autov1, crc32) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                    upserts,
+                )
+                self._conn.executemany(
+                    "DELETE FROM files WHERE path = ?", [(p,) for p in removed]
+                )
+
+            stats["changed"] = len(upserts)
+            stats["removed"] = len(removed)
+            self._last_refresh[root] = time.monotonic()
+        return stats
+
+    def invalidate(self, root: Optional[Union[str, Path]] = None):
+        """
+        Force the next refresh of a root (or of all roots) to rescan.
+
+        Call after adding or removing files under the root.
+        """
+        with self._lock:
+            if root is None:
+                self._last_refresh.clear()
+            else:
+                self._last_refresh.pop(str(Path(root)), None)
+
+    def touch(self, path: Union[str, Path]):
+        """
+        Record a file's new size/mtime/inode but keep its hashes.
+
+        Call after replacing a file by an identical copy (e.g. a link into
+        the content store), so the next refresh does not rehash it.
+        """
+        path = str(Path(path))
+        try:
+            st = os.stat(path)
+        except OSError:
+            return
+        with self._lock, self._conn:
+            self._conn.execute(
+                "UPDATE files SET size = ?, mtime_ns = ?, inode = ? WHERE path = ?",
+                (st.st_size, st.st_mtime_ns, st.st_ino, path),
+            )
+
+    def entries(self, roots: Optional[Iterable[Union[str, Path]]] = None) -> List[tuple]:
+        """
+        List hashed files as (path, size, sha256) tuples.
+
+        Args:
+            roots: Limit to files under these roots (default: all roots)
+        """
+        query = "SELECT path, size, sha256 FROM files WHERE sha256 IS NOT NULL"
+        params: list = []
+        if roots is not None:
+            root_list = [str(Path(r)) for r in roots]
+            query += f" AND root IN ({','.join('?' * len(root_list))})"
+            params.extend(root_list)
+        with self._lock:
+            return self._conn.execute(query + " ORDER BY path", params).fetchall()
+
+    def unhashed_sizes(self, roots: Optional[Iterable[Union[str, Path]]] = None) -> Set[int]:
+        """
+        Sizes of indexed files that have no hashes yet.
+
+        Args:
+            roots: Limit to files under these roots (default: all roots)
+        """
+        query = "SELECT DISTINCT size FROM files WHERE sha256 IS NULL"
+        params: list = []
+        if roots is not None:
+            root_list = [str(Path(r)) for r in roots]
+            query += f" AND root IN ({','.join('?' * len(root_list))})"
+            params.extend(root_list)
+        with self._lock:
+            return {row[0] for row in self._conn.execute(query, params)}
+
+    def hash_pending(self, roots: Optional[Iterable[Union[str, Path]]] = None,
+                     size_kb: Optional[float] = None,
+                     workers: Optional[int] = None,
+                     use_processes: bool = False) -> HashStats:
+        """
+        Hash indexed files that have no hashes yet, in parallel.
+
+        Args:
+            roots: Limit to files under these roots (default: all roots)
+            size_kb: Limit to files of this size in KB (Civitai's sizeKB),
+                     within 1 KB
+            workers: Hash worker count (default: sized to CPUs and disks)
+            use_processes: Hash in a process pool instead of threads
+
+        Returns:
+            HashStats for the files hashed
+        """
+        query = "SELECT path, size, mtime_ns, inode FROM files WHERE sha256 IS NULL"
+        params: list = []
+        if roots is not None:
+            root_list = [str(Path(r)) for r in roots]
+            query += f" AND root IN ({','.join('?' * len(root_list))})"
+            params.extend(root_list)
+        if size_kb is not None:
+            query += " AND size BETWEEN ? AND ?"
+            params.extend([int((size_kb - 1) * 1024), int((size_kb + 1) * 1024)])
+
+        with self._lock:
+            pending = {row[0]: row[1:] for row in self._conn.execute(query, params)}
+
+        def _store(path: str, hashes: Dict[str, str]):
+            size, mtime_ns, inode = pending[path]
+            with self._lock, self._conn:
+                # Only store if the file was not modified meanwhile
+                self._conn.execute(
+                    "UPDATE files SET sha256 = ?, autov1 = ?, crc32 = ? "
+                    "WHERE path = ? AND size = ? AND mtime_ns = ? AND inode = ?",
+                    (hashes["SHA256"], hashes["AutoV1"], hashes["CRC32"],
+                     path, size, mtime_ns, inode),
+                )
+
+        return hash_files(pending, workers=workers, use_processes=use_processes,
+                          on_result=_store)
+
+    def lookup(self, file_hash: str,
+               roots: Optional[Iterable[Union[str, Path]]] = None,
+               size_kb: Optional[float] = None) -> List[Path]:
+        """
+        Find indexed files matching a hash.
+
+        Full SHA256 hashes match exactly; shorter hashes match as a SHA256
+        prefix (AutoV2 and other short forms) or exactly against AutoV1/CRC32.
+
+        Args:
+            file_hash: Hash string (case-insensitive)
+            roots: Limit to files under these roots (default: all roots)
+            size_kb: Limit to files of this size in KB, within 1 KB
+
+        Returns:
+            Paths of matching files that still exist
+        """
+        value = file_hash.strip().upper()
+        if not value:
+            return []
+
+        if len(value) == 64:
+            where, params = "sha256 = ?", [value]
+        else:
+            # "G" sorts after every hex digit, so this is a prefix range scan
+            where = "(sha256 >= ? AND sha256 < ?) OR autov1 = ? OR crc32 = ?"
+            params = [value, value + "G", value, value]
+
+        query = f"SELECT path FROM files WHERE ({where})"
+        if roots is not None:
+            root_list = [str(Path(r)) for r in roots]
+            query += f" AND root IN ({','.join('?' * len(root_list))})"
+            params.extend(root_list)
+        if size_kb is not None:
+            query += " AND size BETWEEN ? AND ?"
+            params.extend([int((size_kb - 1) * 1024), int((size_kb + 1) * 1024)])
+
+        with self._lock:
+            rows = self._conn.execute(query, params).fetchall()
+        return [Path(row[0]) for row in rows if os.path.exists(row[0])]
+
+    def find(self, hashes: Dict[str, str], roots: Iterable[Union[str, Path]],
+             size_kb: Optional[float] = None) -> Optional[Path]:
+        """
+        Find a local file matching any of a model file's Civitai hashes.
+
+        Refreshes the given roots, hashes unhashed files of a matching size,
+        then looks up the SHA256. Only without one do the weaker hashes
+        count, and then only for a file of size_kb: AutoV1 covers a small
+        window of the file, so unrelated merges can share it.
+
+        Args:
+            hashes: Civitai "hashes" dict of the file (SHA256, AutoV2, ...)
+            roots: Model directories to search
+            size_kb: Expected file size in KB; limits which files get hashed
+                     (without it every unhashed file under roots is hashed)
+                     and is required to match without a SHA256
+
+        Returns:
+            Path to a matching file, or None
+        """
+        roots = [Path(r) for r in roots if Path(r).is_dir()]
+        if not roots or not hashes:
+            return None
+
+        for root in roots:
+            self.refresh(root)
+        self.hash_pending(roots, size_kb=size_kb)
+
+        if hashes.get("SHA256"):
+            matches = self.lookup(hashes["SHA256"], roots)
+            return matches[0] if matches else None
+        if size_kb is None:
+            return None
+        for key in ("AutoV2", "AutoV1", "CRC32"):
+            value = hashes.get(key)
+            if value:
+                matches = self.lookup(value, roots, size_kb=size_kb)
+                if matches:
+                    return matches[0]
+        return None
+
+
+def _walk_model_files(root: str):
+    """
+    Yield (path, stat_result) for every model file under root, recursively.
+
+    Symlinked directories are followed, each directory at most once, so
+    a symlink loop cannot recurse forever.
+    """
+    try:
+        st = os.stat(root)
+    except OSError:
+        return
+    seen = {(st.st_dev, st.st_ino)}
+    stack = [root]
+    while stack:
+        current = stack.pop()
+        try:
+            with os.scandir(current) as it:
+                for entry in it:
+                    try:
+                        if entry.is_dir(follow_symlinks=True):
+                            # Skip hidden dirs (including our own state dir)
+                            if entry.name.startswith("."):
+                                continue
+                            st = entry.stat(follow_symlinks=True)
+                            if (st.st_dev, st.st_ino) not in seen:
+                                seen.add((st.st_dev, st.st_ino))
+                                stack.append(entry.path)
+                        elif entry.name.lower().endswith(MODEL_EXTENSIONS):
+                            yield entry.path, entry.stat(follow_symlinks=True)
+                    except OSError:
+                        continue
+        except OSError:
+            continue
@@ -0,0 +1,168 @@
+"""
+Model File Hashing
+
+Computes the file hashes Civitai publishes for model files, so local files
+can be matched against resolved model versions:
+
+    SHA256  full-file SHA256 (hex, uppercase)
+    AutoV2  first 10 hex chars of SHA256
+    AutoV1  first 8 hex chars of SHA256 over 64 KB at offset 1 MB
+            (the legacy A1111 model hash)
+    CRC32   full-file CRC32 (8 hex chars, uppercase)
+
+All hashes are computed in one sequential pass per file, reading into a
+single large reused buffer. hash_files() spreads many files over a worker
+pool sized to the CPU count and the number of disks involved; hashlib and
+zlib release the GIL on large buffers, so threads scale like processes
+without forking the host process (important inside ComfyUI).
+"""
+
+import hashlib
+import os
+import time
+import zlib
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Callable, Dict, Iterable, Optional, Union
+
+HASH_BUFFER_SIZE = 8 * 1024 * 1024  # 8 MB
+
+# Concurrent hash workers per physical device (st_dev)
+WORKERS_PER_DEVICE = 2
+
+# Legacy AutoV1 window (matches A1111's model_hash())
+AUTOV1_OFFSET = 0x100000
+AUTOV1_LENGTH = 0x10000
+
+
+@dataclass
+class HashStats:
+    """Throughput summary of a hash_files() run."""
+    files: int = 0
+    bytes: int = 0
+    errors: int = 0
+    seconds: float = 0.0
+
+    @property
+    def mb_per_second(self) -> float:
+        """Aggregate hashing throughput in MB/s."""
+        if self.seconds <= 0:
+            return 0.0
+        return self.bytes / (1024 * 1024) / self.seconds
+
+
+def hash_file(path: Union[str, Path],
+              buffer_size: int = HASH_BUFFER_SIZE) -> Dict[str, str]:
+    """
+    Compute SHA256, AutoV2, AutoV1 and CRC32 for a file in a single pass.
+
+    Args:
+        path: File to hash
+        buffer_size: Read buffer size in bytes
+
+    Returns:
+        Dict with "SHA256", "AutoV2", "AutoV1" and "CRC32" keys
+    """
+    sha256 = hashlib.sha256()
+    autov1 = hashlib.sha256()
+    crc = 0
+    offset = 0
+    buf = bytearray(buffer_size)
+    view = memoryview(buf)
+
+    with open(path, "rb", buffering=0) as f:
+        if hasattr(os, "posix_fadvise"):
+            try:
+                os.posix_fadvise(f.fileno(), 0, 0, os.POSIX_FADV_SEQUENTIAL)
+            except OSError:
+                pass
+        while True:
+            n = f.readinto(buf)
+            if not n:
+                break
+            block = view[:n]
+            sha256.update(block)
+            crc = zlib.crc32(block, crc)
+            _update_autov1(autov1, block, offset)
+            offset += n
+
+    digest = sha256.hexdigest().upper()
+    return {
+        "SHA256": digest,
+        "AutoV2": digest[:10],
+        "AutoV1": autov1.hexdigest()[:8].upper(),
+        "CRC32": f"{crc:08X}",
+    }
+
+
+def hash_files(
+    paths: Iterable[Union[str, Path]],
+    workers: Optional[int] = None,
+    use_processes: bool = False,
+    on_result: Optional[Callable[[str, Dict[str, str]], None]] = None,
+) -> HashStats:
+    """
+    Hash many files in parallel.
+
+    Args:
+        paths: Files to hash
+        workers: Pool size (default: default_workers(paths))
+        use_processes: Use a process pool instead of threads (for CLI use;
+                       avoid inside ComfyUI, which must not be forked)
+        on_result: Called as on_result(path, hashes) in the calling thread
+                   as each file completes; files that fail to read are
+                   counted in HashStats.errors and skipped
+
+    Returns:
+        HashStats with file count, bytes hashed and elapsed time
+    """
+    paths = [str(p) for p in paths]
+    stats = HashStats()
+    if not paths:
+        return stats
+
+    if workers is None:
+        workers = default_workers(paths)
+    executor_cls = ProcessPoolExecutor if use_processes else ThreadPoolExecutor
+
+    start = time.monotonic()
+    with executor_cls(max_workers=workers) as pool:
+        futures = {pool.submit(hash_file, p): p for p in paths}
+        for future in as_completed(futures):
+            path = futures[future]
+            try:
+                hashes = future.result()
+                size = os.path.getsize(path)
+            except OSError:
+                stats.errors += 1
+                continue
+            stats.files += 1
+            stats.bytes += size
+            if on_result is not None:
+                on_result(path, hashes)
+    stats.seconds = time.monotonic() - start
+    return stats
+
+
+def default_workers(paths: Iterable[Union[str, Path]]) -> int:
+    """
+    Size a hash worker pool to the CPU count and the number of distinct
+    devices the files live on (more readers than that just seek-thrash).
+    """
+    devices = set()
+    for p in paths:
+        try:
+            devices.add(os.stat(p).st_dev)
+        except OSError:
+            continue
+    per_disk = max(1, len(devices)) * WORKERS_PER_DEVICE
+    return max(1, min(os.cpu_count() or 1, per_disk))
+
+
+def _update_autov1(autov1, block, offset: int):
+    """Feed the part of block that overlaps the AutoV1 window into autov1."""
+    start = max(AUTOV1_OFFSET, offset)
+    end = min(AUTOV1_OFFSET + AUTOV1_LENGTH, offset + len(block))
+    if start < end:
+        autov1.update(block[start - offset:end - offset])
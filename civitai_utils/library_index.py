@@ -0,0 +1,367 @@
+"""
+Model Library Index
+
+In-memory filename -> path index of model directories, replacing a
+recursive directory walk per lookup.
+
+Each root is walked once with os.scandir. After that, refreshes are
+incremental: every known directory is stat'ed and only directories whose
+mtime changed (entries added, removed or renamed) are listed again. Full
+rescans happen at most once per refresh interval; in between, a lookup
+miss triggers an incremental refresh (at most once per MISS_REFRESH_INTERVAL)
+and a hit is confirmed with a single stat, so results stay fresh.
+
+scan() lists model files with size and mtime from the same snapshots;
+file stats are cached per directory and results per extension set, both
+dropped automatically when the directory or root changes.
+
+Roots kept current by a LibraryWatcher are marked as watched; their
+lookups are answered from memory without any filesystem access.
+
+Every detected change bumps the root's generation, which callers use to
+invalidate results derived from the library (see ResolutionCache).
+"""
+
+import os
+import threading
+import time
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple, Union
+
+# Seconds between full rescans of a root
+REFRESH_INTERVAL = 300.0
+
+# Minimum seconds between incremental refreshes triggered by lookup misses
+MISS_REFRESH_INTERVAL = 2.0
+
+
+@dataclass(frozen=True)
+class ModelRecord:
+    """One model file listed by ModelLibraryIndex.scan()."""
+    name: str
+    relative_path: str
+    size: int
+    mtime: float
+    root: str
+
+    @property
+    def path(self) -> Path:
+        """Full path of the file."""
+        return Path(self.root) / self.relative_path
+
+
+@dataclass
+class _DirState:
+    """Snapshot of one directory's direct entries."""
+    mtime_ns: int
+    # (st_dev, st_ino), so a directory reached twice via symlinks is listed once
+    identity: Tuple[int, int] = (0, 0)
+    files: List[str] = field(default_factory=list)
+    subdirs: List[str] = field(default_factory=list)
+    # name -> (size, mtime), filled lazily by scan()
+    stats: Dict[str, Tuple[int, float]] = field(default_factory=dict, compare=False)
+
+
+@dataclass
+class _RootState:
+    """Snapshot of one model root."""
+    dirs: Dict[str, _DirState] = field(default_factory=dict)
+    by_name: Dict[str, str] = field(default_factory=dict)
+    generation: int = 0
+    full_scan_at: float = 0.0
+    refreshed_at: float = 0.0
+    stale: bool = True
+    watched: bool = False
+    # extensions -> (generation, records), filled by scan()
+    scans: Dict[tuple, tuple] = field(default_factory=dict)
+
+
+class ModelLibraryIndex:
+    """
+    Filename index over one or more model directories.
+    """
+
+    def __init__(self, refresh_interval: float = REFRESH_INTERVAL):
+        """
+        Args:
+            refresh_interval: Seconds between full rescans of a root
+        """
+        self.refresh_interval = refresh_interval
+        self._roots: Dict[str, _RootState] = {}
+        self._lock = threading.RLock()
+
+    def find(self, filename: str, roots: Iterable[Union[str, Path]]) -> Optional[Path]:
+        """
+        Find a model file by filename under any of the given roots.
+
+        Args:
+            filename: Bare filename, or a path relative to a root
+            roots: Model directories to search, in priority order
+
+        Returns:
+            Path to the file, or None if not found
+        """
+        roots = [str(Path(r)) for r in roots]
+        # Relative paths (e.g. "sdxl/foo.safetensors") need no index
+        if "/" in filename or os.sep in filename:
+            for root in roots:
+                candidate = Path(root) / filename
+                if candidate.is_file():
+                    return candidate
+            return None
+
+        path = self._find_indexed(filename, roots)
+        if path is None and self._refresh_on_miss(roots):
+            path = self._find_indexed(filename, roots)
+        return Path(path) if path else None
+
+    def scan(self, roots: Iterable[Union[str, Path]],
+             extensions: Iterable[str]) -> List[ModelRecord]:
+        """
+        List the model files under the given roots in one pass per root.
+
+        Results are cached per root and extension set until the root's
+        generation changes.
+
+        Args:
+            roots: Model directories to list
+            extensions: File extensions to include (e.g. ".safetensors")
+
+        Returns:
+            ModelRecords sorted by root, then relative path
+        """
+        exts = tuple(sorted({e.lower() for e in extensions}))
+        records: List[ModelRecord] = []
+        for root in roots:
+            records.extend(self._scan_root(str(Path(root)), exts))
+        return records
+
+    def refresh(self, root: Union[str, Path], full: bool = False) -> bool:
+        """
+        Bring a root's snapshot up to date.
+
+        Args:
+            root: Model directory
+            full: Relist every directory instead of only changed ones
+
+        Returns:
+            True if any change was detected
+        """
+        root = str(Path(root))
+        with self._lock:
+            state = self._roots.setdefault(root, _RootState())
+            now = time.monotonic()
+            if full or not state.dirs:
+                old_dirs = state.dirs
+                state.dirs = {}
+                self._scan_tree(state, root)
+                changed = state.dirs != old_dirs
+                state.full_scan_at = now
+            else:
+                changed = self._refresh_changed_dirs(state)
+
+            if changed:
+                state.by_name = {}
+                for dir_path in sorted(state.dirs):
+                    for name in state.dirs[dir_path].files:
+                        state.by_name.setdefault(name, os.path.join(dir_path, name))
+                state.generation += 1
+            state.refreshed_at = now
+            state.stale = False
+            return changed
+
+    def invalidate(self, root: Optional[Union[str, Path]] = None):
+        """
+        Mark a root (or all roots) as changed.
+
+        Bumps the generation immediately and resyncs on the next lookup.
+        Call after adding or removing files under the root.
+        """
+        with self._lock:
+            if root is None:
+                states = list(self._roots.values())
+            else:
+                states = [self._roots.setdefault(str(Path(root)), _RootState())]
+            for state in states:
+                state.stale = True
+                state.generation += 1
+
+    def set_watched(self, root: Union[str, Path], watched: bool):
+        """
+        Mark a root as kept current by a watcher (see LibraryWatcher).
+
+        Lookups in watched roots trust the snapshot instead of refreshing
+        on misses and re-checking hits.
+        """
+        with self._lock:
+            self._roots.setdefault(str(Path(root)), _RootState()).watched = watched
+
+    def generation(self, roots: Iterable[Union[str, Path]]) -> int:
+        """
+        Combined change counter of the given roots.
+
+        Any file added or removed under one of them (once detected or
+        reported via invalidate()) yields a different value.
+        """
+        with self._lock:
+            return sum(
+                self._roots.setdefault(str(Path(r)), _RootState()).generation
+                for r in roots
+            )
+
+    def _find_indexed(self, filename: str, roots: List[str]) -> Optional[str]:
+        """Look up a filename in the snapshots of the given roots."""
+        for root in roots:
+            path = self._lookup(root, filename)
+            if path is not None and not self._roots[root].watched and \
+                    not os.path.exists(path):
+                # Deleted behind our back: resync this root
+                self.refresh(root)
+                path = self._lookup(root, filename)
+            if path is not None:
+                return path
+        return None
+
+    def _lookup(self, root: str, filename: str) -> Optional[str]:
+        """Look up a filename in a root's snapshot, refreshing it if due."""
+        with self._lock:
+            self._ensure_fresh(root)
+            return self._roots[root].by_name.get(filename)
+
+    def _scan_root(self, root: str, exts: tuple) -> List[ModelRecord]:
+        """List one root's model files, from cache when unchanged."""
+        with self._lock:
+            self._ensure_fresh(root, max_age=MISS_REFRESH_INTERVAL)
+            state = self._roots[root]
+            cached = state.scans.get(exts)
+            if cached is not None and cached[0] == state.generation:
+                return cached[1]
+
+            records = []
+            for dir_path in sorted(state.dirs):
+                dir_state = state.dirs[dir_path]
+                rel_dir = os.path.relpath(dir_path, root)
+                for name in sorted(dir_state.files):
+                    if not name.lower().endswith(exts):
+                        continue
+                    st = dir_state.stats.get(name)
+                    if st is None:
+                        try:
+                            raw = os.stat(os.path.join(dir_path, name))
+                        except OSError:
+                            continue
+                        st = dir_state.stats[name] = (raw.st_size, raw.st_mtime)
+                    rel = name if rel_dir == "." else os.path.join(rel_dir, name)
+                    records.append(ModelRecord(
+                        name=name,
+                        relative_path=Path(rel).as_posix(),
+                        size=st[0],
+                        mtime=st[1],
+                        root=root,
+                    ))
+            state.scans[exts] = (state.generation, records)
+            return records
+
+    def _ensure_fresh(self, root: str, max_age: Optional[float] = None):
+        """
+        Refresh a root if due: fully when never scanned or past the refresh
+        interval, incrementally when invalidated or (for unwatched roots)
+        not refreshed within max_age seconds.
+        """
+        state = self._roots.get(root)
+        now = time.monotonic()
+        if state is None or not state.dirs or now - state.full_scan_at >= self.refresh_interval:
+            self.refresh(root, full=True)
+        elif state.stale or (max_age is not None and not state.watched
+                             and now - state.refreshed_at >= max_age):
+            self.refresh(root)
+
+    def _refresh_on_miss(self, roots: List[str]) -> bool:
+        """Incrementally refresh roots not refreshed recently; True if any was."""
+        refreshed = False
+        with self._lock:
+            for root in roots:
+                state = self._roots.get(root)
+                if state is not None and state.watched:
+                    continue
+                if state is None or time.monotonic() - state.refreshed_at >= MISS_REFRESH_INTERVAL:
+                    self.refresh(root)
+                    refreshed = True
+        return refreshed
+
+    def _scan_tree(self, state: _RootState, top: str):
+        """
+        List top and every directory below it into state.dirs.
+
+        Symlinked directories are followed, each directory at most once,
+        so a symlink loop cannot recurse forever.
+        """
+        seen = {d.identity for d in state.dirs.values()}
+        stack = [top]
+        while stack:
+            dir_path = stack.pop()
+            dir_state = _list_dir(dir_path)
+            if dir_state is None or dir_state.identity in seen:
+                continue
+            seen.add(dir_state.identity)
+            state.dirs[dir_path] = dir_state
+            stack.extend(os.path.join(dir_path, d) for d in dir_state.subdirs)
+
+    def _refresh_changed_dirs(self, state: _RootState) -> bool:
+        """Relist only directories whose mtime changed; True on any change."""
+        changed = False
+        for dir_path in list(state.dirs):
+            old = state.dirs.get(dir_path)
+            if old is None:
+                continue  # Dropped together with a removed parent
+            try:
+                mtime_ns = os.stat(dir_path).st_mtime_ns
+            except OSError:
+                mtime_ns = None
+            if mtime_ns == old.mtime_ns:
+                continue
+
+            changed = True
+            new = _list_dir(dir_path) if mtime_ns is not None else None
+            new_subdirs = set(new.subdirs) if new else set()
+            # Forget subtrees that vanished, scan subtrees that appeared;
+            # unchanged subdirectories are checked by their own mtime
+            for name in set(old.subdirs) - new_subdirs:
+                self._drop_tree(state, os.path.join(dir_path, name))
+            if new is None:
+                del state.dirs[dir_path]
+                continue
+            state.dirs[dir_path] = new
+            for name in new_subdirs - set(old.subdirs):
+                self._scan_tree(state, os.path.join(dir_path, name))
+        return changed
+
+    @staticmethod
+    def _drop_tree(state: _RootState, top: str):
+        """Remove a directory and everything below it from state.dirs."""
+        prefix = top + os.sep
+        for known in [d for d in state.dirs if d == top or d.startswith(prefix)]:
+            del state.dirs[known]
+
+
+def _list_dir(dir_path: str) -> Optional[_DirState]:
+    """List a directory's files and (non-hidden) subdirectories."""
+    try:
+        st = os.stat(dir_path)
+        files, subdirs = [], []
+        with os.scandir(dir_path) as it:
+            for entry in it:
+                try:
+                    if entry.is_dir(follow_symlinks=True):
+                        # Skip hidden dirs (including our own state dir)
+                        if not entry.name.startswith("."):
+                            subdirs.append(entry.name)
+                    else:
+                        files.append(entry.name)
+                except OSError:
+                    continue
+        return _DirState(mtime_ns=st.st_mtime_ns, identity=(st.st_dev, st.st_ino),
+                         files=files, subdirs=subdirs)
+    except OSError:
+        return None
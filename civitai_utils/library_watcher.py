@@ -0,0 +1,301 @@
+"""
+Model Library Watcher
+
+Keeps a ModelLibraryIndex current in the background, so lookups need no
+filesystem access at all and still see files added or removed outside the
+extension (rsync, another node, manual copies).
+
+On Linux, local filesystems are watched with inotify (via ctypes, no extra
+dependency); network filesystems — where inotify does not see remote
+changes — and other platforms fall back to periodic incremental polling.
+Bursts of events (e.g. a bulk copy) are debounced into one refresh per
+root once the burst has been quiet for a moment.
+"""
+
+import ctypes
+import ctypes.util
+import logging
+import os
+import select
+import struct
+import sys
+import threading
+import time
+from pathlib import Path
+from typing import Callable, Dict, Iterable, Optional, Set, Union
+
+from civitai_utils.library_index import ModelLibraryIndex
+
+logger = logging.getLogger("civitai_alchemist.watcher")
+
+# Seconds a root must be quiet before pending events are applied
+DEBOUNCE_SECONDS = 1.0
+# Apply pending events after this long even if the burst continues
+MAX_DELAY_SECONDS = 10.0
+# Seconds between incremental refreshes in polling mode
+POLL_INTERVAL = 15.0
+
+# Filesystems where inotify misses changes made by other hosts
+_NETWORK_FS_TYPES = {"nfs", "nfs4", "cifs", "smb3", "smbfs", "fuse.sshfs",
+                     "9p", "fuse.rclone", "ceph", "glusterfs", "lustre"}
+
+# inotify constants (linux/inotify.h)
+_IN_CLOSE_WRITE = 0x00000008
+_IN_MOVED_FROM = 0x00000040
+_IN_MOVED_TO = 0x00000080
+_IN_CREATE = 0x00000100
+_IN_DELETE = 0x00000200
+_IN_DELETE_SELF = 0x00000400
+_IN_MOVE_SELF = 0x00000800
+_IN_Q_OVERFLOW = 0x00004000
+_IN_IGNORED = 0x00008000
+_IN_ONLYDIR = 0x01000000
+_IN_ISDIR = 0x40000000
+_IN_NONBLOCK = 0o4000
+_IN_CLOEXEC = 0o2000000
+_WATCH_MASK = (_IN_CLOSE_WRITE | _IN_MOVED_FROM | _IN_MOVED_TO | _IN_CREATE |
+               _IN_DELETE | _IN_DELETE_SELF | _IN_MOVE_SELF | _IN_ONLYDIR)
+_EVENT_HEADER = struct.Struct("iIII")
+
+
+class LibraryWatcher:
+    """
+    Background thread that refreshes a ModelLibraryIndex on file changes.
+    """
+
+    def __init__(self, index: ModelLibraryIndex,
+                 roots: Iterable[Union[str, Path]],
+                 mode: str = "auto",
+                 on_change: Optional[Callable[[str], None]] = None,
+                 debounce: float = DEBOUNCE_SECONDS,
+                 poll_interval: float = POLL_INTERVAL):
+        """
+        Args:
+            index: Index to keep current
+            roots: Model directories to watch
+            mode: "auto" (inotify where it works, else polling), "inotify"
+                  or "poll"
+            on_change: Called with the root path after a refresh that
+                       found changes (runs on the watcher thread)
+            debounce: Quiet period before a burst of events is applied
+            poll_interval: Seconds between refreshes of polled roots
+        """
+        self.index = index
+        self.roots = [str(Path(r)) for r in roots]
+        self.mode = mode
+        self.on_change = on_change
+        self.debounce = debounce
+        self.poll_interval = poll_interval
+
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._inotify: Optional[_Inotify] = None
+        self._polled: Set[str] = set()
+        # root -> (first pending event time, last pending event time)
+        self._pending: Dict[str, tuple] = {}
+
+    def start(self):
+        """Start watching in a daemon thread (no-op if already running)."""
+        if self._thread is not None:
+            return
+
+        inotify_roots = []
+        for root in self.roots:
+            use_inotify = self.mode == "inotify" or (
+                self.mode == "auto" and not _is_network_fs(root)
+            )
+            if use_inotify and _Inotify.available():
+                inotify_roots.append(root)
+            else:
+                self._polled.add(root)
+
+        if inotify_roots:
+            try:
+                self._inotify = _Inotify()
+            except OSError as e:
+                logger.warning("inotify unavailable (%s), polling instead", e)
+                self._polled.update(inotify_roots)
+                inotify_roots = []
+            for root in inotify_roots:
+                if not self._inotify.watch_tree(root, root):
+                    # Watch limit reached (fs.inotify.max_user_watches)
+                    logger.warning("inotify watch limit reached, polling %s", root)
+                    self._polled.add(root)
+
+        for root in self.roots:
+            self.index.set_watched(root, True)
+
+        self._thread = threading.Thread(
+            target=self._run, name="civitai-library-watcher", daemon=True
+        )
+        self._thread.start()
+
+    def stop(self):
+        """Stop the watcher thread and release inotify resources."""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+            self._thread = None
+        if self._inotify is not None:
+            self._inotify.close()
+            self._inotify = None
+        for root in self.roots:
+            self.index.set_watched(root, False)
+
+    def _run(self):
+        # Build the snapshots up front so the first lookups are instant
+        for root in self.roots:
+            self._apply(root)
+
+        next_poll = time.monotonic() + self.poll_interval
+        while not self._stop.is_set():
+            timeout = min(self.debounce / 2, max(0.0, next_poll - time.monotonic()))
+            if self._inotify is not None:
+                for root in self._inotify.read_events(timeout):
+                    now = time.monotonic()
+                    first, _ = self._pending.get(root, (now, now))
+                    self._pending[root] = (first, now)
+            else:
+                self._stop.wait(timeout)
+
+            now = time.monotonic()
+            for root, (first, last) in list(self._pending.items()):
+                if now - last >= self.debounce or now - first >= MAX_DELAY_SECONDS:
+                    del self._pending[root]
+                    self._apply(root)
+
+            if self._polled and now >= next_poll:
+                next_poll = now + self.poll_interval
+                for root in self._polled:
+                    self._apply(root)
+
+    def _apply(self, root: str):
+        """Refresh one root and notify on changes."""
+        try:
+            changed = self.index.refresh(root)
+        except Exception as e:
+            logger.warning("Refreshing %s failed: %s", root, e)
+            return
+        if changed and self.on_change is not None:
+            try:
+                self.on_change(root)
+            except Exception as e:
+                logger.warning("Library change callback failed: %s", e)
+
+
+class _Inotify:
+    """Minimal recursive inotify wrapper (Linux only)."""
+
+    _libc = None
+
+    @classmethod
+    def available(cls) -> bool:
+        if not sys.platform.startswith("linux"):
+            return False
+        if cls._libc is None:
+            try:
+                cls._libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6",
+                                        use_errno=True)
+                cls._libc.inotify_init1
+            except (OSError, AttributeError):
+                cls._libc = False
+        return bool(cls._libc)
+
+    def __init__(self):
+        self.fd = self._libc.inotify_init1(_IN_NONBLOCK | _IN_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        # watch descriptor -> (root, directory path)
+        self._watches: Dict[int, tuple] = {}
+
+    def watch_tree(self, root: str, top: str) -> bool:
+        """
+        Watch top and all directories below it; False if out of watches.
+
+        Follows symlinked directories like the library index does, each
+        directory at most once.
+        """
+        seen = set()
+        stack = [top]
+        while stack:
+            dir_path = stack.pop()
+            try:
+                st = os.stat(dir_path)
+            except OSError:
+                continue
+            if (st.st_dev, st.st_ino) in seen:
+                continue
+            seen.add((st.st_dev, st.st_ino))
+            wd = self._libc.inotify_add_watch(self.fd, os.fsencode(dir_path), _WATCH_MASK)
+            if wd < 0:
+                if ctypes.get_errno() == 28:  # ENOSPC: watch limit
+                    return False
+                continue
+            self._watches[wd] = (root, dir_path)
+            try:
+                with os.scandir(dir_path) as it:
+                    for entry in it:
+                        if entry.is_dir(follow_symlinks=True) and not entry.name.startswith("."):
+                            stack.append(entry.path)
+            except OSError:
+                continue
+        return True
+
+    def read_events(self, timeout: float) -> Set[str]:
+        """Wait up to timeout for events; return the roots they touched."""
+        touched: Set[str] = set()
+        ready, _, _ = select.select([self.fd], [], [], timeout)
+        if not ready:
+            return touched
+        try:
+            data = os.read(self.fd, 64 * 1024)
+        except BlockingIOError:
+            return touched
+
+        offset = 0
+        while offset + _EVENT_HEADER.size <= len(data):
+            wd, mask, _cookie, name_len = _EVENT_HEADER.unpack_from(data, offset)
+            name = data[offset + _EVENT_HEADER.size:offset + _EVENT_HEADER.size + name_len]
+            offset += _EVENT_HEADER.size + name_len
+
+            if mask & _IN_Q_OVERFLOW:
+                # Events were lost: treat every root as changed
+                touched.update(root for root, _ in self._watches.values())
+                continue
+            watch = self._watches.get(wd)
+            if watch is None:
+                continue
+            root, dir_path = watch
+            if mask & _IN_IGNORED:
+                self._watches.pop(wd, None)
+                continue
+            touched.add(root)
+            if mask & _IN_ISDIR and mask & (_IN_CREATE | _IN_MOVED_TO):
+                child = os.path.join(dir_path, os.fsdecode(name.rstrip(b"\0")))
+                if not os.path.basename(child).startswith("."):
+                    self.watch_tree(root, child)
+        return touched
+
+    def close(self):
+        try:
+            os.close(self.fd)
+        except OSError:
+            pass
+
+
+def _is_network_fs(path: str) -> bool:
+    """True if path lives on a network filesystem (per /proc/mounts)."""
+    try:
+        with open("/proc/mounts", "r", encoding="utf-8") as f:
+            mounts = [line.split()[1:3] for line in f if line.strip()]
+    except OSError:
+        return False
+
+    real = os.path.realpath(path)
+    best, best_type = "", ""
+    for mount_point, fs_type in mounts:
+        mount_point = mount_point.replace("\\040", " ")
+        if (real == mount_point or real.startswith(mount_point.rstrip("/") + "/")) \
+                and len(mount_point) > len(best):
+            best, best_type = mount_point, fs_type
+    return best_type in _NETWORK_FS_TYPES
@@ -5,11 +5,16 @@ Manages ComfyUI model downloads and directory organization.
 """
 
 import os
-import re
+import threading
 from pathlib import Path
-from typing import List, Optional
+from typing import Dict, Iterable, List, Optional, Tuple, Union
 
-import requests
+from civitai_utils.content_store import ContentStore
+from civitai_utils.disk_space import space_ledger
+from civitai_utils.download_engine import DownloadCancelled, download
+from civitai_utils.hash_index import MODEL_EXTENSIONS, HashIndex
+from civitai_utils.library_index import ModelLibraryIndex, ModelRecord
+from civitai_utils.model_quota import ModelQuota, quota_bytes_from_env
 
 try:
     from tqdm import tqdm
@@ -40,13 +45,31 @@ class ModelManager:
         "Upscaler": "upscale_models",
     }
 
-    def __init__(self, models_dir: Optional[str] = None):
+    # Canonical model types, one per model directory
+    LIBRARY_TYPES = ("checkpoint", "lora", "vae", "embedding", "controlnet",
+                     "hypernetwork", "upscaler")
+
+    # File extensions listed as models
+    MODEL_EXTENSIONS = MODEL_EXTENSIONS
+
+    # Per-library state (hash index, ...) lives in this hidden subdirectory
+    STATE_DIR_NAME = ".civitai_alchemist"
+
+    def __init__(self, models_dir: Optional[str] = None,
+                 content_store: Optional[bool] = None,
+                 quota_gb: Optional[float] = None):
         """
         Initialize model manager.
 
         Args:
             models_dir: Path to ComfyUI models directory (e.g. /path/to/ComfyUI/models).
                         Falls back to MODELS_DIR env var, then ../ComfyUI/models.
+            content_store: Deduplicate model files through the content-addressed
+                           store. Falls back to the CIVITAI_CONTENT_STORE env var.
+            quota_gb: Maximum size of the model library; least recently used
+                      LoRAs/checkpoints are evicted to stay under it. Falls
+                      back to the CIVITAI_MODELS_QUOTA_GB env var (unlimited
+                      if unset).
         """
         if models_dir is None:
             models_dir = os.environ.get("MODELS_DIR")
@@ -56,12 +79,50 @@ class ModelManager:
         else:
             self.models_path = Path(__file__).parent.parent.parent / "ComfyUI" / "models"
 
-    def get_model_dir(self, model_type: str) -> Path:
+        if content_store is None:
+            content_store = content_store_enabled()
+        self.content_store: Optional[ContentStore] = (
+            ContentStore(self.models_path / self.STATE_DIR_NAME / "store")
+            if content_store else None
+        )
+
+        self.quota_bytes = (int(quota_gb * 1024 ** 3) if quota_gb
+                            else quota_bytes_from_env())
+        self._quota: Optional[ModelQuota] = None
+
+        self._hash_index: Optional[HashIndex] = None
+        # Filename index of the model directories (replaces per-call rglob)
+        self.library_index = ModelLibraryIndex()
+
+    @property
+    def hash_index(self) -> HashIndex:
+        """Content-hash index of this models directory (opened on first use)."""
+        if self._hash_index is None:
+            self._hash_index = HashIndex(
+                self.models_path / self.STATE_DIR_NAME / "hash_index.db"
+            )
+        return self._hash_index
+
+    @property
+    def quota(self) -> ModelQuota:
+        """Usage tracking and quota state of this models directory."""
+        if self._quota is None:
+            self._quota = ModelQuota(
+                self.models_path / self.STATE_DIR_NAME / "usage.db",
+                quota_bytes=self.quota_bytes,
+            )
+        return self._quota
+
+    def get_model_dir(self, model_type: str, size_bytes: int = 0,
+                      filename: Optional[str] = None) -> Path:
         """
         Get directory for specific model type.
 
         Args:
             model_type: Model type (checkpoint, lora, vae, embedding, etc.)
+            size_bytes: Size of a file to be placed (unused here: a single
+                        models directory has no storage tiers)
+            filename: Name of the file to be placed (unused here either)
 
         Returns:
             Path to model directory
@@ -69,11 +130,31 @@ class ModelManager:
         dir_name = self.TYPE_MAPPING.get(model_type, model_type)
         return self.models_path / dir_name
 
+    def library_generation(self, model_type: str) -> int:
+        """
+        Get the change counter of a model type's directory.
+
+        Cached lookups tagged with an older generation must be rechecked.
+        """
+        return self.library_index.generation([self.get_model_dir(model_type)])
+
+    def notify_library_changed(self, model_type: str):
+        """
+        Record that files of a model type were added or removed.
+
+        Args:
+            model_type: Model type whose directory changed
+        """
+        self.library_index.invalidate(self.get_model_dir(model_type))
+        if self._hash_index is not None:
+            self._hash_index.invalidate(self.get_model_dir(model_type))
+
     def find_model(self, filename: str, model_type: str) -> Optional[Path]:
         """
         Check if a model file already exists in the ComfyUI directory.
 
-        Searches recursively in the appropriate model subdirectory.
+        Searches recursively in the appropriate model subdirectory, using
+        the in-memory library index instead of walking the tree each call.
 
         Args:
             filename: Model filename to search for
@@ -82,72 +163,130 @@ class ModelManager:
         Returns:
             Path to existing file, or None if not found
         """
+        return self.library_index.find(filename, [self.get_model_dir(model_type)])
+
+    def find_model_by_hash(self, hashes: Dict[str, str], model_type: str,
+                           size_kb: Optional[float] = None) -> Optional[Path]:
+        """
+        Find a local model file by content hash, regardless of its filename.
+
+        Args:
+            hashes: Civitai "hashes" dict of the model file (SHA256, AutoV2, ...)
+            model_type: Model type
+            size_kb: Expected file size in KB (limits which files get hashed)
+
+        Returns:
+            Path to a matching file, or None if not found
+        """
         model_dir = self.get_model_dir(model_type)
         if not model_dir.exists():
             return None
-
-        for f in model_dir.rglob(filename):
-            return f
-        return None
+        return self.hash_index.find(hashes, [model_dir], size_kb=size_kb)
 
     def download_file(
         self,
         url: str,
         destination: Path,
         api_key: Optional[str] = None,
+        expected_sha256: Optional[str] = None,
+        cancel_event: Optional[threading.Event] = None,
+        protect: Iterable[Union[str, Path]] = (),
     ) -> Path:
         """
         Download a file with progress bar.
 
-        Handles redirects and Content-Disposition headers for filename detection.
+        Goes through the shared download engine: written to a .part file
+        (resumed on the next run if the server supports byte ranges),
+        retried on dropped connections, verified, then renamed into place.
+        The server's Content-Disposition filename replaces the one in
+        destination. With the content store enabled, a file whose SHA256
+        is already stored is linked into place instead of downloaded.
 
         Args:
             url: Download URL
             destination: Target file path
             api_key: Optional API key for authenticated downloads
+            expected_sha256: Published SHA256 of the file, if known
+            cancel_event: Stops the download when set
+            protect: Other files of the same job, never evicted to make
+                     room for this one
 
         Returns:
             Path to the downloaded file
+
+        Raises:
+            ValueError: If the checksum does not match, a .safetensors
+                        download is truncated or malformed, the server
+                        refuses the file, or the file does not fit in the
+                        quota or on the disk
+            requests.RequestException: If the transfer keeps failing
+            DownloadCancelled: If cancel_event is set
         """
+        if expected_sha256 and self.content_store is not None:
+            if self.content_store.place(expected_sha256, destination):
+                return destination
+
         headers = {}
         if api_key:
             headers["Authorization"] = f"Bearer {api_key}"
 
-        response = requests.get(url, headers=headers, stream=True, timeout=30,
-                                allow_redirects=True)
-        response.raise_for_status()
-
-        # Check Content-Disposition for actual filename
-        content_disp = response.headers.get("Content-Disposition", "")
-        if "filename=" in content_disp:
-            match = re.search(r'filename="?([^";\n]+)"?', content_disp)
-            if match:
-                actual_filename = match.group(1).strip()
-                destination = destination.parent / actual_filename
+        reservation = None
+        quota_path = None
+        pbar = None
+
+        def _prepare(path: Path, total_size: int, needed: int):
+            nonlocal reservation, quota_path, pbar
+            if self.quota_bytes is not None and total_size:
+                self.make_room(total_size, protect=[path, *protect], reserve_for=path)
+                quota_path = path
+            # Fail now rather than at 95% when the disk is too full
+            if needed:
+                reservation = space_ledger.reserve(path.parent, needed)
+            if tqdm:
+                pbar = tqdm(total=total_size, unit="B", unit_scale=True, desc=path.name)
+
+        def _on_event(filename: str, status: str, downloaded_bytes: int = 0, **fields):
+            if status == "downloading" and pbar is not None:
+                pbar.update(downloaded_bytes - pbar.n)
+
+        try:
+            result = download(url, destination.parent, destination.name,
+                              expected_sha256=expected_sha256, headers=headers,
+                              on_event=_on_event, cancel_event=cancel_event,
+                              prepare=_prepare,
+                              on_allocated=lambda: space_ledger.release(reservation))
+        finally:
+            if pbar is not None:
+                pbar.close()
+            space_ledger.release(reservation)
+            if quota_path is not None:
+                self.quota.release(quota_path)
+        if result is None:
+            raise DownloadCancelled(f"Download of {destination.name} cancelled")
+
+        if self.content_store is not None:
+            self.content_store.add(result.path, result.sha256)
+        return result.path
+
+    def scan_models(self, model_type: str,
+                    extensions: Optional[List[str]] = None) -> List[ModelRecord]:
+        """
+        List model files of a specific type with size and mtime.
 
-        # Ensure target directory exists
-        destination.parent.mkdir(parents=True, exist_ok=True)
+        Walks the model directory once for all extensions; results are
+        cached until the directory changes.
 
-        total_size = int(response.headers.get("Content-Length", 0))
+        Args:
+            model_type: Model type
+            extensions: File extensions to include (default: MODEL_EXTENSIONS)
 
-        with open(destination, "wb") as f:
-            if tqdm:
-                with tqdm(
-                    total=total_size,
-                    unit="B",
-                    unit_scale=True,
-                    desc=destination.name,
-                ) as pbar:
-                    for chunk in response.iter_content(chunk_size=8192):
-                        if chunk:
-                            f.write(chunk)
-                            pbar.update(len(chunk))
-            else:
-                for chunk in response.iter_content(chunk_size=8192):
-                    if chunk:
-                        f.write(chunk)
-
-        return destination
+        Returns:
+            List of ModelRecords (name, relative_path, size, mtime, root)
+        """
+        model_dir = self.get_model_dir(model_type)
+        if not model_dir.exists():
+            return []
+        return self.library_index.scan([model_dir], extensions or self.MODEL_EXTENSIONS)
 
     def list_models(self, model_type: str) -> List[str]:
         """
@@ -159,13 +298,100 @@ class ModelManager:
         Returns:
             List of model filenames
         """
-        model_dir = self.get_model_dir(model_type)
-        if not model_dir.exists():
+        return [record.name for record in self.scan_models(model_type)]
+
+    def inventory(self) -> List[Tuple[str, ModelRecord]]:
+        """List (model type, record) for every model file in the library."""
+        return [(t, r) for t in self.LIBRARY_TYPES for r in self.scan_models(t)]
+
+    def record_usage(self, resources: Iterable[Dict]):
+        """
+        Mark the local files of resolved resources as used now.
+
+        Args:
+            resources: Resolved resources (only downloaded ones are recorded)
+        """
+        self.quota.record_use(
+            r["target_path"] for r in resources
+            if r.get("already_downloaded") and r.get("target_path")
+        )
+
+    def make_room(self, needed_bytes: int,
+                  protect: Iterable[Path] = (),
+                  reserve_for: Optional[Path] = None) -> List[ModelRecord]:
+        """
+        Evict least recently used models until needed_bytes fit in the quota.
+
+        Downloads in flight and leftover .part files count against the
+        quota as well.
+
+        Args:
+            needed_bytes: Size of the file about to be added
+            protect: Paths that must not be evicted
+            reserve_for: Target path of a download: the bytes stay held
+                         for it until quota.release(reserve_for)
+
+        Returns:
+            Records of the evicted files
+
+        Raises:
+            ValueError: If the file does not fit even after evicting every
+                        unpinned LoRA and checkpoint
+        """
+        if self.quota_bytes is None:
             return []
+        parts = self.library_index.scan(
+            [d for d in (self.get_model_dir(t) for t in self.LIBRARY_TYPES) if d.exists()],
+            (".part",))
+        evict, fits = self.quota.plan_eviction(self.inventory(), needed_bytes, protect,
+                                               parts, reserve_for)
+        if not fits:
+            raise ValueError(
+                f"Model quota exceeded: {needed_bytes / (1024 ** 3):.2f} GB does not fit "
+                f"in {self.quota_bytes / (1024 ** 3):.2f} GB"
+            )
+        if evict:
+            self.evict_models(evict)
+        return evict
+
+    def evict_models(self, records: List[ModelRecord]) -> int:
+        """
+        Delete model files chosen for eviction and update the indexes.
+
+        Returns:
+            Bytes released
+        """
+        freed = self.quota.evict(records)
+        for root in {r.root for r in records}:
+            self.library_index.invalidate(root)
+            if self._hash_index is not None:
+                self._hash_index.invalidate(root)
+        if self.content_store is not None:
+            # Release stored copies no model file links to any more
+            roots = [self.get_model_dir(t) for t in self.LIBRARY_TYPES]
+            freed += prune_content_store(self.content_store, self.hash_index,
+                                         [r for r in roots if r.is_dir()])[1]
+        return freed
+
+
+def prune_content_store(store: ContentStore, index: HashIndex,
+                        roots: Iterable[Path]) -> Tuple[int, int]:
+    """
+    Delete store objects that no model file uses any more.
+
+    The index is refreshed over roots first, so files removed or added
+    since the last scan are accounted for; objects the size of a file it
+    has not hashed yet are kept, as that file may be a clone of them.
+
+    Returns:
+        (objects removed, bytes freed)
+    """
+    for root in roots:
+        index.refresh(root, force=True)
+    return store.prune(keep=(sha256 for _, _, sha256 in index.entries()),
+                       keep_sizes=index.unhashed_sizes())
 
-        extensions = [".safetensors", ".ckpt", ".pt", ".pth"]
-        models = []
-        for ext in extensions:
-            models.extend(model_dir.rglob(f"*{ext}"))
 
-        return [m.name for m in models]
+def content_store_enabled() -> bool:
+    """True if CIVITAI_CONTENT_STORE enables the content-addressed store."""
+    return os.environ.get("CIVITAI_CONTENT_STORE", "").lower() in ("1", "true", "yes", "on")
@@ -0,0 +1,225 @@
+"""
+Model Quota
+
+Lets a models directory act as a bounded cache instead of growing
+forever. Last-used times and use counts are recorded whenever a model is used for a
+reproduction or workflow generation, and models can be pinned (e.g.
+favorite checkpoints). When a download would push the library over the
+quota, unpinned LoRAs and checkpoints are evicted least recently used
+first; models never recorded as used count as used at their mtime.
+Downloads in flight hold their size against the quota until they finish
+(as the disk-space ledger does for free space), and leftover resumable
+.part files count too, so concurrent downloads cannot overshoot it.
+
+State lives in a small SQLite database next to the hash index.
+"""
+
+import os
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Set, Tuple, Union
+
+from civitai_utils.library_index import ModelRecord
+
+# Model types that may be evicted (small shared types like VAEs stay)
+EVICTABLE_TYPES = ("lora", "checkpoint")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS usage (
+    path        TEXT PRIMARY KEY,
+    last_used   REAL,
+    pinned      INTEGER NOT NULL DEFAULT 0,
+    use_count   INTEGER NOT NULL DEFAULT 0
+);
+"""
+
+
+class ModelQuota:
+    """
+    Usage tracking, pinning and LRU eviction for a model library.
+    """
+
+    def __init__(self, db_path: Union[str, Path], quota_bytes: Optional[int] = None):
+        """
+        Args:
+            db_path: Path to the SQLite usage database
+            quota_bytes: Maximum total size of the library (None = unlimited)
+        """
+        self.db_path = Path(db_path)
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        self.quota_bytes = quota_bytes
+        self._lock = threading.RLock()
+        # Target path -> bytes held by each download in flight
+        self._reserved: Dict[str, int] = {}
+        # Paths planned for eviction and not yet deleted
+        self._evicting: Set[str] = set()
+        self._conn = sqlite3.connect(str(self.db_path), check_same_thread=False)
+        self._conn.executescript(_SCHEMA)
+        columns = {row[1] for row in self._conn.execute("PRAGMA table_info(usage)")}
+        if "use_count" not in columns:
+            self._conn.execute(
+                "ALTER TABLE usage ADD COLUMN use_count INTEGER NOT NULL DEFAULT 0"
+            )
+
+    def close(self):
+        """Close the underlying database connection."""
+        with self._lock:
+            self._conn.close()
+
+    def record_use(self, paths: Iterable[Union[str, Path]], when: Optional[float] = None):
+        """
+        Mark model files as used now (or at the given time).
+
+        Args:
+            paths: Model file paths
+            when: Unix timestamp (default: now)
+        """
+        when = time.time() if when is None else when
+        rows = [(str(Path(p)), when) for p in paths if p]
+        with self._lock, self._conn:
+            self._conn.executemany(
+                "INSERT INTO usage (path, last_used, use_count) VALUES (?, ?, 1) "
+                "ON CONFLICT(path) DO UPDATE SET last_used = excluded.last_used, "
+                "use_count = use_count + 1",
+                rows,
+            )
+
+    def set_pinned(self, path: Union[str, Path], pinned: bool = True):
+        """Pin a model file (never evicted) or unpin it."""
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT INTO usage (path, pinned) VALUES (?, ?) "
+                "ON CONFLICT(path) DO UPDATE SET pinned = excluded.pinned",
+                (str(Path(path)), int(pinned)),
+            )
+
+    def pinned(self) -> Set[str]:
+        """Paths of all pinned model files."""
+        with self._lock:
+            return {row[0] for row in self._conn.execute(
+                "SELECT path FROM usage WHERE pinned = 1"
+            )}
+
+    def usage(self) -> Dict[str, Tuple[Optional[float], int]]:
+        """path -> (last used timestamp or None, use count) for tracked files."""
+        with self._lock:
+            return {row[0]: (row[1], row[2]) for row in self._conn.execute(
+                "SELECT path, last_used, use_count FROM usage"
+            )}
+
+    def rename(self, old_path: Union[str, Path], new_path: Union[str, Path]):
+        """Carry a file's usage and pin over to its new path after a move."""
+        with self._lock, self._conn:
+            self._conn.execute(
+                "UPDATE OR REPLACE usage SET path = ? WHERE path = ?",
+                (str(Path(new_path)), str(Path(old_path))),
+            )
+
+    def plan_eviction(self, inventory: List[Tuple[str, ModelRecord]], needed_bytes: int,
+                      protect: Iterable[Union[str, Path]] = (),
+                      parts: Iterable[ModelRecord] = (),
+                      reserve_for: Optional[Union[str, Path]] = None
+                      ) -> Tuple[List[ModelRecord], bool]:
+        """
+        Choose the models to evict so needed_bytes more fit in the quota.
+
+        Besides the inventory, the quota holds the bytes reserved by
+        downloads in flight and the .part files of other downloads.
+
+        Args:
+            inventory: (model type, record) for every file in the library
+            needed_bytes: Size of the file about to be added
+            protect: Paths that must not be evicted (e.g. the current job's models)
+            parts: Records of the .part files in the library
+            reserve_for: Target path of the download needed_bytes is for;
+                         if it fits, the bytes stay reserved until release()
+
+        Returns:
+            (records to evict in LRU order, whether the new file then fits)
+        """
+        if self.quota_bytes is None:
+            return [], True
+
+        keep = {str(Path(p)) for p in protect if p}
+        with self._lock:
+            target = str(Path(reserve_for)) if reserve_for is not None else None
+            in_flight = {path: size for path, size in self._reserved.items() if path != target}
+            present = [(t, r) for t, r in inventory if str(r.path) not in self._evicting]
+            used = sum(record.size for _, record in present)
+            # A download's own .part is covered by its reservation
+            used += sum(record.size for record in parts
+                        if str(record.path)[:-len(".part")] not in in_flight
+                        and str(record.path)[:-len(".part")] != target)
+            used += sum(in_flight.values())
+            excess = used + needed_bytes - self.quota_bytes
+
+            evict = []
+            if excess > 0:
+                rows = dict(self._conn.execute("SELECT path, last_used FROM usage"))
+                keep |= self.pinned() | set(in_flight)
+
+                candidates = []
+                for model_type, record in present:
+                    path = str(record.path)
+                    if model_type not in EVICTABLE_TYPES or path in keep:
+                        continue
+                    candidates.append((rows.get(path) or record.mtime, record))
+                candidates.sort(key=lambda c: c[0])
+
+                for _, record in candidates:
+                    if excess <= 0:
+                        break
+                    evict.append(record)
+                    excess -= record.size
+
+            fits = excess <= 0
+            if fits:
+                self._evicting.update(str(record.path) for record in evict)
+                if target is not None:
+                    self._reserved[target] = needed_bytes
+        return evict, fits
+
+    def release(self, path: Union[str, Path]):
+        """End the quota reservation of a download into path (idempotent)."""
+        with self._lock:
+            self._reserved.pop(str(Path(path)), None)
+
+    def evict(self, records: Iterable[ModelRecord]) -> int:
+        """
+        Delete model files and forget their usage.
+
+        Returns:
+            Bytes released on disk: files with other hardlinks (e.g. into
+            the content store) only free their space with the last link
+        """
+        records = list(records)
+        freed = 0
+        removed = []
+        for record in records:
+            path = str(record.path)
+            try:
+                last_link = os.lstat(path).st_nlink <= 1
+                os.unlink(path)
+            except FileNotFoundError:
+                last_link = False
+            except OSError:
+                continue
+            if last_link:
+                freed += record.size
+            removed.append((path,))
+        with self._lock, self._conn:
+            self._conn.executemany("DELETE FROM usage WHERE path = ?", removed)
+            self._evicting.difference_update(str(record.path) for record in records)
+        return freed
+
+
+def quota_bytes_from_env() -> Optional[int]:
+    """Quota from CIVITAI_MODELS_QUOTA_GB (unset or invalid = unlimited)."""
+    value = os.environ.get("CIVITAI_MODELS_QUOTA_GB", "").strip()
+    try:
+        gb = float(value)
+    except ValueError:
+        return None
+    return int(gb * 1024 ** 3) if gb > 0 else None
@@ -0,0 +1,145 @@
+"""
+Page-Cache Prewarming
+
+The first load of a large checkpoint after a download or a reboot is
+dominated by cold disk reads. Once a workflow is generated, the model
+files it references are pulled into the page cache in a background
+thread (posix_fadvise WILLNEED where available, plain reads elsewhere),
+so ComfyUI's model load overlaps with the user reviewing the workflow.
+
+Reads are paced to a byte rate so prewarming does not starve other I/O,
+and files that would not fit in available memory are skipped (they
+would only evict each other).
+"""
+
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Union
+
+logger = logging.getLogger("civitai_alchemist.prewarm")
+
+# Default pace (bytes per second); CIVITAI_PREWARM_MBPS overrides, 0 disables
+DEFAULT_RATE = 200 * 1024 * 1024
+
+# Bytes advised or read per step
+PREWARM_CHUNK = 16 * 1024 * 1024
+
+# Load order: the checkpoint is needed first, LoRAs last
+_TYPE_ORDER = {"checkpoint": 0, "vae": 1, "lora": 2}
+
+
+class Prewarmer:
+    """
+    Background page-cache prewarmer for model files.
+    """
+
+    def __init__(self, rate: int = DEFAULT_RATE, chunk_size: int = PREWARM_CHUNK):
+        """
+        Args:
+            rate: Maximum bytes per second to prefetch
+            chunk_size: Bytes advised or read per step
+        """
+        self.rate = rate
+        self.chunk_size = chunk_size
+        self._queue: "OrderedDict[str, None]" = OrderedDict()
+        self._current: Optional[str] = None
+        self._cond = threading.Condition()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def request(self, paths: Iterable[Union[str, Path]]):
+        """Queue files for prefetching (already queued files are skipped)."""
+        with self._cond:
+            for path in paths:
+                path = str(path)
+                if path and path != self._current and path not in self._queue:
+                    self._queue[path] = None
+            if self._thread is None:
+                self._thread = threading.Thread(
+                    target=self._run, name="civitai-prewarm", daemon=True
+                )
+                self._thread.start()
+            self._cond.notify()
+
+    def stop(self):
+        """Stop prefetching and drop queued files."""
+        self._stop.set()
+        with self._cond:
+            self._queue.clear()
+            self._cond.notify()
+
+    def _run(self):
+        while not self._stop.is_set():
+            with self._cond:
+                while not self._queue and not self._stop.is_set():
+                    self._cond.wait()
+                if self._stop.is_set():
+                    return
+                self._current, _ = self._queue.popitem(last=False)
+            try:
+                self._warm(self._current)
+            except OSError as e:
+                logger.debug("Prewarming %s failed: %s", self._current, e)
+            finally:
+                self._current = None
+
+    def _warm(self, path: str):
+        """Pull one file into the page cache, paced to self.rate."""
+        size = os.path.getsize(path)
+        available = _available_memory()
+        if available is not None and size > available // 2:
+            logger.debug("Skipping prewarm of %s: larger than half of free memory", path)
+            return
+
+        advise = hasattr(os, "posix_fadvise")
+        buffer = None if advise else bytearray(self.chunk_size)
+        start = time.monotonic()
+        offset = 0
+        with open(path, "rb", buffering=0) as f:
+            fd = f.fileno()
+            while offset < size and not self._stop.is_set():
+                n = min(self.chunk_size, size - offset)
+                if advise:
+                    os.posix_fadvise(fd, offset, n, os.POSIX_FADV_WILLNEED)
+                elif not f.readinto(buffer):
+                    break
+                offset += n
+
+                ahead = offset / self.rate - (time.monotonic() - start)
+                if ahead > 0:
+                    self._stop.wait(ahead)
+        logger.debug("Prewarmed %s (%d MB)", path, offset // (1024 * 1024))
+
+
+def paths_for_resources(resources: Iterable[Dict]) -> List[str]:
+    """Local files of downloaded resources, in the order ComfyUI loads them."""
+    found = [r for r in resources if r.get("already_downloaded") and r.get("target_path")]
+    found.sort(key=lambda r: _TYPE_ORDER.get(r.get("type"), len(_TYPE_ORDER)))
+    return [r["target_path"] for r in found]
+
+
+def prewarm_rate_from_env() -> int:
+    """Prewarm pace from CIVITAI_PREWARM_MBPS in bytes per second (0 = off)."""
+    value = os.environ.get("CIVITAI_PREWARM_MBPS", "").strip()
+    if not value:
+        return DEFAULT_RATE
+    try:
+        return max(int(float(value) * 1024 * 1024), 0)
+    except ValueError:
+        return DEFAULT_RATE
+
+
+def _available_memory() -> Optional[int]:
+    """MemAvailable from /proc/meminfo in bytes (None where unavailable)."""
+    try:
+        with open("/proc/meminfo", "r", encoding="ascii") as f:
+            for line in f:
+                if line.startswith("MemAvailable:"):
+                    return int(line.split()[1]) * 1024
+    except (OSError, ValueError, IndexError):
+        pass
+    return None
@@ -0,0 +1,82 @@
+"""
+Resolution Cache
+
+In-memory cache of resolved resources keyed by model version ID or file
+hash, so re-resolving a known resource is a dict lookup instead of API
+calls plus filesystem scans.
+
+Each entry keeps the version-derived fields (filename, URL, type, hashes,
+...) separately from the local library state (already_downloaded,
+target_path), tagged with the library generation of the model type it was
+checked against. When a type's generation moves on (a download finished,
+files were added or deleted), only the local state of entries of that
+type is rechecked; the version-derived fields stay valid.
+"""
+
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Tuple
+
+# Fields describing where the resource lives in the local library
+LOCAL_FIELDS = ("already_downloaded", "target_path", "filename")
+
+# Maximum number of cached resources (least recently used are dropped)
+MAX_ENTRIES = 4096
+
+
+@dataclass
+class CacheEntry:
+    """A cached resolution result."""
+    remote: Dict
+    local: Dict = field(default_factory=dict)
+    generation: int = -1
+
+
+class ResolutionCache:
+    """
+    LRU cache of resolved resources, shared across resolve requests.
+    """
+
+    def __init__(self, max_entries: int = MAX_ENTRIES):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[Tuple[str, str], CacheEntry]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def keys_for(resource: Dict) -> List[Tuple[str, str]]:
+        """Cache keys identifying a resource: its version ID and its hash."""
+        keys = []
+        if resource.get("model_version_id"):
+            keys.append(("version", str(resource["model_version_id"])))
+        if resource.get("hash"):
+            keys.append(("hash", str(resource["hash"]).upper()))
+        return keys
+
+    def get(self, resource: Dict) -> Optional[CacheEntry]:
+        """Return the cached entry for a resource, or None."""
+        with self._lock:
+            for key in self.keys_for(resource):
+                entry = self._entries.get(key)
+                if entry is not None:
+                    self._entries.move_to_end(key)
+                    return entry
+        return None
+
+    def put(self, keys: List[Tuple[str, str]], entry: CacheEntry):
+        """Store an entry under all of the given keys."""
+        with self._lock:
+            for key in keys:
+                self._entries[key] = entry
+                self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        """Drop all cached entries."""
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._entries)
@@ -0,0 +1,254 @@
+"""
+Storage Tiers
+
+Policy-driven placement of model files across several roots of the same
+model folder (e.g. a fast NVMe root and a bulk HDD root configured via
+extra_model_paths.yaml). Small, frequently swapped files (LoRAs,
+embeddings, VAEs, ...) go to the fast tier, large checkpoints to bulk
+storage. Afterwards files move with their usage: models used often
+recently are promoted to the fast tier, models not used for a long time
+are demoted to bulk, so LoRA swaps stay fast without buying more SSD.
+
+Which roots are fast comes from CIVITAI_FAST_STORAGE: a list of path
+prefixes (os.pathsep-separated), or "auto" to treat every non-rotational
+block device as fast. Without it, placement keeps using the first root.
+"""
+
+import os
+import shutil
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple, Union
+
+from civitai_utils.disk_space import space_ledger
+from civitai_utils.download_engine import part_path
+from civitai_utils.downloader import state_path
+from civitai_utils.library_index import ModelRecord
+
+FAST = "fast"
+BULK = "bulk"
+
+# Model types placed on the fast tier by default (small and swapped often)
+FAST_TYPES = ("lora", "embedding", "vae", "upscaler", "hypernetwork", "controlnet")
+
+# Promote files used at least this often, most recently within HOT_WINDOW
+PROMOTE_MIN_USES = 3
+HOT_WINDOW = 7 * 24 * 3600
+
+# Demote files not used (or, if never used, not modified) for this long
+COLD_AFTER = 30 * 24 * 3600
+
+# Copy buffer for moves between filesystems
+_COPY_BUFFER = 8 * 1024 * 1024
+
+
+@dataclass
+class TierMove:
+    """A planned promotion or demotion of one model file."""
+    model_type: str
+    record: ModelRecord
+    dest_root: str
+    reason: str
+
+    @property
+    def dest_path(self) -> Path:
+        return Path(self.dest_root) / self.record.relative_path
+
+
+class StorageTiers:
+    """
+    Classifies model roots into fast and bulk tiers and places files.
+    """
+
+    def __init__(self, fast_paths: Optional[Iterable[str]] = None):
+        """
+        Args:
+            fast_paths: Path prefixes on fast storage; None detects fast
+                        (non-rotational) devices automatically
+        """
+        self.fast_paths = (
+            None if fast_paths is None
+            else [os.path.realpath(p) for p in fast_paths if p]
+        )
+        self._tier_cache: Dict[str, str] = {}
+
+    def tier_of(self, root: Union[str, Path]) -> str:
+        """FAST or BULK for a model root."""
+        root = os.path.realpath(root)
+        tier = self._tier_cache.get(root)
+        if tier is None:
+            if self.fast_paths is None:
+                fast = _is_non_rotational(root)
+            else:
+                fast = any(root == p or root.startswith(p.rstrip(os.sep) + os.sep)
+                           for p in self.fast_paths)
+            tier = self._tier_cache[root] = FAST if fast else BULK
+        return tier
+
+    @staticmethod
+    def preferred_tier(model_type: str) -> str:
+        """Tier a newly downloaded file of this type should land on."""
+        return FAST if model_type in FAST_TYPES else BULK
+
+    def choose_root(self, model_type: str, roots: List[Union[str, Path]],
+                    size_bytes: int = 0,
+                    filename: Optional[str] = None) -> Optional[Path]:
+        """
+        Pick the root a new file should be downloaded to.
+
+        A root already holding a resumable .part of the file wins, so an
+        interrupted download continues there (its preallocated .part has
+        taken the room a new choice would look for). Otherwise prefers the
+        first root of the preferred tier that has room for the file, net
+        of the space other downloads have reserved; falls back to the
+        other tier, then to the first root.
+
+        Args:
+            model_type: Internal model type (lora, checkpoint, ...)
+            roots: Roots of the model folder, in folder_paths order
+            size_bytes: Size of the file (0 if unknown)
+            filename: Name of the file, to find a .part to resume
+        """
+        if not roots:
+            return None
+        if filename:
+            for root in roots:
+                if state_path(part_path(Path(root) / filename)).exists():
+                    return Path(root)
+        preferred = self.preferred_tier(model_type)
+        ordered = ([r for r in roots if self.tier_of(r) == preferred] +
+                   [r for r in roots if self.tier_of(r) != preferred])
+        for root in ordered:
+            if _has_room(root, size_bytes):
+                return Path(root)
+        return Path(roots[0])
+
+    def plan_moves(self, inventory: List[Tuple[str, ModelRecord]],
+                   roots_by_type: Dict[str, List[str]],
+                   usage: Dict[str, Tuple[Optional[float], int]],
+                   pinned: Iterable[str] = (),
+                   now: Optional[float] = None) -> List[TierMove]:
+        """
+        Plan promotions of hot files to the fast tier and demotions of
+        cold files to bulk storage.
+
+        Args:
+            inventory: (model type, record) for every model file
+            roots_by_type: Roots of each model type's folder
+            usage: path -> (last used timestamp, use count)
+            pinned: Paths that stay where they are
+            now: Current time (default: time.time())
+
+        Returns:
+            Planned moves, promotions first
+        """
+        now = time.time() if now is None else now
+        pinned = set(pinned)
+        promotions, demotions = [], []
+        for model_type, record in inventory:
+            path = str(record.path)
+            if path in pinned:
+                continue
+            roots = roots_by_type.get(model_type, [])
+            tier = self.tier_of(record.root)
+            last_used, uses = usage.get(path, (None, 0))
+            last_active = last_used or record.mtime
+
+            if tier == BULK and uses >= PROMOTE_MIN_USES and last_used \
+                    and now - last_used <= HOT_WINDOW:
+                dest = self._root_in_tier(roots, FAST, record.size)
+                if dest:
+                    promotions.append(TierMove(model_type, record, dest,
+                                               f"used {uses}x, last {_ago(now - last_used)}"))
+            elif tier == FAST and now - last_active >= COLD_AFTER:
+                dest = self._root_in_tier(roots, BULK, record.size)
+                if dest:
+                    demotions.append(TierMove(model_type, record, dest,
+                                              f"last used {_ago(now - last_active)}"))
+        return promotions + demotions
+
+    def _root_in_tier(self, roots: List[str], tier: str, size_bytes: int) -> Optional[str]:
+        for root in roots:
+            if self.tier_of(root) == tier and _has_room(root, size_bytes):
+                return str(root)
+        return None
+
+
+def move_model(src: Union[str, Path], dest: Union[str, Path]):
+    """
+    Move a model file, across filesystems if needed.
+
+    The file appears at dest atomically (copied to a temporary name, synced
+    and renamed) before src is removed, so it is loadable throughout.
+
+    Raises:
+        FileExistsError: If dest already exists
+        OSError: If the copy fails (src is left untouched)
+    """
+    src, dest = Path(src), Path(dest)
+    if dest.exists():
+        raise FileExistsError(f"{dest} already exists")
+    dest.parent.mkdir(parents=True, exist_ok=True)
+    try:
+        os.rename(src, dest)
+        return
+    except OSError:
+        pass  # Different filesystem: copy
+
+    tmp = dest.with_name(f"{dest.name}.part")
+    try:
+        with open(src, "rb") as fin, open(tmp, "wb") as fout:
+            shutil.copyfileobj(fin, fout, _COPY_BUFFER)
+            fout.flush()
+            os.fsync(fout.fileno())
+        shutil.copystat(src, tmp)
+        os.replace(tmp, dest)
+    except BaseException:
+        try:
+            tmp.unlink()
+        except OSError:
+            pass
+        raise
+    src.unlink()
+
+
+def tiers_from_env() -> Optional[StorageTiers]:
+    """StorageTiers configured by CIVITAI_FAST_STORAGE, or None (tiering off)."""
+    value = os.environ.get("CIVITAI_FAST_STORAGE", "").strip()
+    if not value:
+        return None
+    if value.lower() == "auto":
+        return StorageTiers()
+    return StorageTiers(value.split(os.pathsep))
+
+
+def _has_room(root: Union[str, Path], size_bytes: int) -> bool:
+    if not size_bytes:
+        return True
+    try:
+        return space_ledger.available(root) > size_bytes
+    except OSError:
+        return False
+
+
+def _is_non_rotational(path: str) -> bool:
+    """True if path lives on a non-rotational (SSD/NVMe) block device."""
+    try:
+        dev = os.stat(path).st_dev
+    except OSError:
+        return False
+    block = f"/sys/dev/block/{os.major(dev)}:{os.minor(dev)}"
+    # Partitions keep their queue settings on the parent device
+    for queue in (f"{block}/queue/rotational", f"{block}/../queue/rotational"):
+        try:
+            with open(queue, "r", encoding="ascii") as f:
+                return f.read().strip() == "0"
+        except OSError:
+            continue
+    return False
+
+
+def _ago(seconds: float) -> str:
+    days = seconds / 86400
+    return f"{days:.0f}d ago" if days >= 1 else f"{seconds / 3600:.0f}h ago"
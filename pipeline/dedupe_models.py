@@ -0,0 +1,97 @@
+"""
+Dedupe Models
+
+Moves a local ComfyUI models directory into the content-addressed store:
+every model file is hashed (via the hash index), stored once under its
+SHA256, and duplicates across names and folders are replaced by reflinks
+or hardlinks to the stored copy.
+
+Usage:
+    python -m pipeline.dedupe_models --dry-run
+    python -m pipeline.dedupe_models
+    python -m pipeline.dedupe_models --prune
+"""
+
+import argparse
+import sys
+from collections import defaultdict
+from pathlib import Path
+
+try:
+    from dotenv import load_dotenv
+except ImportError:
+    load_dotenv = None
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from civitai_utils.model_manager import ModelManager
+
+
+def main():
+    if load_dotenv:
+        load_dotenv()
+
+    parser = argparse.ArgumentParser(description="Deduplicate model files via the content store")
+    parser.add_argument("--models-dir", default=None,
+                        help="Path to ComfyUI models directory (default: ../ComfyUI/models)")
+    parser.add_argument("--dry-run", action="store_true",
+                        help="Report duplicates without changing any file")
+    parser.add_argument("--prune", action="store_true",
+                        help="Also delete stored objects no model file uses any more")
+    args = parser.parse_args()
+
+    manager = ModelManager(models_dir=args.models_dir, content_store=True)
+    if not manager.models_path.exists():
+        print(f"Error: {manager.models_path} not found.", file=sys.stderr)
+        sys.exit(1)
+
+    index = manager.hash_index
+    roots = [manager.models_path / d for d in sorted(set(ModelManager.TYPE_MAPPING.values()))
+             if (manager.models_path / d).is_dir()]
+    for root in roots:
+        index.refresh(root, force=True)
+    print("Hashing new and changed files...")
+    index.hash_pending(roots, use_processes=True)
+
+    by_hash = defaultdict(list)
+    for path, size, sha256 in index.entries(roots):
+        by_hash[sha256].append((path, size))
+
+    duplicates = {h: files for h, files in by_hash.items() if len(files) > 1}
+    print(f"\n{len(by_hash)} unique model(s), {len(duplicates)} with duplicates")
+    for sha256, files in sorted(duplicates.items()):
+        print(f"  {sha256[:10]} ({files[0][1] / (1024 ** 3):.2f} GB each)")
+        for path, _ in files:
+            print(f"    {path}")
+
+    if args.dry_run:
+        reclaimable = sum(files[0][1] * (len(files) - 1) for files in duplicates.values())
+        print(f"\nUp to {reclaimable / (1024 ** 3):.2f} GB reclaimable "
+              "(dry run - no files changed)")
+        return
+
+    store = manager.content_store
+    freed, unlinked = 0, 0
+    for sha256, files in by_hash.items():
+        for path, size in files:
+            result = store.add(path, sha256)
+            if result is None:
+                unlinked += 1
+                continue
+            # Keep the hashes of replaced files (their inode changed)
+            index.touch(path)
+            if result == "linked":
+                freed += size
+
+    print(f"\nReclaimed {freed / (1024 ** 3):.2f} GB")
+    if unlinked:
+        print(f"Not linkable (other filesystem or mismatched object): {unlinked} file(s)")
+
+    if args.prune:
+        removed, pruned = store.prune(keep=by_hash, keep_sizes=index.unhashed_sizes(roots))
+        print(f"Pruned {removed} unused object(s), {pruned / (1024 ** 3):.2f} GB")
+    print(f"Store: {store.root}")
+
+
+if __name__ == "__main__":
+    main()
@@ -22,6 +22,7 @@ except ImportError:
 
 sys.path.insert(0, str(Path(__file__).parent.parent))
 
+from civitai_utils.disk_space import space_ledger
 from civitai_utils.model_manager import ModelManager
 
 
@@ -65,9 +66,19 @@ def main():
         size_mb = (r.get("size_kb") or 0) / 1024
         print(f"  [{r['type']}] {r['filename']} ({size_mb:.1f} MB) -> {r['target_dir']}/")
 
+    # Admission: the whole batch must fit on each target filesystem
+    shortfalls = space_ledger.shortfalls(
+        (Path(r["target_path"]).parent, int((r.get("size_kb") or 0) * 1024))
+        for r in to_download
+    )
+    for error in shortfalls:
+        print(f"\nError: {error}", file=sys.stderr)
+
     if args.dry_run:
         print("\n(dry run - no files downloaded)")
         sys.exit(0)
+    if shortfalls:
+        sys.exit(1)
 
     print()
 
@@ -88,6 +99,8 @@ def main():
                 url=r["download_url"],
                 destination=target,
                 api_key=api_key,
+                expected_sha256=(r.get("hashes") or {}).get("SHA256"),
+                protect=[o["target_path"] for o in resources if o.get("target_path")],
             )
             print(f"  Saved to {actual_path}\n")
             r["already_downloaded"] = True
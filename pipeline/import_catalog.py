@@ -0,0 +1,63 @@
+"""
+Import Catalog
+
+Imports a bulk JSONL dump of Civitai model versions into a local SQLite
+catalog, so resolve_models can resolve resources without network access.
+
+Usage:
+    python -m pipeline.import_catalog model_versions.jsonl
+    python -m pipeline.import_catalog model_versions.jsonl --catalog output/catalog.db
+"""
+
+import argparse
+import os
+import sys
+import time
+from pathlib import Path
+
+try:
+    from dotenv import load_dotenv
+except ImportError:
+    load_dotenv = None
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from civitai_utils.catalog import ModelCatalog
+
+
+def main():
+    if load_dotenv:
+        load_dotenv()
+
+    parser = argparse.ArgumentParser(
+        description="Import a JSONL dump of model versions into the offline catalog"
+    )
+    parser.add_argument("input", nargs="+", help="JSONL file(s) to import")
+    parser.add_argument("--catalog", default=None,
+                        help="Catalog database path "
+                             "(default: CIVITAI_CATALOG env var, then output/catalog.db)")
+    args = parser.parse_args()
+
+    catalog_path = args.catalog or os.environ.get("CIVITAI_CATALOG") or "output/catalog.db"
+    catalog = ModelCatalog(catalog_path)
+
+    total = 0
+    for input_file in args.input:
+        input_path = Path(input_file)
+        if not input_path.exists():
+            print(f"Error: {input_path} not found.", file=sys.stderr)
+            sys.exit(1)
+
+        start = time.monotonic()
+        count = catalog.import_jsonl(input_path)
+        elapsed = time.monotonic() - start
+        print(f"Imported {count} version(s) from {input_path} in {elapsed:.1f}s")
+        total += count
+
+    print(f"\nCatalog {catalog_path}: {catalog.count()} version(s) total "
+          f"({total} imported)")
+    catalog.close()
+
+
+if __name__ == "__main__":
+    main()
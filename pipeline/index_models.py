@@ -0,0 +1,69 @@
+"""
+Index Models
+
+Builds (or incrementally updates) the content-hash index of a local ComfyUI
+models directory, hashing every new or changed model file in parallel.
+Afterwards resolve_models recognizes renamed or moved files instantly.
+
+Usage:
+    python -m pipeline.index_models
+    python -m pipeline.index_models --models-dir /path/to/ComfyUI/models --workers 8
+"""
+
+import argparse
+import sys
+from pathlib import Path
+
+try:
+    from dotenv import load_dotenv
+except ImportError:
+    load_dotenv = None
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from civitai_utils.model_manager import ModelManager
+
+
+def main():
+    if load_dotenv:
+        load_dotenv()
+
+    parser = argparse.ArgumentParser(description="Build the local model hash index")
+    parser.add_argument("--models-dir", default=None,
+                        help="Path to ComfyUI models directory (default: ../ComfyUI/models)")
+    parser.add_argument("--workers", type=int, default=None,
+                        help="Parallel hash workers (default: sized to CPUs and disks)")
+    parser.add_argument("--threads", action="store_true",
+                        help="Hash with threads instead of a process pool")
+    args = parser.parse_args()
+
+    manager = ModelManager(models_dir=args.models_dir)
+    if not manager.models_path.exists():
+        print(f"Error: {manager.models_path} not found.", file=sys.stderr)
+        sys.exit(1)
+
+    index = manager.hash_index
+    roots = []
+    for dir_name in sorted(set(ModelManager.TYPE_MAPPING.values())):
+        model_dir = manager.models_path / dir_name
+        if not model_dir.is_dir():
+            continue
+        stats = index.refresh(model_dir, force=True)
+        print(f"  {dir_name}: {stats['scanned']} file(s), "
+              f"{stats['changed']} new/changed, {stats['removed']} removed")
+        roots.append(model_dir)
+
+    print("\nHashing new and changed files...")
+    stats = index.hash_pending(roots, workers=args.workers,
+                               use_processes=not args.threads)
+
+    print(f"\n--- Index Summary ---")
+    print(f"Hashed: {stats.files} file(s), {stats.bytes / (1024 ** 3):.2f} GB "
+          f"in {stats.seconds:.1f}s ({stats.mb_per_second:.0f} MB/s)")
+    if stats.errors:
+        print(f"Unreadable: {stats.errors} file(s)")
+    print(f"Index: {index.db_path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,66 @@
+"""
+List Models
+
+Lists the model files in a local ComfyUI models directory, with size and
+modification time, walking each model directory once.
+
+Usage:
+    python -m pipeline.list_models
+    python -m pipeline.list_models --type lora
+    python -m pipeline.list_models --json > inventory.json
+"""
+
+import argparse
+import json
+import sys
+import time
+from dataclasses import asdict
+from pathlib import Path
+
+try:
+    from dotenv import load_dotenv
+except ImportError:
+    load_dotenv = None
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from civitai_utils.model_manager import ModelManager
+
+
+def main():
+    if load_dotenv:
+        load_dotenv()
+
+    parser = argparse.ArgumentParser(description="List local model files")
+    parser.add_argument("--type", "-t", default=None, choices=ModelManager.LIBRARY_TYPES,
+                        help="Only list this model type")
+    parser.add_argument("--models-dir", default=None,
+                        help="Path to ComfyUI models directory (default: ../ComfyUI/models)")
+    parser.add_argument("--json", action="store_true",
+                        help="Print JSON records instead of a table")
+    args = parser.parse_args()
+
+    manager = ModelManager(models_dir=args.models_dir)
+    start = time.monotonic()
+    if args.type:
+        inventory = [(args.type, r) for r in manager.scan_models(args.type)]
+    else:
+        inventory = manager.inventory()
+    elapsed = time.monotonic() - start
+
+    if args.json:
+        json.dump([{"type": t, **asdict(r)} for t, r in inventory],
+                  sys.stdout, indent=2, ensure_ascii=False)
+        print()
+        return
+
+    for t, r in inventory:
+        print(f"  [{t}] {r.relative_path} ({r.size / (1024 * 1024):.1f} MB)")
+
+    total_gb = sum(r.size for _, r in inventory) / (1024 ** 3)
+    print(f"\n{len(inventory)} model(s), {total_gb:.2f} GB "
+          f"(scanned in {elapsed * 1000:.0f} ms)")
+
+
+if __name__ == "__main__":
+    main()
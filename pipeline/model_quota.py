@@ -0,0 +1,99 @@
+"""
+Model Quota
+
+Shows the size of the local model library against its quota, pins or
+unpins models (pinned models are never evicted), and evicts least
+recently used LoRAs/checkpoints down to the quota on demand.
+
+Usage:
+    python -m pipeline.model_quota
+    python -m pipeline.model_quota --pin checkpoints/favorite.safetensors
+    python -m pipeline.model_quota --quota-gb 500 --enforce --dry-run
+"""
+
+import argparse
+import sys
+import time
+from pathlib import Path
+
+try:
+    from dotenv import load_dotenv
+except ImportError:
+    load_dotenv = None
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from civitai_utils.model_manager import ModelManager
+
+
+def _gb(size: int) -> str:
+    return f"{size / (1024 ** 3):.2f} GB"
+
+
+def main():
+    if load_dotenv:
+        load_dotenv()
+
+    parser = argparse.ArgumentParser(description="Manage the model library quota")
+    parser.add_argument("--models-dir", default=None,
+                        help="Path to ComfyUI models directory (default: ../ComfyUI/models)")
+    parser.add_argument("--quota-gb", type=float, default=None,
+                        help="Library quota in GB (or set CIVITAI_MODELS_QUOTA_GB)")
+    parser.add_argument("--pin", action="append", default=[], metavar="PATH",
+                        help="Pin a model file (relative to the models directory)")
+    parser.add_argument("--unpin", action="append", default=[], metavar="PATH",
+                        help="Unpin a model file")
+    parser.add_argument("--enforce", action="store_true",
+                        help="Evict least recently used models down to the quota now")
+    parser.add_argument("--dry-run", action="store_true",
+                        help="With --enforce, only show what would be evicted")
+    args = parser.parse_args()
+
+    manager = ModelManager(models_dir=args.models_dir, quota_gb=args.quota_gb)
+    quota = manager.quota
+
+    for paths, pinned in ((args.pin, True), (args.unpin, False)):
+        for p in paths:
+            path = Path(p) if Path(p).is_absolute() else manager.models_path / p
+            if not path.is_file():
+                print(f"Error: {path} not found.", file=sys.stderr)
+                sys.exit(1)
+            quota.set_pinned(path, pinned)
+            print(f"{'Pinned' if pinned else 'Unpinned'}: {path}")
+
+    inventory = manager.inventory()
+    used = sum(r.size for _, r in inventory)
+    limit = _gb(manager.quota_bytes) if manager.quota_bytes is not None else "unlimited"
+    print(f"\nLibrary: {len(inventory)} model(s), {_gb(used)} (quota: {limit})")
+
+    pinned = quota.pinned()
+    if pinned:
+        print(f"Pinned: {len(pinned)}")
+        for path in sorted(pinned):
+            print(f"  {path}")
+
+    if not args.enforce:
+        return
+    if manager.quota_bytes is None:
+        print("Error: no quota set (use --quota-gb or CIVITAI_MODELS_QUOTA_GB).", file=sys.stderr)
+        sys.exit(1)
+
+    evict, fits = quota.plan_eviction(inventory, 0)
+    if not evict:
+        print("\nWithin quota. Nothing to evict.")
+    for record in evict:
+        print(f"  evict {record.path} ({_gb(record.size)}, "
+              f"modified {time.strftime('%Y-%m-%d', time.localtime(record.mtime))})")
+    if not fits:
+        print("Warning: pinned and non-evictable models alone exceed the quota.",
+              file=sys.stderr)
+    if args.dry_run:
+        print("\n(dry run - no files deleted)")
+        return
+    if evict:
+        freed = manager.evict_models(evict)
+        print(f"\nEvicted {len(evict)} model(s), {_gb(freed)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -29,7 +29,9 @@ sys.path.insert(0, str(Path(__file__).parent.parent))
 from pipeline.fetch_metadata import parse_image_id, extract_metadata, enrich_metadata
 from pipeline.resolve_models import resolve_resource
 from pipeline.generate_workflow import build_workflow, submit_workflow
+from civitai_utils.catalog import ModelCatalog
 from civitai_utils.civitai_api import CivitaiAPI
+from civitai_utils.disk_space import space_ledger
 from civitai_utils.model_manager import ModelManager
 
 
@@ -47,6 +49,9 @@ def main():
                         help="Path to ComfyUI models directory (default: ../ComfyUI/models)")
     parser.add_argument("--api-key", default=None,
                         help="Civitai API key (or set CIVITAI_API_KEY env var)")
+    parser.add_argument("--catalog", default=None,
+                        help="Offline model catalog to resolve against first "
+                             "(or set CIVITAI_CATALOG env var)")
     parser.add_argument("--skip-download", action="store_true",
                         help="Skip downloading models")
     parser.add_argument("--submit", action="store_true",
@@ -82,6 +87,8 @@ def main():
     api_key = args.api_key or os.environ.get("CIVITAI_API_KEY")
     api = CivitaiAPI(api_key=api_key, api_log=api_log)
     manager = ModelManager(models_dir=args.models_dir)
+    catalog_path = args.catalog or os.environ.get("CIVITAI_CATALOG")
+    catalog = ModelCatalog(catalog_path) if catalog_path else None
 
     if debug_report:
         debug_report["environment"]["models_dir"] = str(manager.models_path)
@@ -183,6 +190,7 @@ def main():
         result = resolve_resource(
             r, api, manager,
             debug_data=resource_debug,
+            catalog=catalog,
         )
         if debug_mode:
             resource_debug["input"] = r
@@ -229,9 +237,21 @@ def main():
         print("Step 3: Downloading models")
         print("=" * 50)
 
+        # Models this job already has become most recently used, so making
+        # room for its downloads never evicts them
+        manager.record_usage(resolved)
         to_download = [r for r in resolved if not r.get("already_downloaded")]
+        shortfalls = space_ledger.shortfalls(
+            (Path(r["target_path"]).parent, int((r.get("size_kb") or 0) * 1024))
+            for r in to_download
+        )
         if not to_download:
             print("All models already downloaded.\n")
+        elif shortfalls:
+            # Reject up front instead of failing partway through
+            for error in shortfalls:
+                print(f"Error: {error}", file=sys.stderr)
+            print("Skipping downloads.\n")
         else:
             total_mb = sum((r.get("size_kb") or 0) / 1024 for r in to_download)
             print(f"Downloading {len(to_download)} file(s) ({total_mb:.1f} MB total)\n")
@@ -243,6 +263,8 @@ def main():
                         url=r["download_url"],
                         destination=Path(r["target_path"]),
                         api_key=api_key,
+                        expected_sha256=(r.get("hashes") or {}).get("SHA256"),
+                        protect=[o["target_path"] for o in resolved if o.get("target_path")],
                     )
                     r["already_downloaded"] = True
                     r["target_path"] = str(actual_path)
@@ -287,6 +309,9 @@ def main():
         print(f"Error generating workflow: {e}", file=sys.stderr)
         sys.exit(1)
 
+    if not debug_mode:
+        manager.record_usage(resources_data["resources"])
+
     workflow_path = output_dir / "workflow.json"
     with open(workflow_path, "w", encoding="utf-8") as f:
         json.dump(workflow, f, indent=2, ensure_ascii=False)
@@ -25,16 +25,29 @@ except ImportError:
 
 sys.path.insert(0, str(Path(__file__).parent.parent))
 
+from civitai_utils.catalog import ModelCatalog
 from civitai_utils.civitai_api import CivitaiAPI
 from civitai_utils.model_manager import ModelManager
+from civitai_utils.safetensors_header import guess_model_type
+from civitai_utils.resolution_cache import (
+    LOCAL_FIELDS, CacheEntry, ResolutionCache,
+)
 
 
 def resolve_resource(resource: dict, api: CivitaiAPI, manager: ModelManager,
-                     debug_data: dict = None) -> dict:
+                     debug_data: dict = None,
+                     catalog: ModelCatalog = None,
+                     cache: ResolutionCache = None) -> dict:
     """
     Resolve a single resource to its download information.
 
+    With a cache, a resource resolved before (same version ID or hash) is
+    answered from memory; its local state is only rechecked when the
+    model library changed since (see ModelManager.library_generation).
+
     Resolution strategies (in order):
+      C. Local catalog lookup by version ID or hash, or by name when the
+         resource has neither (if a catalog is given — no network access)
       0. model_version_id lookup (primary — tRPC resources always have this)
       1. Hash lookup (fallback for meta.resources)
       2. Name search (last resort)
@@ -45,10 +58,75 @@ def resolve_resource(resource: dict, api: CivitaiAPI, manager: ModelManager,
         api: CivitaiAPI instance
         manager: ModelManager instance
         debug_data: Optional dict to record strategy attempts (for debug mode)
+        catalog: Optional offline ModelCatalog consulted before the API
+        cache: Optional ResolutionCache shared across calls
 
     Returns:
         Resolved resource dict with download info
     """
+    if cache is not None:
+        entry = cache.get(resource)
+        if entry is not None:
+            if debug_data is not None:
+                debug_data["strategies_attempted"] = [
+                    {"method": "cache", "status": "success"}
+                ]
+            return _result_from_cache(resource, entry, manager)
+
+    result = _resolve_remote(resource, api, manager, debug_data, catalog)
+    if not result["resolved"]:
+        return result
+
+    remote = dict(result)
+    generation = manager.library_generation(result["type"])
+    _apply_local_state(result, manager)
+
+    if cache is not None:
+        keys = ResolutionCache.keys_for(resource)
+        keys += ResolutionCache.keys_for({"model_version_id": result["model_version_id"]})
+        cache.put(keys, CacheEntry(
+            remote=remote,
+            local={k: result[k] for k in LOCAL_FIELDS},
+            generation=generation,
+        ))
+    return result
+
+
+def _result_from_cache(resource: dict, entry: CacheEntry,
+                       manager: ModelManager) -> dict:
+    """
+    Build a resolve result from a cache entry, rechecking the local state
+    only if the library generation of its model type moved on (or a file
+    it pointed to has disappeared).
+    """
+    result = {**resource, **entry.remote}
+    # Per-image fields come from the request, not from the cached resolution
+    result["weight"] = resource.get("weight")
+    if resource.get("name") not in (None, "", "unknown"):
+        result["name"] = resource["name"]
+
+    generation = manager.library_generation(result["type"])
+    local = entry.local
+    still_present = not local.get("already_downloaded") or \
+        Path(local["target_path"]).exists()
+    if entry.generation == generation and still_present:
+        result.update(local)
+    else:
+        _apply_local_state(result, manager)
+        entry.local = {k: result[k] for k in LOCAL_FIELDS}
+        entry.generation = generation
+    return result
+
+
+def _resolve_remote(resource: dict, api: CivitaiAPI, manager: ModelManager,
+                    debug_data: dict = None,
+                    catalog: ModelCatalog = None) -> dict:
+    """
+    Run the resolution strategies for a resource (see resolve_resource).
+
+    Fills in everything derived from the model version data, but not the
+    local library state — that is left to _apply_local_state().
+    """
     result = {
         **resource,
         "model_id": None,
@@ -69,6 +147,20 @@ def resolve_resource(resource: dict, api: CivitaiAPI, manager: ModelManager,
     model_type = resource.get("type", "checkpoint")
     result["target_dir"] = ModelManager.TYPE_MAPPING.get(model_type, model_type)
 
+    # Strategy C: Offline catalog (version ID, hash, name — all local)
+    if catalog is not None:
+        catalog_hit = _lookup_catalog(resource, catalog, strategies_attempted)
+        if catalog_hit:
+            version_data, method, model = catalog_hit
+            logger.debug("[%s] Resolved via %s", resource.get("name"), method)
+            if debug_data is not None:
+                debug_data["strategies_attempted"] = strategies_attempted
+            return _fill_from_version_data(
+                result, version_data, manager, method,
+                model_id=model.get("id") if model else None,
+                model_type_override=model.get("type") if model else None,
+            )
+
     # Strategy 0: Look up by model version ID (primary path for tRPC resources)
     version_id = resource.get("model_version_id")
     if version_id:
@@ -137,27 +229,24 @@ def resolve_resource(resource: dict, api: CivitaiAPI, manager: ModelManager,
         print(f"  Searching by name: {name}...")
         try:
             models = api.search_models(name, limit=5)
-            for model in models:
-                # Find a matching model by name (case-insensitive partial match)
+            model = _match_model_by_name(name, models)
+            if model:
                 model_name = model.get("name", "")
-                if name.lower() in model_name.lower() or model_name.lower() in name.lower():
-                    versions = model.get("modelVersions", [])
-                    if versions:
-                        strategies_attempted.append({
-                            "method": "name_search",
-                            "query": name,
-                            "matched_model": model_name,
-                            "status": "success",
-                        })
-                        logger.debug("[%s] Resolved via name_search, matched '%s'",
-                                     resource.get("name"), model_name)
-                        if debug_data is not None:
-                            debug_data["strategies_attempted"] = strategies_attempted
-                        return _fill_from_version_data(
-                            result, versions[0], manager, "name_search",
-                            model_id=model.get("id"),
-                            model_type_override=model.get("type"),
-                        )
+                strategies_attempted.append({
+                    "method": "name_search",
+                    "query": name,
+                    "matched_model": model_name,
+                    "status": "success",
+                })
+                logger.debug("[%s] Resolved via name_search, matched '%s'",
+                             resource.get("name"), model_name)
+                if debug_data is not None:
+                    debug_data["strategies_attempted"] = strategies_attempted
+                return _fill_from_version_data(
+                    result, model["modelVersions"][0], manager, "name_search",
+                    model_id=model.get("id"),
+                    model_type_override=model.get("type"),
+                )
             strategies_attempted.append({
                 "method": "name_search",
                 "query": name,
@@ -180,6 +269,67 @@ def resolve_resource(resource: dict, api: CivitaiAPI, manager: ModelManager,
     return result
 
 
+def _lookup_catalog(resource: dict, catalog: ModelCatalog,
+                    strategies_attempted: list):
+    """
+    Try to resolve a resource from the offline catalog.
+
+    Returns:
+        (version_data, method, model) on a hit, where model is the matched
+        model dict for name matches (None otherwise); None on a miss
+    """
+    version_id = resource.get("model_version_id")
+    if version_id:
+        version_data = catalog.get_model_version(version_id)
+        strategies_attempted.append({
+            "method": "catalog_version_id",
+            "version_id": version_id,
+            "status": "success" if version_data else "not_found",
+        })
+        if version_data:
+            return version_data, "catalog_version_id", None
+
+    file_hash = resource.get("hash")
+    if file_hash:
+        version_data = catalog.get_model_version_by_hash(file_hash)
+        strategies_attempted.append({
+            "method": "catalog_hash",
+            "hash": file_hash,
+            "status": "success" if version_data else "not_found",
+        })
+        if version_data:
+            return version_data, "catalog_hash", None
+
+    # A fuzzy name match must not pre-empt an exact network lookup, so only
+    # fall back to names when the resource has no version ID or hash at all
+    name = resource.get("name", "")
+    if name and name != "unknown" and not version_id and not file_hash:
+        model = _match_model_by_name(name, catalog.search_models(name, limit=5))
+        strategies_attempted.append({
+            "method": "catalog_name",
+            "query": name,
+            "status": "success" if model else "no_match",
+        })
+        if model:
+            return model["modelVersions"][0], "catalog_name", model
+
+    return None
+
+
+def _match_model_by_name(name: str, models: list):
+    """
+    Pick the first model whose name matches (case-insensitive partial match
+    in either direction) and that has at least one version.
+    """
+    for model in models:
+        model_name = model.get("name") or ""
+        if not model_name or not model.get("modelVersions"):
+            continue
+        if name.lower() in model_name.lower() or model_name.lower() in name.lower():
+            return model
+    return None
+
+
 def _fill_from_version_data(
     result: dict,
     version_data: dict,
@@ -245,17 +395,6 @@ def _fill_from_version_data(
             result["type"] = type_lower
         result["target_dir"] = ModelManager.TYPE_MAPPING.get(result["type"], model_type)
 
-    # Set target path
-    if result["filename"]:
-        model_dir = manager.get_model_dir(result["type"])
-        result["target_path"] = str(model_dir / result["filename"])
-
-        # Check if already downloaded
-        existing = manager.find_model(result["filename"], result["type"])
-        if existing:
-            result["already_downloaded"] = True
-            result["target_path"] = str(existing)
-
     # Fill in name if still unknown (e.g. civitaiResources with no modelName)
     if result.get("name") in (None, "", "unknown"):
         model_info = version_data.get("model", {})
@@ -270,6 +409,48 @@ def _fill_from_version_data(
     return result
 
 
+def _apply_local_state(result: dict, manager: ModelManager):
+    """
+    Set target_path and already_downloaded for a resolved result by looking
+    for the file in the local model library.
+    """
+    if not result["filename"]:
+        return
+
+    model_dir = manager.get_model_dir(result["type"],
+                                      int((result.get("size_kb") or 0) * 1024),
+                                      result["filename"])
+    result["target_path"] = str(model_dir / result["filename"])
+    result["already_downloaded"] = False
+
+    # Check if already downloaded: by filename first, then by content
+    # hash so renamed or reorganized files are still recognized
+    existing = manager.find_model(result["filename"], result["type"])
+    if existing and not _same_kind(existing, result["type"]):
+        # Same name, but the header says it is another kind of model
+        logger.debug("%s is not a %s; ignoring it", existing, result["type"])
+        existing = None
+    if not existing and result.get("hashes"):
+        existing = manager.find_model_by_hash(
+            result["hashes"], result["type"], size_kb=result["size_kb"]
+        )
+        if existing:
+            result["filename"] = existing.name
+    if existing:
+        result["already_downloaded"] = True
+        result["target_path"] = str(existing)
+
+
+def _same_kind(path: Path, model_type: str) -> bool:
+    """False only if the file's safetensors header says it is another model type."""
+    mapping = ModelManager.TYPE_MAPPING
+    folder = mapping.get(model_type, model_type)
+    if folder not in ("checkpoints", "loras", "vae", "embeddings"):
+        return True  # Types the header guess does not tell apart
+    guessed = guess_model_type(path)
+    return guessed is None or mapping.get(guessed) == folder
+
+
 def main():
     if load_dotenv:
         load_dotenv()
@@ -283,6 +464,9 @@ def main():
                         help="Path to ComfyUI models directory (default: ../ComfyUI/models)")
     parser.add_argument("--api-key", default=None,
                         help="Civitai API key (or set CIVITAI_API_KEY env var)")
+    parser.add_argument("--catalog", default=None,
+                        help="Offline model catalog to resolve against first "
+                             "(or set CIVITAI_CATALOG env var)")
     args = parser.parse_args()
 
     # Load metadata
@@ -305,6 +489,8 @@ def main():
     api_key = args.api_key or os.environ.get("CIVITAI_API_KEY")
     api = CivitaiAPI(api_key=api_key)
     manager = ModelManager(models_dir=args.models_dir)
+    catalog_path = args.catalog or os.environ.get("CIVITAI_CATALOG")
+    catalog = ModelCatalog(catalog_path) if catalog_path else None
 
     # Resolve each resource
     resolved = []
@@ -312,7 +498,7 @@ def main():
 
     for r in resources:
         print(f"[{r['name']}] ({r['type']})")
-        result = resolve_resource(r, api, manager)
+        result = resolve_resource(r, api, manager, catalog=catalog)
         if result["resolved"]:
             resolved.append(result)
             status = "ALREADY DOWNLOADED" if result["already_downloaded"] else "RESOLVED"